@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 
 # ========================
@@ -38,6 +39,9 @@ INSTALLED_APPS = [
 # Middleware
 # ========================
 MIDDLEWARE = [
+    # First, so they also time and count the session and auth work
+    'parking.instrumentation.MetricsMiddleware',
+    'parking.querybudget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -72,9 +76,10 @@ TEMPLATES = [
 ]
 
 # ========================
-# WSGI Application
+# WSGI / ASGI Application
 # ========================
 WSGI_APPLICATION = 'core.wsgi.application'
+ASGI_APPLICATION = 'core.asgi.application'
 
 # ========================
 # Database
@@ -161,4 +166,131 @@ RAZORPAY_KEY_SECRET = "ukRTpeikvVZAU5kSdFtncyTE"
 # For production, use environment variables instead
 # import os
 # RAZORPAY_KEY_ID = os.environ.get('RAZORPAY_KEY_ID')
-# RAZORPAY_KEY_SECRET = os.environ.get('RAZORPAY_KEY_SECRET')
\ No newline at end of file
+# RAZORPAY_KEY_SECRET = os.environ.get('RAZORPAY_KEY_SECRET')
+
+# ========================
+# Availability Index
+# ========================
+# Per-process interval index of live bookings used for slot overlap checks
+PARKING_AVAILABILITY_INDEX = True
+# Days ahead covered by its 15-minute occupancy grid (bulk free-slot queries)
+PARKING_OCCUPANCY_GRID_DAYS = 14
+
+# ========================
+# Tariffs
+# ========================
+# Hourly rate (₹) wherever no Tariff row applies (see parking.tariffs)
+PARKING_DEFAULT_HOURLY_RATE = 20
+
+# ========================
+# Background Jobs
+# ========================
+# Periodic maintenance (reservation expiry, ...) run in a thread of each
+# server process; set to False when running expire_reserved_bookings --loop
+PARKING_BACKGROUND_JOBS = True
+PARKING_EXPIRY_INTERVAL_SECONDS = 60
+# Reporting rollups (parking.rollups); also: manage.py refresh_rollups
+PARKING_ROLLUP_INTERVAL_SECONDS = 3600
+# Processes refresh_rollups uses for booking rollups (None: one per CPU);
+# the background job always runs them in-process
+PARKING_ROLLUP_WORKERS = None
+
+# ========================
+# Admin
+# ========================
+# Above this many rows an unfiltered changelist shows an estimated count
+# instead of running COUNT(*) (see parking.pagination)
+PARKING_ADMIN_EXACT_COUNT_LIMIT = 100000
+
+# ========================
+# Cache
+# ========================
+# Per-process by default; point this at a shared backend (Redis/Memcached)
+# when running several server processes so invalidations reach all of them
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'parking',
+    }
+}
+
+# Seconds a cached Area -> SubArea -> ParkingSlot hierarchy may be served
+PARKING_INVENTORY_CACHE_TIMEOUT = 300
+
+# ========================
+# Availability Events
+# ========================
+# Fan-out of slot state changes to the event stream. LocalBackend reaches
+# the current process only; with several ASGI workers on one host use
+# 'parking.events.FileBackend' (options: path, poll_interval, max_bytes)
+PARKING_EVENTS_BACKEND = 'parking.events.LocalBackend'
+PARKING_EVENTS_OPTIONS = {}
+
+# ========================
+# Slot Allocator
+# ========================
+# Seconds a process trusts its per-sub-area free lists before reloading
+# them, to pick up slots freed by other processes (see parking.allocator)
+PARKING_ALLOCATOR_TTL = 30
+
+# ========================
+# Audit Log
+# ========================
+# Login/register/logout and failed-login records are buffered in memory and
+# written in batches (see parking.audit). Set PARKING_AUDIT_SYNC = True to
+# write each one immediately, e.g. in tests
+PARKING_AUDIT_SYNC = False
+PARKING_AUDIT_BATCH_SIZE = 100
+PARKING_AUDIT_FLUSH_INTERVAL = 2.0  # seconds
+PARKING_AUDIT_MAX_PENDING = 10000
+
+# ========================
+# Login Throttle
+# ========================
+# Token buckets of failed logins per client IP and per username/email;
+# 'capacity' failures allowed, refilling over 'per_seconds' (see parking.throttle)
+PARKING_LOGIN_THROTTLE = {
+    'ip': {'capacity': 20, 'per_seconds': 300},
+    'username': {'capacity': 5, 'per_seconds': 300},
+}
+# Only enable behind a proxy that sets X-Forwarded-For itself
+PARKING_THROTTLE_TRUST_X_FORWARDED_FOR = False
+
+# ========================
+# Metrics
+# ========================
+# Prometheus text format at /metrics, for staff or with the header
+# "Authorization: Bearer <PARKING_METRICS_TOKEN>" (see parking.instrumentation).
+# Under a pre-fork server (gunicorn, uwsgi) point PARKING_METRICS_DIR at a
+# directory shared by the workers, emptied on restart, so /metrics adds up
+# all of them; processes write their totals there every FLUSH_INTERVAL seconds
+PARKING_METRICS_TOKEN = os.environ.get('PARKING_METRICS_TOKEN')
+PARKING_METRICS_DIR = None
+PARKING_METRICS_FLUSH_INTERVAL = 5
+
+# ========================
+# Query Budgets
+# ========================
+# Queries and DB milliseconds a request may use, by view name, then URL
+# namespace, then 'default' (see parking.querybudget). Requests over budget
+# are logged with their repeated SQL; set to None to turn the counting off
+PARKING_QUERY_BUDGETS = {
+    'default': {'queries': 20, 'time_ms': 250},
+    'admin': {'queries': 30, 'time_ms': 500},
+}
+# Raise QueryBudgetExceeded instead of logging (on under manage.py test)
+PARKING_QUERY_BUDGET_RAISE = False
+
+# ========================
+# Tests
+# ========================
+# manage.py test builds its database from the models: the early migrations
+# don't apply to an empty database (parking.tests.MigrationTests runs the
+# later ones). Jobs and buffers that outlive a test's transaction are
+# turned off.
+TESTING = sys.argv[1:2] == ['test']
+if TESTING:
+    MIGRATION_MODULES = {'parking': None}
+    PARKING_BACKGROUND_JOBS = False
+    PARKING_AUDIT_SYNC = True
+    PARKING_QUERY_BUDGET_RAISE = True
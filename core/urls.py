@@ -11,4 +11,5 @@ urlpatterns = [
     path('dashboard/', views.dashboard, name='dashboard'),  # Dashboard view
     path('parking/', include('parking.urls')),  # Include parking app URLs
     path('contact/', views.contact, name='contact'),  # Contact view
+    path('metrics', views.metrics, name='metrics'),  # Prometheus scrape endpoint
 ]
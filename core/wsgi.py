@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_wsgi_application()
+
+# Warm the per-process availability index and start the maintenance
+# jobs (reservation expiry, ...) before serving requests
+from parking.availability import availability_index  # noqa: E402
+from parking.background import start_background_jobs  # noqa: E402
+
+availability_index.warm()
+start_background_jobs()
@@ -1,14 +1,91 @@
 import csv
-from django.http import HttpResponse
+import zlib
+from django.http import StreamingHttpResponse
 from django.contrib import admin
 from .models import (
     Area, SubArea, ParkingSlot,
     LoginRegisterLog, UserAuthenticationRegistration,
-    Contact, Feedback
+    Contact, Feedback, Tariff
 )
 from parking.models import Booking
+from parking.pagination import EstimatedCountPaginator
 from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth import get_user_model
+
+# CSV Export Mixin
+class Echo:
+    """Pseudo-buffer for csv.writer: write() returns the line instead of storing it."""
+    def write(self, value):
+        return value
+
+class ExportCsvMixin:
+    # Columns to export as ORM lookups (FK columns may span joins, e.g.
+    # 'parking_slot__sub_area__name'). None exports every concrete field,
+    # with user foreign keys as the username.
+    export_fields = None
+    export_chunk_size = 2000
+    # Uncompressed bytes collected before each gzip flush
+    export_gzip_block_size = 64 * 1024
+
+    def get_export_columns(self):
+        """(header, lookup) pairs."""
+        if self.export_fields:
+            return [(lookup, lookup) for lookup in self.export_fields]
+        columns = []
+        for field in self.model._meta.concrete_fields:
+            if field.is_relation and field.related_model is get_user_model():
+                columns.append((field.name, f'{field.name}__username'))
+            elif field.is_relation:
+                columns.append((field.name, field.attname))
+            else:
+                columns.append((field.name, field.name))
+        return columns
+
+    def iter_csv_rows(self, queryset):
+        columns = self.get_export_columns()
+        writer = csv.writer(Echo())
+        yield writer.writerow([header for header, _ in columns])
+        rows = queryset.values_list(*[lookup for _, lookup in columns]).iterator(chunk_size=self.export_chunk_size)
+        for row in rows:
+            yield writer.writerow(row)
+
+    def iter_gzip_blocks(self, lines):
+        compressor = zlib.compressobj(wbits=31)  # gzip container
+        block = []
+        size = 0
+        for line in lines:
+            data = line.encode('utf-8')
+            block.append(data)
+            size += len(data)
+            if size >= self.export_gzip_block_size:
+                yield compressor.compress(b''.join(block))
+                block, size = [], 0
+        yield compressor.compress(b''.join(block)) + compressor.flush()
+
+    def export_as_csv(self, request, queryset, compress=False):
+        meta = self.model._meta
+        lines = self.iter_csv_rows(queryset)
+        if compress:
+            response = StreamingHttpResponse(self.iter_gzip_blocks(lines), content_type='application/gzip')
+            response['Content-Disposition'] = f'attachment; filename={meta.model_name}.csv.gz'
+        else:
+            response = StreamingHttpResponse(lines, content_type='text/csv')
+            response['Content-Disposition'] = f'attachment; filename={meta.model_name}.csv'  # Use model_name for cleaner file name
+        return response
+
+    export_as_csv.short_description = "Export Selected as CSV"
+
+    def export_as_csv_gzip(self, request, queryset):
+        return self.export_as_csv(request, queryset, compress=True)
+
+    export_as_csv_gzip.short_description = "Export Selected as gzipped CSV"
+
+# Changelists of tables that grow large: no COUNT(*) of the whole table on
+# every page (estimated instead, see parking.pagination)
+class LargeTableAdminMixin:
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 # Inline configuration for SubArea within Area
 class SubAreaInline(admin.TabularInline):
@@ -28,25 +105,52 @@ class AreaAdmin(admin.ModelAdmin):
     inlines = [SubAreaInline]
 
 # SubArea Admin
-class SubAreaAdmin(admin.ModelAdmin):
+class SubAreaAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('name', 'area', 'description')
+    list_filter = ('area',)
     search_fields = ('name', 'area__name')
+    list_select_related = ('area',)
+    autocomplete_fields = ('area',)
     ordering = ('area', 'name')
     inlines = [ParkingSlotInline]
 
 # ParkingSlot Admin
-class ParkingSlotAdmin(admin.ModelAdmin):
-    list_display = ('slot_number', 'sub_area', 'is_available')
-    list_filter = ('sub_area', 'is_available')
+class ParkingSlotAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('slot_number', 'sub_area', 'slot_type', 'is_available')
+    # By area: a sidebar of every sub-area would not scale
+    list_filter = ('sub_area__area', 'slot_type', 'is_available')
     search_fields = ('slot_number', 'sub_area__name')
+    list_select_related = ('sub_area__area',)
+    autocomplete_fields = ('sub_area',)
     ordering = ('sub_area', 'slot_number')
 
 # Booking Admin
-class BookingAdmin(admin.ModelAdmin):
-    list_display = ('user', 'parking_slot', 'vehicle_number', 'start_time', 'end_time')
-    list_filter = ('parking_slot', 'start_time', 'end_time')
+class BookingAdmin(LargeTableAdminMixin, admin.ModelAdmin, ExportCsvMixin):
+    list_display = ('user', 'parking_slot', 'vehicle_number', 'status', 'start_time', 'end_time')
+    # Filtering by slot is a search; a sidebar of every slot would not scale
+    list_filter = ('status', 'paid', 'vehicle_type', 'parking_slot__sub_area__area')
     search_fields = ('user__username', 'vehicle_number', 'parking_slot__slot_number')
-    ordering = ('start_time', 'end_time')
+    list_select_related = ('user', 'parking_slot__sub_area__area')
+    raw_id_fields = ('user',)
+    autocomplete_fields = ('parking_slot',)
+    # Drill-down and newest-first order both use booking_reserved_at_idx
+    date_hierarchy = 'reservation_time'
+    ordering = ('-reservation_time',)
+    actions = ['export_as_csv', 'export_as_csv_gzip']
+    export_fields = (
+        'id', 'user__username', 'user__email',
+        'parking_slot__slot_number', 'parking_slot__sub_area__name', 'parking_slot__sub_area__area__name',
+        'vehicle_type', 'vehicle_number', 'status',
+        'reservation_time', 'expiry_time', 'start_time', 'end_time', 'amount', 'paid',
+    )
+
+# Tariff Admin
+class TariffAdmin(admin.ModelAdmin):
+    list_display = ('name', 'area', 'slot_type', 'vehicle_type', 'start_hour', 'end_hour', 'hourly_rate', 'is_active')
+    list_filter = ('is_active', 'slot_type', 'vehicle_type')
+    search_fields = ('name', 'area__name')
+    list_select_related = ('area',)
+    ordering = ('area', 'start_hour')
 
 # Customize the User admin
 class CustomUserAdmin(UserAdmin):
@@ -58,31 +162,6 @@ class CustomUserAdmin(UserAdmin):
         ('Important dates', {'fields': ('last_login', 'date_joined')}),
     )
 
-# CSV Export Mixin
-class ExportCsvMixin:
-    def export_as_csv(self, request, queryset):
-        meta = self.model._meta
-        field_names = [field.name for field in meta.fields]
-
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename={meta.model_name}.csv'  # Use model_name for cleaner file name
-        writer = csv.writer(response)
-
-        writer.writerow(field_names)
-        for obj in queryset:
-            row = []
-            for field in field_names:
-                value = getattr(obj, field)
-                # Handle foreign keys
-                if hasattr(value, 'username'):  # For User foreign key
-                    value = value.username
-                row.append(value)
-            writer.writerow(row)
-
-        return response
-
-    export_as_csv.short_description = "Export Selected as CSV"
-
 # Replace default User with customized
 try:
     admin.site.unregister(User)
@@ -95,11 +174,15 @@ admin.site.register(Area, AreaAdmin)
 admin.site.register(SubArea, SubAreaAdmin)
 admin.site.register(ParkingSlot, ParkingSlotAdmin)
 admin.site.register(Booking, BookingAdmin)
+admin.site.register(Tariff, TariffAdmin)
 
 # Login/Register Log Admin
 @admin.register(LoginRegisterLog)
-class LoginRegisterLogAdmin(admin.ModelAdmin):
+class LoginRegisterLogAdmin(LargeTableAdminMixin, admin.ModelAdmin, ExportCsvMixin):
     list_display = ('user', 'get_email', 'action', 'timestamp')
+    list_select_related = ('user',)
+    actions = ['export_as_csv', 'export_as_csv_gzip']
+    export_fields = ('id', 'user__username', 'user__email', 'action', 'timestamp')
 
     def get_email(self, obj):
         return obj.user.email if obj.user and obj.user.email else "-"
@@ -110,15 +193,18 @@ class LoginRegisterLogAdmin(admin.ModelAdmin):
 
 # User Auth Registration Admin
 @admin.register(UserAuthenticationRegistration)
-class UserAuthenticationRegistrationAdmin(admin.ModelAdmin):
+class UserAuthenticationRegistrationAdmin(LargeTableAdminMixin, admin.ModelAdmin, ExportCsvMixin):
     list_display = ('user', 'email', 'action', 'timestamp')
+    list_select_related = ('user',)
+    actions = ['export_as_csv', 'export_as_csv_gzip']
 
 # Contact Admin
 @admin.register(Contact)
-class ContactAdmin(admin.ModelAdmin):
+class ContactAdmin(admin.ModelAdmin, ExportCsvMixin):
     list_display = ('name', 'email', 'message', 'timestamp')
     search_fields = ('name', 'email')
     ordering = ('-timestamp',)
+    actions = ['export_as_csv', 'export_as_csv_gzip']
 
 # Feedback Admin with export functionality
 @admin.register(Feedback)
@@ -126,6 +212,7 @@ class FeedbackAdmin(admin.ModelAdmin, ExportCsvMixin):
     list_display = ('get_user', 'rating', 'goal_achievement', 'reason', 'submitted_on')
     search_fields = ('user__username', 'comments', 'suggestions')
     list_filter = ('rating', 'goal_achievement', 'reason', 'issue', 'is_public', 'submitted_on')
+    list_select_related = ('user',)
     ordering = ('-submitted_on',)
     
     fieldsets = (
@@ -144,7 +231,7 @@ class FeedbackAdmin(admin.ModelAdmin, ExportCsvMixin):
     )
     
     readonly_fields = ('submitted_on',)
-    actions = ['export_as_csv']
+    actions = ['export_as_csv', 'export_as_csv_gzip']
     
     def get_user(self, obj):
         return obj.user.username if obj.user else "Anonymous"
@@ -0,0 +1,187 @@
+"""
+"Any free slot" allocation within a sub-area.
+
+Each process keeps a pool per sub-area: free lists of the slots with no
+live booking (``is_available``), one per slot type, and the held slots. A
+pool is loaded with one query on first use and reloaded when the inventory
+changes or PARKING_ALLOCATOR_TTL seconds have passed, which picks up
+changes made by other processes. Committed changes in this process mark
+the slots stale (see availability.touch_slots); they are re-read in one
+query before the next allocation from that sub-area.
+
+Taking a slot pops it off a free list under a lock and keeps it pending
+until its claim is settled, so concurrent requests in one process never get
+the same slot. reserve_slot() stays authoritative: if another process got
+there first the claim fails, the slot is marked held and the next candidate
+is tried. Once the free lists run dry, held slots the availability index
+reports free for the window are tried, then slots found by a database query.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from .services import SlotUnavailableError, reserve_slot
+
+logger = logging.getLogger(__name__)
+
+# Claims tried before giving up on a sub-area
+ALLOCATION_ATTEMPTS = 10
+
+
+class SubAreaPool:
+    def __init__(self, version, rows, pending=()):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.types = {}  # slot_id -> slot_type
+        self.free = defaultdict(dict)  # slot_type -> {slot_id: None}, oldest first
+        self.held = set()
+        self.pending = set()
+        for slot_id, slot_type, is_available in rows:
+            self.types[slot_id] = slot_type
+            self.set_state(slot_id, is_available)
+        # Claims still in flight from before a reload stay out of both lists
+        for slot_id in pending:
+            if slot_id in self.types:
+                self.pending.add(slot_id)
+                self.set_state(slot_id, False)
+
+    def set_state(self, slot_id, is_free):
+        self.free[self.types[slot_id]].pop(slot_id, None)
+        self.held.discard(slot_id)
+        if slot_id in self.pending:
+            return
+        if is_free:
+            self.free[self.types[slot_id]][slot_id] = None
+        else:
+            self.held.add(slot_id)
+
+    def take(self, slot_type='', exclude=()):
+        """Pop a free slot of ``slot_type`` (any type if blank) and mark it pending."""
+        for free in ([self.free.get(slot_type, {})] if slot_type else self.free.values()):
+            for slot_id in free:
+                if slot_id not in exclude:
+                    del free[slot_id]
+                    self.pending.add(slot_id)
+                    return slot_id
+        return None
+
+    def settle(self, slot_id, held):
+        self.pending.discard(slot_id)
+        if slot_id in self.types:
+            self.set_state(slot_id, not held)
+
+
+class SlotAllocator:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools = {}
+        self._stale = set()
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'PARKING_ALLOCATOR_TTL', 30)
+
+    def mark_stale(self, slot_ids):
+        with self._lock:
+            self._stale.update(slot_ids)
+
+    def reset(self):
+        with self._lock:
+            self._pools = {}
+            self._stale = set()
+
+    def _pool(self, sub_area_id):
+        """The up-to-date pool for a sub-area; call with the lock held."""
+        from .inventory import get_version
+        from .models import ParkingSlot
+
+        version = get_version()
+        pool = self._pools.get(sub_area_id)
+        if pool is None or pool.version != version or time.monotonic() - pool.loaded_at > self.ttl:
+            rows = ParkingSlot.objects.filter(sub_area_id=sub_area_id).values_list('id', 'slot_type', 'is_available')
+            pool = self._pools[sub_area_id] = SubAreaPool(version, rows, pool.pending if pool else ())
+            self._stale -= pool.types.keys()
+            return pool
+        stale = [slot_id for slot_id in self._stale if slot_id in pool.types]
+        if stale:
+            self._stale.difference_update(stale)
+            for slot_id, is_available in ParkingSlot.objects.filter(id__in=stale).values_list('id', 'is_available'):
+                pool.set_state(slot_id, is_available)
+        return pool
+
+    def take(self, sub_area_id, slot_type='', exclude=()):
+        with self._lock:
+            return self._pool(sub_area_id).take(slot_type, exclude)
+
+    def settle(self, sub_area_id, slot_id, held=True):
+        """Finish a pending slot: held after a claim (won or lost), free again otherwise."""
+        with self._lock:
+            pool = self._pools.get(sub_area_id)
+            if pool is not None:
+                pool.settle(slot_id, held)
+
+    def held_candidates(self, sub_area_id, slot_type, start_time, end_time):
+        """Held slots the availability index reports free for the window."""
+        from .availability import availability_index
+
+        with self._lock:
+            pool = self._pool(sub_area_id)
+            held = [slot_id for slot_id in pool.held if not slot_type or pool.types[slot_id] == slot_type]
+        return [slot_id for slot_id in held if availability_index.is_free(slot_id, start_time, end_time)]
+
+    def allocate(self, user, sub_area_id, vehicle_type, vehicle_number, start_time, end_time, slot_type=''):
+        """Reserve any free slot in the sub-area for the window.
+
+        Raises SlotUnavailableError when no slot could be claimed.
+        """
+        from .models import ParkingSlot
+
+        tried = set()
+
+        def claim(slot_id):
+            tried.add(slot_id)
+            try:
+                return reserve_slot(user, slot_id, vehicle_type, vehicle_number, start_time, end_time)
+            except SlotUnavailableError:
+                logger.debug(f"Allocator lost slot {slot_id} to another booking.")
+                return None
+
+        # Free lists first: these slots have no live booking at all
+        while len(tried) < ALLOCATION_ATTEMPTS:
+            slot_id = self.take(sub_area_id, slot_type, exclude=tried)
+            if slot_id is None:
+                break
+            claimed = False
+            try:
+                booking = claim(slot_id)
+                claimed = True
+            finally:
+                # Won or lost, a settled claim leaves the slot held; an
+                # unexpected error puts it back on the free list
+                self.settle(sub_area_id, slot_id, held=claimed)
+            if booking is not None:
+                return booking
+
+        # Then held slots that are free for this window, then the database
+        candidates = [
+            slot_id for slot_id in self.held_candidates(sub_area_id, slot_type, start_time, end_time)
+            if slot_id not in tried
+        ]
+        if len(tried) + len(candidates) < ALLOCATION_ATTEMPTS:
+            slots = ParkingSlot.objects.free_between(start_time, end_time, sub_area=sub_area_id)
+            if slot_type:
+                slots = slots.filter(slot_type=slot_type)
+            candidates += slots.exclude(id__in=tried | set(candidates)).order_by('id').values_list(
+                'id', flat=True
+            )[:ALLOCATION_ATTEMPTS - len(tried) - len(candidates)]
+        for slot_id in candidates[:max(ALLOCATION_ATTEMPTS - len(tried), 0)]:
+            booking = claim(slot_id)
+            if booking is not None:
+                return booking
+        raise SlotUnavailableError("No parking slot is free in this sub-area for the selected time.")
+
+
+slot_allocator = SlotAllocator()
@@ -0,0 +1,151 @@
+"""
+Buffered writer for the authentication audit logs (LoginRegisterLog and
+UserAuthenticationRegistration).
+
+Events are queued in memory and written with one bulk_create per model in
+a single transaction, when PARKING_AUDIT_BATCH_SIZE events are pending or
+PARKING_AUDIT_FLUSH_INTERVAL seconds have passed, and at interpreter exit.
+That keeps bursts of failed logins from taking SQLite's write lock once per
+attempt. The buffer is bounded (PARKING_AUDIT_MAX_PENDING); beyond that new
+events are dropped and counted rather than growing memory without limit.
+
+With PARKING_AUDIT_SYNC = True every event is written immediately in the
+calling thread, which is what tests want.
+"""
+import atexit
+import logging
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class AuditBuffer:
+    def __init__(self):
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.dropped = 0
+        atexit.register(self.flush)
+
+    @property
+    def sync(self):
+        return _setting('PARKING_AUDIT_SYNC', False)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, kind, **fields):
+        """Queue an event; ``kind`` is 'auth' (LoginRegisterLog) or 'login_failed'."""
+        fields.setdefault('timestamp', timezone.now())
+        if self.sync:
+            self._write([(kind, fields)])
+            return
+        with self._lock:
+            if len(self._pending) >= _setting('PARKING_AUDIT_MAX_PENDING', 10000):
+                self.dropped += 1
+                return
+            self._pending.append((kind, fields))
+            full = len(self._pending) >= _setting('PARKING_AUDIT_BATCH_SIZE', 100)
+        self._ensure_thread()
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write everything pending; returns the number of events written."""
+        with self._flush_lock:
+            with self._lock:
+                events = list(self._pending)
+                self._pending.clear()
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                logger.warning(f"Audit buffer was full; dropped {dropped} events.")
+            if not events:
+                return 0
+            try:
+                self._write(events)
+            except DatabaseError:
+                logger.exception(f"Could not write {len(events)} audit events.")
+                return 0
+            return len(events)
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='parking-audit-flush', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(_setting('PARKING_AUDIT_FLUSH_INTERVAL', 2.0))
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def _write(self, events):
+        from .models import LoginRegisterLog, UserAuthenticationRegistration
+
+        auth_logs = [LoginRegisterLog(**fields) for kind, fields in events if kind == 'auth']
+        failures = [fields for kind, fields in events if kind == 'login_failed']
+        with transaction.atomic():
+            if auth_logs:
+                LoginRegisterLog.objects.bulk_create(auth_logs)
+            if failures:
+                users = _resolve_login_inputs({fields['login_input'] for fields in failures})
+                rows = []
+                for fields in failures:
+                    # Unknown inputs are kept as typed, like the email column always did
+                    user_id, email = users.get(fields['login_input'], (None, fields['login_input']))
+                    rows.append(UserAuthenticationRegistration(
+                        user_id=user_id,
+                        email=email[:254],
+                        action='login_failed',
+                        timestamp=fields['timestamp'],
+                    ))
+                UserAuthenticationRegistration.objects.bulk_create(rows)
+
+
+def _resolve_login_inputs(login_inputs):
+    """``{login_input: (user_id, email)}`` for inputs naming a user by username or email, in one query."""
+    from django.contrib.auth import get_user_model
+
+    login_inputs = {value for value in login_inputs if value}
+    if not login_inputs:
+        return {}
+    resolved = {}
+    users = get_user_model().objects.filter(Q(username__in=login_inputs) | Q(email__in=login_inputs))
+    for user_id, username, email in users.values_list('id', 'username', 'email'):
+        # A username match wins over an email match, as before
+        if username in login_inputs:
+            resolved[username] = (user_id, email)
+        if email in login_inputs:
+            resolved.setdefault(email, (user_id, email))
+    return resolved
+
+
+audit_buffer = AuditBuffer()
+
+
+def log_auth_event(user, action):
+    """Record a login/register/logout in LoginRegisterLog."""
+    audit_buffer.add('auth', user_id=getattr(user, 'pk', None), action=action)
+
+
+def log_failed_login(login_input):
+    """Record a failed login for a username or email; the user is looked up at flush time."""
+    audit_buffer.add('login_failed', login_input=login_input or '')
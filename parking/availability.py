@@ -0,0 +1,363 @@
+"""
+Per-process interval index of live bookings, used to answer slot overlap
+checks without a database round trip.
+
+The index is warmed once (at server start or on first use) with every
+reserved/active booking that has not ended yet, and is then kept current by
+the Booking save/delete signals in ``parking.signals``. Windows that start
+before the warm-up time are not covered and fall back to the database.
+
+On top of the intervals, an occupancy grid keeps one bit per 15-minute
+bucket per slot over a rolling span (PARKING_OCCUPANCY_GRID_DAYS), so "which
+of these slots are free from A to B" is one AND per slot; only slots whose
+bits clash are checked exactly against their intervals.
+
+Also keeps a per-area availability version in the cache (a timestamp of the
+last committed change), used for ETag/Last-Modified on availability polls.
+Free-slot lookups compare it with the versions this process has seen and
+reload the areas another process has changed.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class SlotIntervals:
+    """Bookings of one slot, sorted by start time.
+
+    ``max_ends[i]`` is the latest end time among the first ``i + 1``
+    intervals, so an overlap check is a single bisect.
+    """
+    __slots__ = ('starts', 'ends', 'ids', 'max_ends')
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.ids = []
+        self.max_ends = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, booking_id, start_time, end_time):
+        pos = bisect_left(self.starts, start_time)
+        self.starts.insert(pos, start_time)
+        self.ends.insert(pos, end_time)
+        self.ids.insert(pos, booking_id)
+        self.max_ends.insert(pos, end_time)
+        self._refresh_max_ends(pos)
+
+    def remove(self, booking_id):
+        try:
+            pos = self.ids.index(booking_id)
+        except ValueError:
+            return False
+        del self.starts[pos], self.ends[pos], self.ids[pos], self.max_ends[pos]
+        self._refresh_max_ends(pos)
+        return True
+
+    def overlaps(self, start_time, end_time):
+        # Only intervals starting before end_time can overlap the window;
+        # of those, one overlaps iff the latest end is after start_time.
+        pos = bisect_left(self.starts, end_time)
+        return pos > 0 and self.max_ends[pos - 1] > start_time
+
+    def _refresh_max_ends(self, pos):
+        running = self.max_ends[pos - 1] if pos > 0 else None
+        for i in range(pos, len(self.ends)):
+            end = self.ends[i]
+            running = end if running is None or end > running else running
+            self.max_ends[i] = running
+
+
+class OccupancyGrid:
+    """Bitsets of occupied buckets per slot, from ``origin`` for ``days`` days.
+
+    Bit ``i`` of a slot's int is set when a booking covers any part of
+    bucket ``i``, so clear bits prove a window free while set bits only
+    mean "maybe busy". Slot bits are recomputed from the slot's intervals
+    on every change, which keeps them exact when bookings go away.
+    """
+    BUCKET = timedelta(minutes=15)
+
+    def __init__(self, origin, days):
+        self.origin = origin - (origin - origin.replace(hour=0, minute=0, second=0, microsecond=0)) % self.BUCKET
+        self.size = int(timedelta(days=days) / self.BUCKET)
+        self.end = self.origin + self.size * self.BUCKET
+        self.bits = {}
+
+    def covers(self, start_time, end_time):
+        return self.origin <= start_time and end_time <= self.end
+
+    def _bucket_range(self, start_time, end_time):
+        first = max(int((start_time - self.origin) // self.BUCKET), 0)
+        last = min(-int((self.origin - end_time) // self.BUCKET), self.size)  # ceiling
+        return first, last
+
+    def mask(self, start_time, end_time):
+        first, last = self._bucket_range(start_time, end_time)
+        return ((1 << (last - first)) - 1) << first if first < last else 0
+
+    def refresh(self, slot_id, intervals):
+        bits = 0
+        if intervals is not None:
+            for start_time, end_time in zip(intervals.starts, intervals.ends):
+                if start_time < self.end and end_time > self.origin:
+                    bits |= self.mask(start_time, end_time)
+        if bits:
+            self.bits[slot_id] = bits
+        else:
+            self.bits.pop(slot_id, None)
+
+
+class AvailabilityIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._slots = {}
+        self._booking_slots = {}
+        self._horizon = None
+        self._grid = None
+        # Area availability versions this process's index is known to reflect
+        self._seen_versions = {}
+
+    @property
+    def grid_days(self):
+        return getattr(settings, 'PARKING_OCCUPANCY_GRID_DAYS', 14)
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'PARKING_AVAILABILITY_INDEX', True)
+
+    @property
+    def is_warm(self):
+        return self._horizon is not None
+
+    def warm(self):
+        """(Re)load every live booking that ends in the future."""
+        from .models import Booking
+
+        from .inventory import get_inventory
+
+        now = timezone.now()
+        try:
+            # Versions first: a change made while loading shows up as stale
+            versions = area_versions([area['id'] for area in get_inventory(copy=False)])
+            rows = list(
+                Booking.objects.filter(
+                    status__in=Booking.LIVE_STATUSES,
+                    start_time__isnull=False,
+                    end_time__gt=now,
+                ).values_list('id', 'parking_slot_id', 'start_time', 'end_time')
+            )
+        except DatabaseError as e:
+            logger.warning(f"Availability index not warmed: {e}")
+            return False
+
+        with self._lock:
+            self._slots = {}
+            self._booking_slots = {}
+            self._grid = OccupancyGrid(now, self.grid_days)
+            for booking_id, slot_id, start_time, end_time in rows:
+                self._add(booking_id, slot_id, start_time, end_time)
+            self._horizon = now
+            self._seen_versions = versions
+        logger.debug(f"Availability index warmed with {len(rows)} bookings.")
+        return True
+
+    def reset(self):
+        with self._lock:
+            self._slots = {}
+            self._booking_slots = {}
+            self._horizon = None
+            self._grid = None
+            self._seen_versions = {}
+
+    def is_free(self, slot_id, start_time, end_time):
+        """True/False if the index can answer for this window, else None."""
+        if not self.enabled or start_time is None or end_time is None:
+            return None
+        if not self.is_warm and not self.warm():
+            return None
+        from .inventory import area_ids_for_slots
+
+        # Bookings other processes cancelled, expired or made since we looked
+        self._reload_changed_areas(area_ids_for_slots([slot_id]))
+        with self._lock:
+            if not self.is_warm or start_time < self._horizon:
+                return None
+            intervals = self._slots.get(slot_id)
+            return intervals is None or not intervals.overlaps(start_time, end_time)
+
+    def free_slots(self, subareas, start_time, end_time):
+        """IDs of the free slots of inventory ``subareas`` for the window, or None.
+
+        None means the index cannot answer (disabled, cold, or a window
+        starting before the warm-up) and the caller should ask the database.
+        """
+        if not self.enabled or start_time is None or end_time is None:
+            return None
+        if not self.is_warm and not self.warm():
+            return None
+        self._reload_changed_areas({subarea['area_id'] for subarea in subareas})
+        free = set()
+        with self._lock:
+            # Checked again: a reset() may have made the index cold meanwhile
+            if not self.is_warm or start_time < self._horizon:
+                return None
+            self._roll_grid()
+            grid = self._grid
+            mask = grid.mask(start_time, end_time) if grid.covers(start_time, end_time) else None
+            for subarea in subareas:
+                for slot in subarea['slots']:
+                    slot_id = slot['id']
+                    if mask is not None and not grid.bits.get(slot_id, 0) & mask:
+                        free.add(slot_id)
+                        continue
+                    # Bits clash (or the window is outside the grid): check exactly
+                    intervals = self._slots.get(slot_id)
+                    if intervals is None or not intervals.overlaps(start_time, end_time):
+                        free.add(slot_id)
+        return free
+
+    def note_versions(self, previous, version):
+        """Move areas from their ``previous`` versions to ``version`` where we had seen the previous one."""
+        with self._lock:
+            for area_id, old_version in previous.items():
+                if self._seen_versions.get(area_id) == old_version:
+                    self._seen_versions[area_id] = version
+
+    def _reload_changed_areas(self, area_ids):
+        """Reload the bookings of areas another process has changed since we last looked."""
+        from .inventory import get_inventory
+        from .models import Booking
+
+        versions = area_versions(area_ids)
+        with self._lock:
+            if not self.is_warm:
+                return
+            horizon = self._horizon
+            changed = {area_id for area_id, version in versions.items() if self._seen_versions.get(area_id) != version}
+        if not changed:
+            return
+        slot_ids = [
+            slot['id'] for area in get_inventory(copy=False) if area['id'] in changed
+            for subarea in area['subareas'] for slot in subarea['slots']
+        ]
+        try:
+            rows = list(
+                Booking.objects.filter(
+                    parking_slot_id__in=slot_ids,
+                    status__in=Booking.LIVE_STATUSES,
+                    start_time__isnull=False,
+                    end_time__gt=horizon,
+                ).values_list('id', 'parking_slot_id', 'start_time', 'end_time')
+            )
+        except DatabaseError as e:
+            logger.warning(f"Availability index not refreshed: {e}")
+            return
+        with self._lock:
+            if self._horizon != horizon:
+                return  # reset (or re-warmed) meanwhile; the rows may not match it
+            for slot_id in slot_ids:
+                intervals = self._slots.pop(slot_id, None)
+                for booking_id in intervals.ids if intervals is not None else ():
+                    self._booking_slots.pop(booking_id, None)
+                self._grid.refresh(slot_id, None)
+            for booking_id, slot_id, start_time, end_time in rows:
+                self._discard(booking_id)
+                self._add(booking_id, slot_id, start_time, end_time)
+            self._seen_versions.update({area_id: versions[area_id] for area_id in changed})
+
+    def _roll_grid(self):
+        """Move the grid forward a day at a time as time passes; call with the lock held."""
+        now = timezone.now()
+        if now - self._grid.origin < timedelta(days=1):
+            return
+        self._grid = OccupancyGrid(now, self.grid_days)
+        for slot_id, intervals in self._slots.items():
+            self._grid.refresh(slot_id, intervals)
+
+    def sync(self, booking_id, slot_id, status, start_time, end_time):
+        """Apply a committed Booking change to the index."""
+        from .models import Booking
+
+        with self._lock:
+            if not self.is_warm:
+                return
+            self._discard(booking_id)
+            if status in Booking.LIVE_STATUSES and start_time and end_time:
+                self._add(booking_id, slot_id, start_time, end_time)
+
+    def discard(self, *booking_ids):
+        with self._lock:
+            if not self.is_warm:
+                return
+            for booking_id in booking_ids:
+                self._discard(booking_id)
+
+    def _add(self, booking_id, slot_id, start_time, end_time):
+        intervals = self._slots.get(slot_id)
+        if intervals is None:
+            intervals = self._slots[slot_id] = SlotIntervals()
+        intervals.add(booking_id, start_time, end_time)
+        self._booking_slots[booking_id] = slot_id
+        self._grid.refresh(slot_id, intervals)
+
+    def _discard(self, booking_id):
+        slot_id = self._booking_slots.pop(booking_id, None)
+        if slot_id is None:
+            return
+        intervals = self._slots[slot_id]
+        intervals.remove(booking_id)
+        if not intervals:
+            del self._slots[slot_id]
+        self._grid.refresh(slot_id, intervals or None)
+
+
+availability_index = AvailabilityIndex()
+
+
+# -------------------------------
+# Per-area availability versions
+# -------------------------------
+AREA_VERSION_KEY = 'parking:availability:area:{area_id}'
+
+
+def area_versions(area_ids):
+    """``{area_id: version}``; a version is the time of the last change."""
+    keys = {AREA_VERSION_KEY.format(area_id=area_id): area_id for area_id in area_ids}
+    found = cache.get_many(keys)
+    # Unknown (new or evicted) areas start now, so clients refetch once
+    missing = {key: time.time() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return {keys[key]: version for key, version in found.items()}
+
+
+def touch_areas(area_ids):
+    keys = {AREA_VERSION_KEY.format(area_id=area_id): area_id for area_id in area_ids}
+    previous = {keys[key]: version for key, version in cache.get_many(keys).items()}
+    now = time.time()
+    cache.set_many({key: now for key in keys}, None)
+    # Callers sync this process's index before touching, so it reflects the
+    # new version unless another process changed the area in between
+    availability_index.note_versions(previous, now)
+
+
+def touch_slots(*slot_ids):
+    """Record that availability changed for these slots' areas."""
+    from .allocator import slot_allocator
+    from .inventory import area_ids_for_slots
+
+    touch_areas(area_ids_for_slots(slot_ids))
+    slot_allocator.mark_stale(slot_ids)
@@ -0,0 +1,96 @@
+"""
+In-process runner for periodic maintenance jobs (reservation expiry and
+the like), so request handlers never have to do that work themselves.
+
+Started by the WSGI/ASGI entry points when PARKING_BACKGROUND_JOBS is on.
+Every job must be idempotent: with several worker processes each one runs
+its own copy of the runner.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundJobs:
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def register(self, name, interval, func):
+        """Run ``func()`` every ``interval`` seconds; re-registering replaces it."""
+        with self._lock:
+            self._jobs[name] = {'interval': interval, 'func': func, 'next_run': 0.0}
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='parking-background-jobs', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_pending(self):
+        """Run every job that is due; returns seconds until the next one."""
+        now = time.monotonic()
+        with self._lock:
+            due = [(name, job) for name, job in self._jobs.items() if job['next_run'] <= now]
+        for name, job in due:
+            try:
+                job['func']()
+            except Exception:
+                logger.exception(f"Background job {name} failed.")
+            finally:
+                close_old_connections()
+            job['next_run'] = time.monotonic() + job['interval']
+        with self._lock:
+            next_run = min((job['next_run'] for job in self._jobs.values()), default=now + 60)
+        return max(next_run - time.monotonic(), 0)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._stop.wait(self.run_pending())
+
+
+background_jobs = BackgroundJobs()
+
+
+def start_background_jobs():
+    """Register the maintenance jobs and start the runner (idempotent)."""
+    if not getattr(settings, 'PARKING_BACKGROUND_JOBS', False):
+        return
+    from .rollups import refresh_booking_rollups, refresh_feedback_rollups
+    from .services import expire_stale_reservations
+
+    background_jobs.register(
+        'expire_reservations',
+        getattr(settings, 'PARKING_EXPIRY_INTERVAL_SECONDS', 60),
+        expire_stale_reservations,
+    )
+    background_jobs.register(
+        'feedback_rollups',
+        getattr(settings, 'PARKING_ROLLUP_INTERVAL_SECONDS', 3600),
+        refresh_feedback_rollups,
+    )
+    background_jobs.register(
+        'booking_rollups',
+        getattr(settings, 'PARKING_ROLLUP_INTERVAL_SECONDS', 3600),
+        lambda: refresh_booking_rollups(workers=1),
+    )
+    background_jobs.start()
@@ -0,0 +1,8 @@
+"""
+Reproducible benchmarks (``manage.py bench``).
+
+``data.generate_city`` bulk-inserts a deterministic synthetic city of a
+given size; ``scenarios`` time the hot views and booking services against
+it, and ``runner`` collects p50/p95 latency, queries and memory into
+JSON results that can be compared against a saved baseline.
+"""
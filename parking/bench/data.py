@@ -0,0 +1,185 @@
+"""
+Deterministic synthetic cities for the benchmarks.
+
+The same size and seed always produce the same rows: names, slot types,
+users and booking histories come from ``random.Random(seed)``, and times
+are offsets from the start of the current hour. Everything is written
+with bulk_create; the derived state (occupancy, search index, caches) is
+then rebuilt as after a bulk import (see parking.importer).
+
+``scratch_database()`` gives the benchmark a database of its own to
+generate the city in.
+"""
+import os
+import random
+import tempfile
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import F
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from parking.models import Area, Booking, ParkingSlot, SubArea
+
+# Areas x sub-areas per area x slots per sub-area, users, historical bookings
+SIZES = {
+    'small': {'areas': 3, 'subareas': 4, 'slots': 20, 'users': 100, 'bookings': 5000},
+    'medium': {'areas': 10, 'subareas': 8, 'slots': 50, 'users': 2000, 'bookings': 100000},
+    'large': {'areas': 25, 'subareas': 10, 'slots': 100, 'users': 20000, 'bookings': 1000000},
+}
+
+DISTRICTS = (
+    'Koramangala', 'Indiranagar', 'Whitefield', 'Jayanagar', 'Malleswaram', 'Hebbal',
+    'Marathahalli', 'Banashankari', 'Yelahanka', 'Basavanagudi', 'Electronic City', 'Rajajinagar',
+)
+LEVELS = ('Basement', 'Ground', 'Level', 'Rooftop', 'Annex')
+
+# Share of the history still live: reserved or active now
+LIVE_RATIO = 0.01
+# Days of history the bookings are spread over
+HISTORY_DAYS = 90
+
+INSERT_BATCH_SIZE = 5000
+USERNAME_PREFIX = 'bench-user-'
+
+
+@contextmanager
+def scratch_database(using=DEFAULT_DB_ALIAS):
+    """Point ``using`` at a new database built from the models, dropped on exit.
+
+    Made with the test-database machinery: a temporary file on SQLite,
+    ``bench_<NAME>`` elsewhere. Everything commits for real without
+    touching, or holding locks on, the configured database.
+    """
+    from parking import search
+
+    connection = connections[using]
+    test_settings = connection.settings_dict['TEST']
+    old_name, old_test_name = connection.settings_dict['NAME'], test_settings.get('NAME')
+    with tempfile.TemporaryDirectory() as directory:
+        if connection.vendor == 'sqlite':
+            test_settings['NAME'] = os.path.join(directory, 'bench.sqlite3')
+        else:
+            test_settings['NAME'] = f'bench_{old_name}'
+        try:
+            # The early parking migrations do not apply to an empty database
+            with override_settings(MIGRATION_MODULES={'parking': None}):
+                connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                if search.fts_supported(connection):
+                    with connection.schema_editor() as schema_editor:
+                        search.create_fts_table(schema_editor)
+                yield
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                search.reset_fts_state()
+        finally:
+            test_settings['NAME'] = old_test_name
+
+
+def area_name(index):
+    return f'{DISTRICTS[index % len(DISTRICTS)]} {index // len(DISTRICTS) + 1}'
+
+
+def generate_city(size, seed=42):
+    """Insert a city of ``size`` (a dict like SIZES['small']); returns a summary dict.
+
+    Summary: ``anchor`` (the time offsets are from), ``area_ids``,
+    ``slot_ids``, ``user_ids`` and ``search_terms``.
+    """
+    from parking.importer import KINDS, finish_import
+
+    rng = random.Random(seed)
+    anchor = timezone.now().replace(minute=0, second=0, microsecond=0)
+
+    areas = Area.objects.bulk_create(
+        Area(name=area_name(i), description=f'Synthetic area {i + 1}') for i in range(size['areas'])
+    )
+    sub_areas = SubArea.objects.bulk_create(
+        SubArea(area=area, name=f'{LEVELS[j % len(LEVELS)]} {j + 1}')
+        for area in areas for j in range(size['subareas'])
+    )
+    slots = ParkingSlot.objects.bulk_create(
+        (
+            ParkingSlot(
+                sub_area=sub_area, slot_number=f'{k + 1:03d}',
+                slot_type='covered' if rng.random() < 0.4 else 'open',
+            )
+            for sub_area in sub_areas for k in range(size['slots'])
+        ),
+        batch_size=INSERT_BATCH_SIZE,
+    )
+    User = get_user_model()
+    users = User.objects.bulk_create(
+        (
+            User(username=f'{USERNAME_PREFIX}{n:06d}', email=f'user{n}@bench.example.com', password='!')
+            for n in range(size['users'])
+        ),
+        batch_size=INSERT_BATCH_SIZE,
+    )
+    slot_ids = [slot.pk for slot in slots]
+    user_ids = [user.pk for user in users]
+
+    first_booking = None
+    for batch in _booking_batches(rng, anchor, size['bookings'], slot_ids, user_ids):
+        created = Booking.objects.bulk_create(batch)
+        if first_booking is None and created:
+            first_booking = created[0].pk
+    if first_booking is not None:
+        # reservation_time is auto_now_add; bookings are made a day ahead
+        Booking.objects.filter(pk__gte=first_booking, parking_slot_id__in=slot_ids).update(
+            reservation_time=F('start_time') - timedelta(days=1)
+        )
+
+    finish_import(KINDS)
+    return {
+        'anchor': anchor,
+        'area_ids': [area.pk for area in areas],
+        'slot_ids': slot_ids,
+        'user_ids': user_ids,
+        'search_terms': sorted({DISTRICTS[i % len(DISTRICTS)] for i in range(size['areas'])}),
+    }
+
+
+def _booking_batches(rng, anchor, count, slot_ids, user_ids):
+    """Bookings in batches: a history of past sessions plus a few live ones.
+
+    Live bookings get distinct slots and start within the hour, so they
+    never overlap each other.
+    """
+    live = min(int(count * LIVE_RATIO), len(slot_ids))
+    live_slots = rng.sample(slot_ids, live)
+    batch = []
+    for n in range(count):
+        if n < live:
+            status = 'active' if n % 2 else 'reserved'
+            slot_id = live_slots[n]
+            start = anchor + timedelta(minutes=rng.randrange(0, 60, 15))
+            expiry = anchor + timedelta(hours=2)
+        else:
+            status = rng.choices(('completed', 'expired', 'cancelled'), (90, 7, 3))[0]
+            slot_id = rng.choice(slot_ids)
+            start = anchor - timedelta(minutes=rng.randrange(60, HISTORY_DAYS * 24 * 60, 15))
+            expiry = start
+        hours = rng.choice((1, 1, 2, 2, 3, 4, 8))
+        paid = status == 'completed' and rng.random() < 0.95
+        batch.append(Booking(
+            user_id=rng.choice(user_ids),
+            parking_slot_id=slot_id,
+            vehicle_type='4-wheeler' if rng.random() < 0.6 else '2-wheeler',
+            vehicle_number=f'KA{rng.randrange(1, 60):02d}X{rng.randrange(10000):04d}',
+            status=status,
+            start_time=start,
+            end_time=start + timedelta(hours=hours),
+            expiry_time=expiry,
+            amount=20 * hours if status == 'completed' else None,
+            paid=paid,
+        ))
+        if len(batch) == INSERT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,147 @@
+"""
+Timing, query counts and memory per scenario; JSON results and baselines.
+
+The benchmark runs on a scratch database (see parking.bench.data) and
+commits for real, so every run includes its on_commit callbacks (index,
+cache and event updates), as a request would.
+"""
+import json
+import platform
+import time
+import tracemalloc
+
+import django
+from django.db import connection
+from django.utils import timezone
+
+from parking.querybudget import QueryRecorder
+
+# Bumped when the layout of the results changes
+RESULTS_FORMAT = 1
+
+# Compared against the baseline; the others are informational
+TIMED_METRICS = ('p50_ms', 'p95_ms')
+COUNTED_METRICS = ('queries',)
+MEMORY_METRICS = ('peak_kib',)
+
+
+def percentile(values, pct):
+    """Linear interpolation between the closest ranks."""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = (len(values) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def _measure(scenario, i):
+    arg = scenario.before(i)
+    recorder = QueryRecorder()
+    with connection.execute_wrapper(recorder):
+        start = time.perf_counter()
+        scenario.run(arg)
+        elapsed = time.perf_counter() - start
+    return elapsed * 1000, recorder
+
+
+def run_scenario(scenario, iterations, warmup=3, memory_runs=3):
+    """Stats dict for ``iterations`` timed runs after ``warmup`` untimed ones.
+
+    Memory is the tracemalloc peak over ``memory_runs`` further runs; they
+    are kept apart because tracing slows everything down.
+    """
+    scenario.prepare()
+    for i in range(warmup):
+        _measure(scenario, i)
+
+    timings, queries, db_ms = [], [], []
+    for i in range(warmup, warmup + iterations):
+        elapsed, recorder = _measure(scenario, i)
+        timings.append(elapsed)
+        queries.append(recorder.count)
+        db_ms.append(recorder.time_ms)
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for i in range(warmup + iterations, warmup + iterations + memory_runs):
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            _measure(scenario, i)
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'runs': iterations,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'queries': percentile(queries, 50),
+        'queries_max': max(queries),
+        'db_ms': round(percentile(db_ms, 50), 3),
+        'peak_kib': round(max(peaks) / 1024, 1) if peaks else None,
+    }
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'machine': platform.machine(),
+        'created': timezone.now().isoformat(),
+    }
+
+
+# -------------------------------
+# Results and baselines
+# -------------------------------
+def save(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load(path):
+    with open(path) as f:
+        results = json.load(f)
+    if results.get('format') != RESULTS_FORMAT:
+        raise ValueError(f'{path}: results format {results.get("format")}, expected {RESULTS_FORMAT}')
+    return results
+
+
+def mismatches(results, baseline):
+    """Settings that make the two runs not comparable, as ``(name, baseline, current)``."""
+    return [
+        (name, baseline.get(name), results.get(name))
+        for name in ('size', 'seed')
+        if baseline.get(name) != results.get(name)
+    ]
+
+
+def compare(results, baseline, threshold=0.2):
+    """``(scenario, metric, baseline, current, change, regressed)`` rows.
+
+    Times and memory regress when they grow by more than ``threshold``
+    (a fraction); query counts regress on any increase.
+    """
+    rows = []
+    for name, current in results['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            continue
+        for metric in TIMED_METRICS + COUNTED_METRICS + MEMORY_METRICS:
+            old, new = previous.get(metric), current.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else (0.0 if new == old else float('inf'))
+            if metric in COUNTED_METRICS:
+                regressed = new > old
+            else:
+                regressed = change > threshold
+            rows.append((name, metric, old, new, change, regressed))
+    return rows
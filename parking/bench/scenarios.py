@@ -0,0 +1,180 @@
+"""
+What ``manage.py bench`` times.
+
+Each scenario does its setup in ``before(i)``, which is not timed, and
+the measured operation in ``run(arg)`` with whatever ``before`` returned.
+Views go through the test client and so through the whole middleware
+stack; services are called directly. The booking services each get fresh
+bookings in the state they expect, in time windows no other scenario
+uses, so scenarios can run in any combination and order.
+"""
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from parking import services
+
+# Reservations expired per run of the expire scenario
+EXPIRE_BATCH = 50
+# Bench bookings start a week after the synthetic history
+WINDOW_OFFSET = timedelta(days=7)
+WINDOW_LENGTH = timedelta(hours=2)
+# Logged-in users the view and service scenarios rotate through
+ACTIVE_USERS = 50
+
+
+class BenchError(Exception):
+    pass
+
+
+class BenchContext:
+    """State shared by the scenarios: the city, a client and the free time windows."""
+
+    def __init__(self, city):
+        self.city = city
+        self.client = Client()
+        self.users = list(get_user_model().objects.filter(pk__in=city['user_ids'][:ACTIVE_USERS]).order_by('pk'))
+        self._windows = 0
+
+    def user(self, i):
+        return self.users[i % len(self.users)]
+
+    def next_window(self):
+        """``(slot_id, start, end)``; windows on the same slot follow each other."""
+        slot_ids = self.city['slot_ids']
+        slot_id = slot_ids[self._windows % len(slot_ids)]
+        start = self.city['anchor'] + WINDOW_OFFSET + (WINDOW_LENGTH + timedelta(hours=1)) * (self._windows // len(slot_ids))
+        self._windows += 1
+        return slot_id, start, start + WINDOW_LENGTH
+
+    def reserve(self, i):
+        slot_id, start, end = self.next_window()
+        return services.reserve_slot(self.user(i), slot_id, '4-wheeler', f'BENCH{i:05d}', start, end)
+
+    def get(self, url, data=None):
+        response = self.client.get(url, data)
+        if response.status_code != 200:
+            raise BenchError(f'GET {url} answered {response.status_code}')
+        return response
+
+
+class Scenario:
+    name = None
+
+    def __init__(self, context):
+        self.context = context
+
+    def prepare(self):
+        """Once, before the first run."""
+
+    def before(self, i):
+        return i
+
+    def run(self, arg):
+        raise NotImplementedError
+
+
+# -------------------------------
+# Views
+# -------------------------------
+class SearchScenario(Scenario):
+    name = 'search'
+
+    def before(self, i):
+        terms = self.context.city['search_terms']
+        return terms[i % len(terms)]
+
+    def run(self, query):
+        self.context.get(reverse('parking:search_area'), {'q': query})
+
+
+class DashboardScenario(Scenario):
+    name = 'dashboard'
+
+    def before(self, i):
+        self.context.client.force_login(self.context.user(i))
+
+    def run(self, arg):
+        self.context.get(reverse('parking:dashboard'))
+
+
+# -------------------------------
+# Booking services
+# -------------------------------
+class BookScenario(Scenario):
+    name = 'book'
+
+    def before(self, i):
+        return (self.context.user(i), f'BENCH{i:05d}') + self.context.next_window()
+
+    def run(self, arg):
+        user, vehicle_number, slot_id, start, end = arg
+        services.reserve_slot(user, slot_id, '4-wheeler', vehicle_number, start, end)
+
+
+class StartScenario(Scenario):
+    name = 'start'
+
+    def before(self, i):
+        return self.context.reserve(i)
+
+    def run(self, booking):
+        services.start_parking_session(booking)
+
+
+class EndScenario(Scenario):
+    name = 'end'
+
+    def before(self, i):
+        booking = self.context.reserve(i)
+        return services.start_parking_session(booking)
+
+    def run(self, booking):
+        services.end_parking_session(booking)
+
+
+class PayScenario(Scenario):
+    name = 'pay'
+
+    def before(self, i):
+        booking = self.context.reserve(i)
+        services.start_parking_session(booking)
+        return services.end_parking_session(booking)
+
+    def run(self, booking):
+        services.record_payment(booking)
+
+
+class ExpireScenario(Scenario):
+    name = 'expire'
+
+    @staticmethod
+    def _after_grace():
+        # Past the grace period of reservations made now, well before the
+        # expiry of the city's own live reservations
+        return timezone.now() + services.RESERVATION_GRACE_PERIOD + timedelta(minutes=1)
+
+    def prepare(self):
+        # Reservations left by other scenarios would inflate the first batch
+        services.expire_stale_reservations(now=self._after_grace())
+
+    def before(self, i):
+        for n in range(EXPIRE_BATCH):
+            self.context.reserve(i * EXPIRE_BATCH + n)
+        return self._after_grace()
+
+    def run(self, now):
+        expired = services.expire_stale_reservations(now=now)
+        if expired != EXPIRE_BATCH:
+            raise BenchError(f'expired {expired} reservations, expected {EXPIRE_BATCH}')
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (
+        SearchScenario, DashboardScenario, BookScenario, StartScenario, EndScenario, PayScenario, ExpireScenario,
+    )
+}
@@ -0,0 +1,198 @@
+"""
+In-process pub/sub for slot state changes, consumed by the Server-Sent
+Events endpoint (``views.availability_stream``).
+
+The booking services publish after their transaction commits. A broker per
+process fans messages out to the async subscribers of that process. How
+messages travel between processes is up to the backend:
+
+- ``LocalBackend`` (default): delivers in the publishing process only.
+  Enough for a single ASGI worker.
+- ``FileBackend``: appends every message to a shared NDJSON file and tails
+  it from every process, so a reservation made in one worker reaches the
+  streams held open by the others. For several workers on one host.
+
+Select one with PARKING_EVENTS_BACKEND (dotted path) and its options with
+PARKING_EVENTS_OPTIONS.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Messages a slow subscriber may fall behind before it is told to resync
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+# -------------------------------
+# Backends
+# -------------------------------
+class LocalBackend:
+    """Delivers every message straight back to this process's broker."""
+
+    def __init__(self, **options):
+        self._deliver = None
+
+    def start(self, deliver):
+        self._deliver = deliver
+
+    def publish(self, message):
+        self._deliver(message)
+
+
+class FileBackend:
+    """Fan-out across processes through an append-only NDJSON file.
+
+    Each message is written with a single O_APPEND write, which the OS
+    keeps whole for lines this small. Every process tails the file from its
+    end in a daemon thread. When the file grows past ``max_bytes`` the
+    writer that notices truncates it; tailers follow the shrink.
+    """
+
+    def __init__(self, path=None, poll_interval=0.2, max_bytes=10 * 1024 * 1024, **options):
+        self.path = str(path or os.path.join(settings.BASE_DIR, 'parking_events.ndjson'))
+        self.poll_interval = poll_interval
+        self.max_bytes = max_bytes
+        self._deliver = None
+        self._thread = None
+
+    def start(self, deliver):
+        self._deliver = deliver
+        self._thread = threading.Thread(target=self._tail, name='parking-events-tail', daemon=True)
+        self._thread.start()
+
+    def publish(self, message):
+        line = (json.dumps(message, separators=(',', ':')) + '\n').encode()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size > self.max_bytes:
+                os.ftruncate(fd, 0)
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def _tail(self):
+        open(self.path, 'ab').close()
+        with open(self.path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            pending = b''
+            while True:
+                chunk = f.read()
+                if not chunk:
+                    if os.stat(self.path).st_size < f.tell():
+                        # Truncated by a writer: start again from the top
+                        f.seek(0)
+                        pending = b''
+                    time.sleep(self.poll_interval)
+                    continue
+                *lines, pending = (pending + chunk).split(b'\n')
+                for line in lines:
+                    try:
+                        self._deliver(json.loads(line))
+                    except ValueError:
+                        logger.warning("Skipping malformed event line.")
+
+
+# -------------------------------
+# Broker
+# -------------------------------
+class Subscription:
+    """One stream's queue, bound to the event loop that reads it."""
+
+    def __init__(self, area_ids, loop):
+        self.area_ids = frozenset(area_ids)
+        self.loop = loop
+        self.queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def offer(self, message):
+        # Runs on the subscriber's loop
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class EventBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)  # area_id (None = all) -> subscriptions
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    backend_class = import_string(
+                        getattr(settings, 'PARKING_EVENTS_BACKEND', 'parking.events.LocalBackend')
+                    )
+                    backend = backend_class(**getattr(settings, 'PARKING_EVENTS_OPTIONS', {}))
+                    backend.start(self.deliver)
+                    self._backend = backend
+        return self._backend
+
+    def publish(self, message):
+        """Send ``message`` (a dict with an ``area`` key) to every process. Thread-safe."""
+        try:
+            self.backend.publish(message)
+        except Exception:
+            # Live updates are best effort; never fail the caller
+            logger.exception("Could not publish availability event.")
+
+    def deliver(self, message):
+        """Hand ``message`` to this process's subscribers of its area."""
+        with self._lock:
+            targets = self._subscriptions.get(message.get('area'), set()) | self._subscriptions.get(None, set())
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, message)
+            except RuntimeError:
+                # Event loop already closed; the stream is gone
+                self.unsubscribe(subscription)
+
+    def subscribe(self, area_ids=None):
+        """Subscribe the running event loop to ``area_ids`` (None for all areas)."""
+        self.backend  # noqa: B018 - start the backend before the first message
+        subscription = Subscription(area_ids or (), asyncio.get_running_loop())
+        with self._lock:
+            for area_id in subscription.area_ids or (None,):
+                self._subscriptions[area_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for area_id in subscription.area_ids or (None,):
+                self._subscriptions[area_id].discard(subscription)
+                if not self._subscriptions[area_id]:
+                    del self._subscriptions[area_id]
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(set().union(*self._subscriptions.values()))
+
+
+broker = EventBroker()
+
+
+def publish_slots(event, slot_ids):
+    """Publish ``event`` (reserved, started, ...) for ``slot_ids``, one message per area."""
+    from .inventory import slot_locations
+
+    by_area = defaultdict(list)
+    for slot_id, (area_id, _) in slot_locations(slot_ids).items():
+        by_area[area_id].append(slot_id)
+    for area_id, area_slot_ids in by_area.items():
+        broker.publish({'event': event, 'area': area_id, 'slots': sorted(area_slot_ids)})
@@ -48,6 +48,16 @@ class UserRegistrationForm(forms.ModelForm):
         return password
 
 
+def validate_booking_window(start_time, end_time):
+    # Ensure that the booking is at least 2 hours in advance
+    if start_time < timezone.now() + timedelta(hours=2):
+        raise forms.ValidationError("You must book at least 2 hours in advance.")
+
+    # Ensure the end_time is after the start_time
+    if end_time <= start_time:
+        raise forms.ValidationError("End time must be after start time.")
+
+
 # Improved Booking Form with built-in validation
 class BookingForm(forms.ModelForm):
     class Meta:
@@ -85,26 +95,43 @@ class BookingForm(forms.ModelForm):
 
         # Custom validation for start_time and end_time
         if start_time and end_time:
-            # Ensure that the booking is at least 2 hours in advance
-            if start_time < timezone.now() + timedelta(hours=2):
-                raise forms.ValidationError("You must book at least 2 hours in advance.")
-
-            # Ensure the end_time is after the start_time
-            if end_time <= start_time:
-                raise forms.ValidationError("End time must be after start time.")
+            validate_booking_window(start_time, end_time)
 
             # Check for conflicting bookings
-            conflicting_booking = Booking.objects.filter(
-                parking_slot=self.instance.parking_slot,
-                end_time__gt=start_time,
-                start_time__lt=end_time
-            ).exists()
-            if conflicting_booking:
+            if not self.instance.parking_slot.is_slot_available(start_time, end_time):
                 raise forms.ValidationError("The selected parking slot is already booked during this time.")
 
         return cleaned_data
 
 
+# Booking form for "any free slot" in a sub-area; the allocator picks the slot
+class SlotAllocationForm(forms.ModelForm):
+    slot_type = forms.ChoiceField(
+        choices=[('', 'Any')] + list(ParkingSlot._meta.get_field('slot_type').choices),
+        required=False,
+    )
+
+    class Meta:
+        model = Booking
+        fields = ['vehicle_type', 'vehicle_number', 'start_time', 'end_time']
+        widgets = BookingForm.Meta.widgets
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not self.initial.get('start_time'):
+            self.initial['start_time'] = timezone.now() + timedelta(hours=2)
+        if not self.initial.get('end_time'):
+            self.initial['end_time'] = timezone.now() + timedelta(hours=3)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start_time = cleaned_data.get('start_time')
+        end_time = cleaned_data.get('end_time')
+        if start_time and end_time:
+            validate_booking_window(start_time, end_time)
+        return cleaned_data
+
+
 # Form for Sub-Area (Ensure proper ForeignKey relationship with Area)
 class SubAreaForm(forms.ModelForm):
     class Meta:
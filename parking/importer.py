@@ -0,0 +1,467 @@
+"""
+Streaming bulk import of areas, sub-areas, slots and bookings from CSV or
+NDJSON files (see the import_parking_data command).
+
+Rows are read one at a time and checked against in-memory maps of what
+already exists, by natural key: area name; area and sub-area name;
+sub-area and slot number; slot, user and start time for bookings.
+Reserved and active bookings must not overlap a live booking of their slot,
+in the database or earlier in the file, as reserve_slot() guarantees for
+bookings made on the site. New rows are written with bulk_create, one transaction per chunk, and the same
+transaction advances the file's ImportCheckpoint, so a run that fails
+part-way resumes after the last committed chunk. Rows that fail
+validation are skipped and reported.
+
+bulk_create sends no signals, so finish_import() brings the derived state
+up to date afterwards: inventory version, slot flags and occupancy
+counters, availability index and allocator, search index, and the hourly
+booking rollups for the imported bookings.
+"""
+import csv
+import hashlib
+import json
+import os
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Exists, Max, Min, OuterRef
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Area, Booking, ImportCheckpoint, ParkingSlot, SubArea
+
+IMPORT_CHUNK_SIZE = 1000
+
+# Import order; each kind refers to the ones before it by name
+KINDS = ('areas', 'subareas', 'slots', 'bookings')
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'f', ''}
+
+
+class RowError(ValueError):
+    pass
+
+
+class ImportFailed(Exception):
+    pass
+
+
+# -------------------------------
+# Reading
+# -------------------------------
+def detect_format(path):
+    return 'ndjson' if os.path.splitext(path)[1].lower() in ('.ndjson', '.jsonl', '.json') else 'csv'
+
+
+def read_rows(path, fmt=None):
+    """Yield each data row of a CSV (with a header) or NDJSON file as a dict."""
+    fmt = fmt or detect_format(path)
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if fmt == 'csv':
+            for row in csv.DictReader(f):
+                yield {key.strip(): (value or '').strip() for key, value in row.items() if key}
+            return
+        for line_number, line in enumerate(f, 1):
+            if line.strip():
+                # Errors are yielded so the caller reports them against the right row
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield RowError(f"Invalid JSON on line {line_number}: {e}")
+                    continue
+                if isinstance(row, dict):
+                    yield row
+                else:
+                    yield RowError(f"Line {line_number} is not a JSON object.")
+
+
+FINGERPRINT_BLOCK_SIZE = 64 * 1024
+
+
+def fingerprint(path):
+    """Identifies the file a checkpoint belongs to: its size, first and last 64 KiB."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        digest.update(str(size).encode())
+        digest.update(f.read(FINGERPRINT_BLOCK_SIZE))
+        if size > FINGERPRINT_BLOCK_SIZE:
+            f.seek(max(size - FINGERPRINT_BLOCK_SIZE, FINGERPRINT_BLOCK_SIZE))
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _text(row, name, required=True, max_length=None):
+    value = row.get(name)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise RowError(f"'{name}' is required.")
+    if max_length and len(value) > max_length:
+        raise RowError(f"'{name}' is longer than {max_length} characters.")
+    return value
+
+
+def _choice(row, name, model, field, default):
+    value = _text(row, name, required=False) or default
+    choices = {key for key, _ in model._meta.get_field(field).choices}
+    if value not in choices:
+        raise RowError(f"'{name}' must be one of {', '.join(sorted(choices))}.")
+    return value
+
+
+def _bool(row, name, default):
+    value = row.get(name)
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise RowError(f"'{name}' is not a boolean.")
+
+
+def _datetime(row, name, required=False):
+    value = _text(row, name, required=required)
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise RowError(f"'{name}' is not a date and time.")
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+def _decimal(row, name):
+    value = _text(row, name, required=False)
+    if not value:
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise RowError(f"'{name}' is not a number.")
+
+
+# -------------------------------
+# Importers, one per kind
+# -------------------------------
+class Importer:
+    """Builds model instances from rows; ``existing`` maps natural keys to IDs."""
+
+    model = None
+
+    def __init__(self):
+        self.existing = self.load_existing()
+        self.pending = set()
+
+    def load_existing(self):
+        return {}
+
+    def prepare(self, rows):
+        """Hook to batch lookups for a chunk of rows before build()."""
+
+    def key(self, row):
+        raise NotImplementedError
+
+    def make(self, row, key):
+        raise NotImplementedError
+
+    def build(self, row):
+        """An unsaved instance, or None if the row is already there."""
+        key = self.key(row)
+        if key in self.existing or key in self.pending:
+            return None
+        obj = self.make(row, key)
+        self.pending.add(key)
+        obj._import_key = key
+        return obj
+
+    def write(self, objs):
+        self.model.objects.bulk_create(objs)
+        self.pending.clear()
+        for obj in objs:
+            self.existing[obj._import_key] = obj.pk
+
+
+def area_ids_by_name():
+    # Names aren't unique in the schema; the oldest area wins
+    existing = {}
+    for area_id, name in Area.objects.order_by('id').values_list('id', 'name'):
+        existing.setdefault(name, area_id)
+    return existing
+
+
+class AreaImporter(Importer):
+    model = Area
+
+    def load_existing(self):
+        return area_ids_by_name()
+
+    def key(self, row):
+        return _text(row, 'name', max_length=100)
+
+    def make(self, row, key):
+        return Area(name=key, description=_text(row, 'description', required=False))
+
+
+class SubAreaImporter(Importer):
+    model = SubArea
+
+    def __init__(self):
+        self.areas = area_ids_by_name()
+        super().__init__()
+
+    def load_existing(self):
+        existing = {}
+        for sub_area_id, area_id, name in SubArea.objects.order_by('id').values_list('id', 'area_id', 'name'):
+            existing.setdefault((area_id, name), sub_area_id)
+        return existing
+
+    def area_id(self, row):
+        name = _text(row, 'area')
+        if name not in self.areas:
+            raise RowError(f"Unknown area '{name}'.")
+        return self.areas[name]
+
+    def key(self, row):
+        return (self.area_id(row), _text(row, 'name', max_length=100))
+
+    def make(self, row, key):
+        return SubArea(area_id=key[0], name=key[1], description=_text(row, 'description', required=False))
+
+
+class SlotImporter(Importer):
+    model = ParkingSlot
+
+    def __init__(self):
+        self.sub_areas = SubAreaImporter()
+        super().__init__()
+
+    def load_existing(self):
+        return {
+            (sub_area_id, slot_number): slot_id
+            for slot_id, sub_area_id, slot_number in ParkingSlot.objects.values_list('id', 'sub_area_id', 'slot_number')
+        }
+
+    def sub_area_id(self, row):
+        key = self.sub_areas.key({'area': row.get('area'), 'name': row.get('sub_area')})
+        if key not in self.sub_areas.existing:
+            raise RowError(f"Unknown sub-area '{row.get('sub_area')}' in area '{row.get('area')}'.")
+        return self.sub_areas.existing[key]
+
+    def key(self, row):
+        return (self.sub_area_id(row), _text(row, 'slot_number', max_length=20))
+
+    def make(self, row, key):
+        return ParkingSlot(
+            sub_area_id=key[0],
+            slot_number=key[1],
+            slot_type=_choice(row, 'slot_type', ParkingSlot, 'slot_type', 'open'),
+            is_available=_bool(row, 'is_available', True),
+        )
+
+
+class BookingImporter(Importer):
+    model = Booking
+
+    def __init__(self):
+        self.slots = SlotImporter()
+        self.users = {}
+        # Slot ID -> [(start, end)] of its live bookings, loaded per chunk
+        self.live = {}
+        super().__init__()
+
+    def load_live(self, slot_ids):
+        slot_ids = set(slot_ids) - self.live.keys()
+        if not slot_ids:
+            return
+        for slot_id in slot_ids:
+            self.live[slot_id] = []
+        intervals = Booking.objects.filter(
+            parking_slot_id__in=slot_ids,
+            status__in=Booking.LIVE_STATUSES,
+            start_time__isnull=False,
+            end_time__isnull=False,
+        ).values_list('parking_slot_id', 'start_time', 'end_time')
+        for slot_id, start, end in intervals:
+            self.live[slot_id].append((start, end))
+
+    def prepare(self, rows):
+        # One query for the chunk's unknown users, one for its bookings already there
+        usernames = {str(row.get('username', '')).strip() for row in rows} - self.users.keys()
+        if usernames:
+            self.users.update(
+                get_user_model().objects.filter(username__in=usernames).values_list('username', 'id')
+            )
+        self.existing = {}
+        keys = []
+        for row in rows:
+            try:
+                keys.append(self.key(row))
+            except RowError:
+                pass
+        if keys:
+            starts = [start for _, _, start in keys]
+            rows = Booking.objects.filter(
+                parking_slot_id__in={slot_id for slot_id, _, _ in keys},
+                start_time__gte=min(starts),
+                start_time__lte=max(starts),
+            ).values_list('id', 'parking_slot_id', 'user_id', 'start_time')
+            self.existing = {(slot_id, user_id, start): booking_id for booking_id, slot_id, user_id, start in rows}
+            self.load_live(slot_id for slot_id, _, _ in keys)
+
+    def key(self, row):
+        slot_id = self.slots.existing.get(self.slots.key(row))
+        if slot_id is None:
+            raise RowError(f"Unknown slot '{row.get('slot_number')}'.")
+        username = _text(row, 'username')
+        if username not in self.users:
+            raise RowError(f"Unknown user '{username}'.")
+        return (slot_id, self.users[username], _datetime(row, 'start_time', required=True))
+
+    def make(self, row, key):
+        slot_id, user_id, start_time = key
+        end_time = _datetime(row, 'end_time', required=True)
+        if end_time <= start_time:
+            raise RowError("'end_time' must be after 'start_time'.")
+        status = _choice(row, 'status', Booking, 'status', 'completed')
+        booking = Booking(
+            user_id=user_id,
+            parking_slot_id=slot_id,
+            vehicle_type=_choice(row, 'vehicle_type', Booking, 'vehicle_type', '2-wheeler'),
+            vehicle_number=_text(row, 'vehicle_number', max_length=15),
+            status=status,
+            start_time=start_time,
+            end_time=end_time,
+            expiry_time=_datetime(row, 'expiry_time'),
+            amount=_decimal(row, 'amount'),
+            paid=_bool(row, 'paid', False),
+        )
+        booking._reservation_time = _datetime(row, 'reservation_time') or start_time
+        if status in Booking.LIVE_STATUSES:
+            self.load_live([slot_id])
+            live = self.live[slot_id]
+            if any(start < end_time and end > start_time for start, end in live):
+                raise RowError(f"Overlaps a live booking of slot '{row.get('slot_number')}'.")
+            live.append((start_time, end_time))
+        return booking
+
+    def write(self, objs):
+        super().write(objs)
+        # reservation_time is auto_now_add, so bulk_create stamped it with now
+        for booking in objs:
+            booking.reservation_time = booking._reservation_time
+        Booking.objects.bulk_update(objs, ['reservation_time'])
+
+
+IMPORTERS = {
+    'areas': AreaImporter,
+    'subareas': SubAreaImporter,
+    'slots': SlotImporter,
+    'bookings': BookingImporter,
+}
+
+
+# -------------------------------
+# Running an import
+# -------------------------------
+def import_file(kind, path, fmt=None, chunk_size=IMPORT_CHUNK_SIZE, restart=False, max_errors=100):
+    """Import one file; returns a dict of counts and the row errors.
+
+    Resumes after the rows a previous run committed unless ``restart``.
+    Raises ImportFailed if the checkpoint belongs to a different file or
+    more than ``max_errors`` rows are rejected (committed chunks stay).
+    """
+    importer = IMPORTERS[kind]()
+    key = f"{kind}:{os.path.abspath(path)}"[-255:]
+    checkpoint, _ = ImportCheckpoint.objects.get_or_create(key=key, defaults={'fingerprint': fingerprint(path)})
+    if restart or checkpoint.fingerprint != fingerprint(path):
+        if checkpoint.rows_done and not restart:
+            raise ImportFailed(f"{path} changed since the last run; use --restart to import it from the top.")
+        checkpoint.fingerprint = fingerprint(path)
+        checkpoint.rows_done = 0
+        checkpoint.save()
+
+    result = {'resumed_at': checkpoint.rows_done, 'read': 0, 'created': 0, 'existing': 0, 'errors': []}
+    chunk = []
+
+    def flush():
+        importer.prepare([row for _, row in chunk if not isinstance(row, RowError)])
+        objs = []
+        for row_number, row in chunk:
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                obj = importer.build(row)
+            except RowError as e:
+                result['errors'].append((row_number, str(e)))
+                continue
+            if obj is None:
+                result['existing'] += 1
+            else:
+                objs.append(obj)
+        if len(result['errors']) > max_errors:
+            raise ImportFailed(
+                f"Stopped after {len(result['errors'])} rejected rows; fix them and re-run to resume."
+            )
+        with transaction.atomic():
+            if objs:
+                importer.write(objs)
+            checkpoint.rows_done = chunk[-1][0]
+            checkpoint.save(update_fields=['rows_done', 'updated_at'])
+        result['created'] += len(objs)
+        chunk.clear()
+
+    for row_number, row in enumerate(read_rows(path, fmt), 1):
+        if row_number <= checkpoint.rows_done:
+            continue
+        result['read'] += 1
+        chunk.append((row_number, row))
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    return result
+
+
+def finish_import(kinds, after_booking_id=None):
+    """Bring caches and counters derived from the imported tables up to date.
+
+    ``after_booking_id``: the last booking ID before the import. Bookings
+    after it are added to the hourly booking rollups, which the
+    incremental refresh would miss when they lie behind its watermark.
+    """
+    from . import inventory, occupancy, rollups, search
+    from .allocator import slot_allocator
+    from .availability import availability_index, touch_areas
+
+    kinds = set(kinds)
+    if kinds & {'areas', 'subareas', 'slots'}:
+        inventory.bump_version()
+    if 'bookings' in kinds:
+        # Slots held by imported live bookings
+        live = Booking.objects.filter(parking_slot=OuterRef('pk'), status__in=Booking.LIVE_STATUSES)
+        ParkingSlot.objects.filter(Exists(live), is_available=True).update(is_available=False)
+    occupancy.recount()
+    availability_index.reset()
+    slot_allocator.reset()
+    # New versions make every process reload its view of availability
+    touch_areas(Area.objects.values_list('id', flat=True))
+    if kinds & {'areas', 'subareas'}:
+        search.rebuild()
+    if 'bookings' in kinds and after_booking_id is not None:
+        imported = Booking.objects.filter(pk__gt=after_booking_id).aggregate(
+            start=Min('start_time'), made=Min('reservation_time')
+        )
+        times = [moment for moment in imported.values() if moment is not None]
+        # Without a watermark the first refresh rolls up everything anyway
+        if times and rollups.get_watermark(rollups.BOOKING_WATERMARK) is not None:
+            rollups.refresh_booking_rollups(since=min(times))
+
+
+def last_booking_id():
+    """For finish_import(): taken before importing bookings."""
+    return Booking.objects.aggregate(last=Max('pk'))['last'] or 0
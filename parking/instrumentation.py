@@ -0,0 +1,335 @@
+"""
+Request and booking metrics in the Prometheus text format (served by
+``views.metrics`` at /metrics).
+
+MetricsMiddleware records, per resolved URL name (``parking:dashboard``,
+``admin:index``, ...), a latency histogram, request counts by method and
+status, and the requests in flight. The booking services count committed
+reservations, starts, ends, payments, cancellations and expiries.
+
+Every thread updates its own shard of each metric, so recording a value
+takes no lock; shards are summed when the metrics are collected.
+
+Pre-fork servers run several processes, each with its own metrics. Set
+PARKING_METRICS_DIR to a directory they share: each process then writes
+its totals to ``<pid>.json`` there every PARKING_METRICS_FLUSH_INTERVAL
+seconds (and on exit), and the endpoint adds up all files. Counters of
+processes that have exited still count; their in-flight gauges do not.
+Empty the directory when the server is restarted.
+"""
+import atexit
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Methods counted under their own label; anything else is 'other', so
+# made-up methods cannot grow the label set without bound
+HTTP_METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'CONNECT', 'TRACE'})
+
+# Seconds; the last bucket is +Inf
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Service event names -> event label of parking_booking_events_total
+BOOKING_EVENTS = {
+    'reserved': 'created',
+    'started': 'started',
+    'ended': 'ended',
+    'paid': 'paid',
+    'cancelled': 'cancelled',
+    'expired': 'expired',
+}
+
+
+# -------------------------------
+# Metrics
+# -------------------------------
+registry = []
+
+
+class ThreadShards:
+    """Per-thread dicts of running totals, added up on collection."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+
+    def get(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = defaultdict(float)
+            with self._lock:
+                self._shards.append(values)
+            return values
+
+    def totals(self):
+        with self._lock:
+            shards = list(self._shards)
+        totals = defaultdict(float)
+        for shard in shards:
+            # dict.copy() is atomic under the GIL; the owning thread may be writing
+            for key, value in shard.copy().items():
+                totals[key] += value
+        return totals
+
+    def reset(self):
+        with self._lock:
+            self._local = threading.local()
+            self._shards = []
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.shards = ThreadShards()
+        registry.append(self)
+
+    def _labels(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self, totals):
+        """``(suffix, labels dict, value)`` for the exposition."""
+        for labels, value in sorted(totals.items()):
+            yield '', dict(zip(self.labelnames, labels)), value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.shards.get()[self._labels(labels)] += amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        self.shards.get()[self._labels(labels)] += amount
+
+    def dec(self, amount=1, **labels):
+        self.shards.get()[self._labels(labels)] -= amount
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        shard = self.shards.get()
+        labels = self._labels(labels)
+        # Per-bucket counts (made cumulative on exposition); index len(buckets) is +Inf
+        shard[(labels, bisect.bisect_left(self.buckets, value))] += 1
+        shard[(labels, 'sum')] += value
+
+    def samples(self, totals):
+        by_labels = defaultdict(dict)
+        for (labels, part), value in totals.items():
+            by_labels[labels][part] = value
+        for labels, parts in sorted(by_labels.items()):
+            labels_dict = dict(zip(self.labelnames, labels))
+            count = 0
+            for index, bound in enumerate(self.buckets + (float('inf'),)):
+                count += parts.get(index, 0)
+                yield '_bucket', {**labels_dict, 'le': _format_value(bound)}, count
+            yield '_sum', labels_dict, parts.get('sum', 0)
+            yield '_count', labels_dict, count
+
+
+http_requests = Counter(
+    'parking_http_requests_total', 'HTTP requests by URL name, method and status.', ('view', 'method', 'status')
+)
+http_latency = Histogram(
+    'parking_http_request_duration_seconds', 'Time to the response (first byte if streamed).', ('view',)
+)
+http_in_flight = Gauge('parking_http_requests_in_flight', 'Requests being handled.', ('view',))
+booking_events = Counter(
+    'parking_booking_events_total', 'Committed booking changes (one per slot for batches).', ('event',)
+)
+
+
+def record_booking_event(event, count=1):
+    booking_events.inc(count, event=BOOKING_EVENTS.get(event, event))
+
+
+# -------------------------------
+# Collection and exposition
+# -------------------------------
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Histogram keys are (labels, bucket index or 'sum'), other keys just labels
+def _to_json_key(key):
+    if key and isinstance(key[0], tuple):
+        return [list(key[0]), key[1]]
+    return list(key)
+
+
+def _from_json_key(key):
+    if key and isinstance(key[0], list):
+        return tuple(key[0]), key[1]
+    return tuple(key)
+
+
+def local_totals():
+    return {metric.name: metric.shards.totals() for metric in registry}
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect():
+    """``{metric name: {key: value}}`` for this process, plus the other processes' files."""
+    totals = local_totals()
+    directory = getattr(settings, 'PARKING_METRICS_DIR', None)
+    if not directory:
+        return totals
+    gauges = {metric.name for metric in registry if metric.kind == 'gauge'}
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        stem = os.path.basename(path)[:-len('.json')]
+        if not stem.isdigit() or int(stem) == os.getpid():
+            continue
+        pid = int(stem)
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue  # being replaced, or not ours
+        alive = None
+        for name, entries in snapshot.items():
+            if name not in totals:
+                continue
+            if name in gauges:
+                alive = _process_alive(pid) if alive is None else alive
+                if not alive:
+                    continue
+            for key, value in entries:
+                totals[name][_from_json_key(key)] += value
+    return totals
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    totals = collect()
+    lines = []
+    for metric in registry:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for suffix, labels, value in metric.samples(totals[metric.name]):
+            label_text = ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+            lines.append(f"{metric.name}{suffix}{{{label_text}}} {_format_value(value)}" if label_text
+                         else f'{metric.name}{suffix} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+# -------------------------------
+# Multi-process files
+# -------------------------------
+_flush_state = {'last': 0.0}
+_flush_lock = threading.Lock()
+
+
+def flush(force=False):
+    """Write this process's totals to PARKING_METRICS_DIR, at most once per flush interval."""
+    directory = getattr(settings, 'PARKING_METRICS_DIR', None)
+    if not directory:
+        return
+    now = time.monotonic()
+    if not force and now - _flush_state['last'] < getattr(settings, 'PARKING_METRICS_FLUSH_INTERVAL', 5):
+        return
+    if not _flush_lock.acquire(blocking=force):
+        return  # another thread is writing
+    try:
+        _flush_state['last'] = now
+        snapshot = {
+            name: [[_to_json_key(key), value] for key, value in totals.items()]
+            for name, totals in local_totals().items()
+        }
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.replace(f'{path}.tmp', path)
+    except OSError:
+        logger.exception("Could not write metrics to %s", directory)
+    finally:
+        _flush_lock.release()
+
+
+def _reset_after_fork():
+    # A forked worker starts from zero; the parent's totals stay the parent's
+    for metric in registry:
+        metric.shards.reset()
+    _flush_state['last'] = 0.0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(flush, force=True)
+
+
+# -------------------------------
+# Middleware
+# -------------------------------
+class MetricsMiddleware:
+    """Latency, status counts and in-flight requests per resolved URL name."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            view = getattr(request, '_metrics_view', None)
+            if view is not None:
+                http_in_flight.dec(view=view)
+            else:
+                match = getattr(request, 'resolver_match', None)
+                view = match.view_name if match else '<unresolved>'
+            http_latency.observe(time.perf_counter() - start, view=view)
+            http_requests.inc(
+                view=view,
+                method=request.method if request.method in HTTP_METHODS else 'other',
+                status=response.status_code if response is not None else 500,
+            )
+            flush()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view = request.resolver_match.view_name
+        http_in_flight.inc(view=request._metrics_view)
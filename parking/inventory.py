@@ -0,0 +1,137 @@
+"""
+Cached Area -> SubArea -> ParkingSlot hierarchy as plain dicts and lists.
+
+The inventory changes rarely, so it is built once per version and kept in
+the cache, and each process keeps the copy it last read from the cache
+until the version moves. Area, SubArea and ParkingSlot save/delete signals
+bump the version (see parking.signals). Live availability is not part of
+it: views overlay it per request with ParkingSlot.objects.free_between().
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = 'parking:inventory:version'
+DATA_KEY = 'parking:inventory:{version}'
+
+# (version, areas) last read from the cache; shared by every thread
+_local_copy = {'entry': (None, None)}
+
+# slot_id -> (area_id, sub_area_id, slot_type) for the current inventory version
+_slot_locations = {'version': None, 'slots': {}}
+
+
+def _timeout():
+    # Safety net for per-process caches that miss other processes' bumps
+    return getattr(settings, 'PARKING_INVENTORY_CACHE_TIMEOUT', 300)
+
+
+def get_version():
+    # Start from a timestamp so an evicted counter never reuses an old version
+    return cache.get_or_set(VERSION_KEY, int(time.time() * 1000), None)
+
+
+def bump_version():
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        return get_version()
+
+
+def build_inventory():
+    """Three flat queries, stitched together in Python."""
+    from .models import Area, SubArea, ParkingSlot
+
+    areas = [
+        {'id': area_id, 'name': name, 'description': description, 'subareas': []}
+        for area_id, name, description in Area.objects.order_by('name', 'id').values_list('id', 'name', 'description')
+    ]
+    areas_by_id = {area['id']: area for area in areas}
+
+    subareas_by_id = {}
+    for subarea_id, area_id, name, description in (
+        SubArea.objects.order_by('name', 'id').values_list('id', 'area_id', 'name', 'description')
+    ):
+        subarea = {
+            'id': subarea_id, 'area_id': area_id, 'area_name': areas_by_id[area_id]['name'],
+            'name': name, 'description': description, 'slots': [],
+        }
+        subareas_by_id[subarea_id] = subarea
+        areas_by_id[area_id]['subareas'].append(subarea)
+
+    for slot_id, sub_area_id, slot_number, slot_type in (
+        ParkingSlot.objects.order_by('slot_number', 'id').values_list('id', 'sub_area_id', 'slot_number', 'slot_type')
+    ):
+        subareas_by_id[sub_area_id]['slots'].append({
+            'id': slot_id, 'sub_area_id': sub_area_id, 'slot_number': slot_number, 'slot_type': slot_type,
+        })
+    return areas
+
+
+def _copy_area(area):
+    # Views annotate areas and sub-areas (occupancy, free_count); slots are read-only
+    return {**area, 'subareas': [dict(subarea) for subarea in area['subareas']]}
+
+
+def get_inventory(copy=True):
+    """List of area dicts, each with its ``subareas`` and their ``slots``.
+
+    With ``copy=False`` the areas are the process-wide originals, which
+    callers must not change.
+    """
+    version = get_version()
+    cached_version, areas = _local_copy['entry']
+    if cached_version != version:
+        key = DATA_KEY.format(version=version)
+        areas = cache.get(key)
+        if areas is None:
+            areas = build_inventory()
+            cache.set(key, areas, _timeout())
+        _local_copy['entry'] = (version, areas)
+    return [_copy_area(area) for area in areas] if copy else areas
+
+
+def reset_local_copy():
+    _local_copy['entry'] = (None, None)
+
+
+def get_area(area_id, inventory=None):
+    for area in inventory if inventory is not None else get_inventory(copy=False):
+        if area['id'] == area_id:
+            return area if inventory is not None else _copy_area(area)
+    return None
+
+
+def get_subarea(subarea_id, inventory=None):
+    for area in inventory if inventory is not None else get_inventory(copy=False):
+        for subarea in area['subareas']:
+            if subarea['id'] == subarea_id:
+                return subarea if inventory is not None else dict(subarea)
+    return None
+
+
+def subareas_of(areas):
+    return [subarea for area in areas for subarea in area['subareas']]
+
+
+def slot_attributes(slot_ids):
+    """``{slot_id: (area_id, sub_area_id, slot_type)}`` for the known slots among ``slot_ids``."""
+    version = get_version()
+    if _slot_locations['version'] != version:
+        _slot_locations['slots'] = {
+            slot['id']: (area['id'], subarea['id'], slot['slot_type'])
+            for area in get_inventory(copy=False) for subarea in area['subareas'] for slot in subarea['slots']
+        }
+        _slot_locations['version'] = version
+    slots = _slot_locations['slots']
+    return {slot_id: slots[slot_id] for slot_id in slot_ids if slot_id in slots}
+
+
+def slot_locations(slot_ids):
+    """``{slot_id: (area_id, sub_area_id)}`` for the known slots among ``slot_ids``."""
+    return {slot_id: attributes[:2] for slot_id, attributes in slot_attributes(slot_ids).items()}
+
+
+def area_ids_for_slots(slot_ids):
+    return {area_id for area_id, _ in slot_locations(slot_ids).values()}
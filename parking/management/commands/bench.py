@@ -0,0 +1,119 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from parking.bench import data, runner
+from parking.bench.scenarios import SCENARIOS, BenchContext, BenchError
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the main views and booking services on a synthetic city '
+        '(in a scratch database that is dropped afterwards)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', choices=sorted(data.SIZES), default='small', help='Preset city size')
+        for name in ('areas', 'subareas', 'slots', 'users', 'bookings'):
+            parser.add_argument(f'--{name}', type=int, help=f'Override the number of {name} of the preset')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--iterations', type=int, default=30, help='Timed runs per scenario')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed runs per scenario first')
+        parser.add_argument('--memory-runs', type=int, default=3, help='Runs traced for peak memory')
+        parser.add_argument(
+            '--scenarios', default=','.join(SCENARIOS),
+            help=f"Comma-separated, from: {', '.join(SCENARIOS)}",
+        )
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--baseline', help='Compare against results saved with --output')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Allowed slowdown, as a fraction')
+        parser.add_argument('--fail-on-regression', action='store_true', help='Exit with an error on regressions')
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(unknown)}")
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1.')
+        size = dict(data.SIZES[options['size']])
+        for name in size:
+            if options[name] is not None:
+                size[name] = options[name]
+        baseline = None
+        if options['baseline']:
+            try:
+                baseline = runner.load(options['baseline'])
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Cannot read the baseline: {e}')
+
+        results = {'format': runner.RESULTS_FORMAT, 'size': size, 'seed': options['seed'],
+                   'environment': runner.environment(), 'scenarios': {}}
+        try:
+            with data.scratch_database(), override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                self._run(names, size, options, results)
+        finally:
+            self._reset_caches()
+
+        self._report(results)
+        if options['output']:
+            runner.save(results, options['output'])
+            self.stdout.write(f"Results written to {options['output']}")
+        if baseline is not None:
+            self._compare(results, baseline, options)
+
+    def _run(self, names, size, options, results):
+        self.stdout.write(
+            f"Generating a city of {size['areas']} areas x {size['subareas']} sub-areas x {size['slots']} slots, "
+            f"{size['users']} users and {size['bookings']} bookings (seed {options['seed']})..."
+        )
+        context = BenchContext(data.generate_city(size, seed=options['seed']))
+        for name in names:
+            self.stdout.write(f'Running {name}...')
+            try:
+                results['scenarios'][name] = runner.run_scenario(
+                    SCENARIOS[name](context), options['iterations'], options['warmup'], options['memory_runs']
+                )
+            except BenchError as e:
+                raise CommandError(f'{name}: {e}')
+
+    def _reset_caches(self):
+        # The cached inventory, availability versions and in-memory indexes
+        # saw the scratch database; make every process reload them
+        from parking import inventory
+        from parking.allocator import slot_allocator
+        from parking.availability import availability_index, touch_areas
+        from parking.models import Area
+
+        inventory.bump_version()
+        inventory.reset_local_copy()
+        availability_index.reset()
+        slot_allocator.reset()
+        touch_areas(Area.objects.values_list('id', flat=True))
+
+    def _report(self, results):
+        self.stdout.write('')
+        self.stdout.write(
+            f"{'scenario':<10} {'p50 (ms)':>10} {'p95 (ms)':>10} {'queries':>8} {'db (ms)':>9} {'peak (KiB)':>11}"
+        )
+        for name, stats in results['scenarios'].items():
+            self.stdout.write(
+                f"{name:<10} {stats['p50_ms']:>10.2f} {stats['p95_ms']:>10.2f} {stats['queries']:>8g} "
+                f"{stats['db_ms']:>9.2f} {stats['peak_kib'] or 0:>11.1f}"
+            )
+
+    def _compare(self, results, baseline, options):
+        for name, old, new in runner.mismatches(results, baseline):
+            self.stdout.write(self.style.WARNING(f'Baseline {name} differs ({old} vs {new}); results are not comparable.'))
+        rows = runner.compare(results, baseline, options['threshold'])
+        self.stdout.write('')
+        self.stdout.write(f"{'scenario':<10} {'metric':<9} {'baseline':>10} {'current':>10} {'change':>8}")
+        regressions = 0
+        for name, metric, old, new, change, regressed in rows:
+            line = f"{name:<10} {metric:<9} {old:>10g} {new:>10g} {change:>+8.1%}"
+            if regressed:
+                regressions += 1
+                line = self.style.ERROR(line + '  REGRESSION')
+            self.stdout.write(line)
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'{regressions} regression(s) against {options["baseline"]}.')
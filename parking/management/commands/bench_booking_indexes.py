@@ -0,0 +1,163 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from parking.models import Area, SubArea, ParkingSlot, Booking
+
+User = get_user_model()
+
+# Indexes added by 0015_booking_hot_path_indexes
+BENCH_INDEXES = [
+    'booking_slot_window_idx', 'booking_status_expiry_idx', 'booking_user_history_idx', 'booking_user_unpaid_idx',
+]
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the Booking hot-path queries with and without the composite indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=100000, help='Synthetic bookings to insert')
+        parser.add_argument('--slots', type=int, default=500, help='Synthetic parking slots to insert')
+        parser.add_argument('--users', type=int, default=200, help='Synthetic users to insert')
+        parser.add_argument('--live-ratio', type=float, default=0.02, help='Share of bookings that are reserved/active')
+        parser.add_argument('--repeat', type=int, default=200, help='Timed runs per query')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--explain', action='store_true', help='Print the query plans as well')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError('Needs transactional DDL (SQLite or PostgreSQL).')
+
+        # Everything runs inside one transaction that is rolled back at the
+        # end, so the synthetic rows and the dropped indexes never persist.
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, options):
+        rng = random.Random(options['seed'])
+        self.stdout.write(f"Inserting {options['bookings']} bookings over {options['slots']} slots...")
+        slot_ids, user_ids = self._populate(rng, options)
+
+        queries = self._queries(rng, slot_ids, user_ids)
+        after = self._time_all(queries, options, 'after')
+
+        with connection.cursor() as cursor:
+            for name in BENCH_INDEXES:
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+        before = self._time_all(queries, options, 'before')
+
+        self.stdout.write('')
+        self.stdout.write(f"{'query':<10} {'before (ms)':>12} {'after (ms)':>12} {'speedup':>9}")
+        for name in queries:
+            speedup = before[name] / after[name] if after[name] else float('inf')
+            self.stdout.write(f"{name:<10} {before[name]:>12.3f} {after[name]:>12.3f} {speedup:>8.1f}x")
+
+    def _populate(self, rng, options):
+        stamp = int(time.time())
+        area = Area.objects.create(name=f'bench-{stamp}', description='Index benchmark')
+        sub_area = SubArea.objects.create(area=area, name=f'bench-{stamp}')
+        ParkingSlot.objects.bulk_create(
+            ParkingSlot(sub_area=sub_area, slot_number=str(n)) for n in range(options['slots'])
+        )
+        User.objects.bulk_create(
+            User(username=f'bench-{stamp}-{n}', email=f'bench{n}@example.com', password='!')
+            for n in range(options['users'])
+        )
+        slot_ids = list(ParkingSlot.objects.filter(sub_area=sub_area).values_list('id', flat=True))
+        user_ids = list(User.objects.filter(username__startswith=f'bench-{stamp}-').values_list('id', flat=True))
+
+        now = timezone.now()
+        batch = []
+        for n in range(options['bookings']):
+            live = rng.random() < options['live_ratio']
+            if live:
+                start = now + timedelta(minutes=rng.randint(-120, 7 * 24 * 60))
+                status = rng.choice(Booking.LIVE_STATUSES)
+            else:
+                start = now - timedelta(minutes=rng.randint(60, 2 * 365 * 24 * 60))
+                status = rng.choice(('completed', 'completed', 'completed', 'expired', 'cancelled'))
+            end = start + timedelta(minutes=rng.randint(30, 8 * 60))
+            batch.append(Booking(
+                user_id=rng.choice(user_ids),
+                parking_slot_id=rng.choice(slot_ids),
+                vehicle_number=f'KA01{n:06d}',
+                start_time=start,
+                end_time=end,
+                expiry_time=start + timedelta(minutes=15),
+                status=status,
+                paid=status == 'completed' and rng.random() < 0.97,
+            ))
+            if len(batch) >= 5000:
+                Booking.objects.bulk_create(batch)
+                batch = []
+        Booking.objects.bulk_create(batch)
+        # reservation_time is auto_now_add; spread it out like real history
+        Booking.objects.filter(parking_slot_id__in=slot_ids).update(
+            reservation_time=F('start_time') - timedelta(hours=3)
+        )
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        return slot_ids, user_ids
+
+    def _queries(self, rng, slot_ids, user_ids):
+        now = timezone.now()
+
+        def overlap():
+            start = now + timedelta(minutes=rng.randint(0, 7 * 24 * 60))
+            return Booking.objects.filter(
+                parking_slot_id=rng.choice(slot_ids),
+                status__in=Booking.LIVE_STATUSES,
+                start_time__lt=start + timedelta(hours=2),
+                end_time__gt=start,
+            )
+
+        def expiry():
+            return Booking.objects.filter(status='reserved', expiry_time__lt=now).values_list('id', flat=True)[:500]
+
+        def history():
+            return Booking.objects.filter(user_id=rng.choice(user_ids)).order_by('-reservation_time')[:20]
+
+        def unpaid():
+            return Booking.objects.filter(user_id=rng.choice(user_ids), status='completed', paid=False)
+
+        return {'overlap': overlap, 'expiry': expiry, 'history': history, 'unpaid': unpaid}
+
+    def _explain(self, queryset, phase):
+        if connection.vendor != 'sqlite':
+            return queryset.explain()
+        # SQLite caches EXPLAIN statements by their text and does not
+        # re-plan them after DROP INDEX, so tag each phase differently.
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN /* {phase} */ {sql}', params)
+            return ' '.join(row[-1] for row in cursor.fetchall())
+
+    def _time_all(self, queries, options, phase):
+        results = {}
+        for name, build in queries.items():
+            if options['explain']:
+                self.stdout.write(f'{phase} {name}: {self._explain(build(), phase)}')
+            samples = []
+            for _ in range(options['repeat']):
+                queryset = build()
+                started = time.perf_counter()
+                list(queryset)
+                samples.append((time.perf_counter() - started) * 1000)
+            results[name] = statistics.median(samples)
+        return results
@@ -0,0 +1,135 @@
+import random
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+from django.utils import timezone
+
+from parking import occupancy
+from parking.models import Area, SubArea, ParkingSlot, Booking
+from parking.services import reserve_slot
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Measure reservation throughput and double-booking rate under concurrent load'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--attempts', type=int, default=50, help='Reservation attempts per thread')
+        parser.add_argument('--slots', type=int, default=5, help='Few slots means heavy contention')
+        parser.add_argument('--windows', type=int, default=4, help='Distinct time windows to compete for')
+        parser.add_argument('--naive', action='store_true', help='Use the old check-then-insert path for comparison')
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        stamp = int(time.time())
+        area = Area.objects.create(name=f'bench-{stamp}', description='Reservation benchmark')
+        sub_area = SubArea.objects.create(area=area, name=f'bench-{stamp}')
+        ParkingSlot.objects.bulk_create(
+            ParkingSlot(sub_area=sub_area, slot_number=str(n)) for n in range(options['slots'])
+        )
+        slot_ids = list(ParkingSlot.objects.filter(sub_area=sub_area).values_list('id', flat=True))
+        # bulk_create sends no post_save, so count the new slots here
+        occupancy.record(sub_area.pk, total=len(slot_ids), free=len(slot_ids))
+        users = [
+            User.objects.create(username=f'bench-{stamp}-{n}', email=f'bench{n}@example.com', password='!')
+            for n in range(options['threads'])
+        ]
+        try:
+            self._run(options, users, slot_ids)
+        finally:
+            # Cascades to the slots and every booking made against them
+            area.delete()
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+    def _run(self, options, users, slot_ids):
+        base = timezone.now() + timedelta(days=1)
+        windows = [
+            (base + timedelta(hours=2 * n), base + timedelta(hours=2 * n + 2))
+            for n in range(options['windows'])
+        ]
+        book = self._naive_reserve if options['naive'] else reserve_slot
+        outcomes = Counter()
+        lock = threading.Lock()
+        barrier = threading.Barrier(options['threads'])
+
+        def worker(index):
+            rng = random.Random(options['seed'] + index)
+            local = Counter()
+            barrier.wait()
+            try:
+                for _ in range(options['attempts']):
+                    start_time, end_time = rng.choice(windows)
+                    try:
+                        book(users[index], rng.choice(slot_ids), '4-wheeler', f'BENCH{index}',
+                             start_time, end_time)
+                        local['booked'] += 1
+                    except ValidationError:
+                        local['conflict'] += 1
+                    except OperationalError:
+                        local['lock_error'] += 1
+            finally:
+                connections.close_all()
+                with lock:
+                    outcomes.update(local)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        attempts = options['threads'] * options['attempts']
+        double_booked = self._count_double_bookings(slot_ids)
+        capacity = len(slot_ids) * len(windows)
+        self.stdout.write(f"path:             {'naive check-then-insert' if options['naive'] else 'reserve_slot'}")
+        self.stdout.write(f"backend:          {connection.vendor}")
+        self.stdout.write(f"attempts:         {attempts} in {elapsed:.2f}s ({attempts / elapsed:.0f}/s)")
+        self.stdout.write(f"booked:           {outcomes['booked']} (capacity {capacity})")
+        self.stdout.write(f"conflicts:        {outcomes['conflict']}")
+        self.stdout.write(f"lock errors:      {outcomes['lock_error']}")
+        style = self.style.ERROR if double_booked else self.style.SUCCESS
+        self.stdout.write(style(
+            f"double bookings:  {double_booked} ({double_booked / max(outcomes['booked'], 1):.1%} of bookings)"
+        ))
+
+    @staticmethod
+    def _naive_reserve(user, slot_id, vehicle_type, vehicle_number, start_time, end_time):
+        # The pre-service flow: separate check, insert and flag update
+        if Booking.objects.filter(
+            parking_slot_id=slot_id, status__in=Booking.LIVE_STATUSES,
+            start_time__lt=end_time, end_time__gt=start_time,
+        ).exists():
+            raise ValidationError("The selected parking slot is already booked during this time.")
+        now = timezone.now()
+        Booking.objects.create(
+            user=user, parking_slot_id=slot_id, vehicle_type=vehicle_type, vehicle_number=vehicle_number,
+            start_time=start_time, end_time=end_time, reservation_time=now, expiry_time=now + timedelta(minutes=15),
+        )
+        if ParkingSlot.objects.filter(pk=slot_id, is_available=True).update(is_available=False):
+            occupancy.record_for_slot(slot_id, free=-1)
+
+    @staticmethod
+    def _count_double_bookings(slot_ids):
+        """Live bookings that overlap an earlier live booking on the same slot."""
+        bookings = Booking.objects.filter(
+            parking_slot_id__in=slot_ids, status__in=Booking.LIVE_STATUSES
+        ).order_by('parking_slot_id', 'start_time', 'id').values_list('parking_slot_id', 'start_time', 'end_time')
+        doubled = 0
+        last_slot, last_end = None, None
+        for slot_id, start_time, end_time in bookings:
+            if slot_id == last_slot and start_time < last_end:
+                doubled += 1
+                last_end = max(last_end, end_time)
+            else:
+                last_slot, last_end = slot_id, end_time
+        return doubled
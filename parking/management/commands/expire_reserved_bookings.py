@@ -1,25 +1,44 @@
+import time
+
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from parking.models import Booking  # Replace 'parking' with your app name
+from django.db import close_old_connections
+
+from parking.services import EXPIRY_CHUNK_SIZE, expire_stale_reservations
+
 
 class Command(BaseCommand):
     help = 'Expire reserved bookings that have passed their grace period'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=EXPIRY_CHUNK_SIZE,
+                            help='Bookings expired per transaction')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, expiring bookings every --interval seconds')
+        parser.add_argument('--interval', type=float, default=60,
+                            help='Seconds between passes in --loop mode')
+
     def handle(self, *args, **options):
-        now = timezone.now()
-        expired_bookings = Booking.objects.filter(status='reserved', expiry_time__lt=now)
-        
-        count = 0
-        for booking in expired_bookings:
-            booking.status = 'expired'
-            booking.save()
-            
-            # Make slot available again
-            booking.slot.is_available = True
-            booking.slot.save()
-            
-            count += 1
-        
+        if not options['loop']:
+            self._expire(options['chunk_size'])
+            return
+
+        self.stdout.write(f"Expiring reserved bookings every {options['interval']}s (Ctrl+C to stop)")
+        try:
+            while True:
+                self._expire(options['chunk_size'], quiet=True)
+                # Drop connections that went stale while sleeping
+                close_old_connections()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped.')
+
+    def _expire(self, chunk_size, quiet=False):
+        started = time.perf_counter()
+        count = expire_stale_reservations(chunk_size=chunk_size)
+        elapsed = time.perf_counter() - started
+        if quiet and not count:
+            return
+        rate = count / elapsed if elapsed else 0
         self.stdout.write(
-            self.style.SUCCESS(f'Successfully expired {count} bookings')
-        )
\ No newline at end of file
+            self.style.SUCCESS(f'Successfully expired {count} bookings in {elapsed:.3f}s ({rate:.0f} rows/s)')
+        )
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from parking.importer import IMPORT_CHUNK_SIZE, KINDS, ImportFailed, finish_import, import_file, last_booking_id
+
+
+class Command(BaseCommand):
+    help = 'Bulk import areas, sub-areas, slots and bookings from CSV or NDJSON files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--areas', help='File with name, description')
+        parser.add_argument('--subareas', help='File with area, name, description')
+        parser.add_argument('--slots', help='File with area, sub_area, slot_number, slot_type, is_available')
+        parser.add_argument('--bookings',
+                            help='File with username, area, sub_area, slot_number, vehicle_type, vehicle_number, '
+                                 'status, start_time, end_time, reservation_time, expiry_time, amount, paid')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='File format (default: from the file extension)')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE,
+                            help='Rows written per transaction')
+        parser.add_argument('--max-errors', type=int, default=100,
+                            help='Rejected rows tolerated per file before stopping')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore checkpoints and read the files from the top')
+
+    def handle(self, *args, **options):
+        files = [(kind, options[kind]) for kind in KINDS if options[kind]]
+        if not files:
+            raise CommandError('Give at least one of --areas, --subareas, --slots or --bookings.')
+
+        after_booking_id = last_booking_id()
+        try:
+            for kind, path in files:
+                try:
+                    result = import_file(
+                        kind, path, fmt=options['format'], chunk_size=options['chunk_size'],
+                        restart=options['restart'], max_errors=options['max_errors'],
+                    )
+                except FileNotFoundError:
+                    raise CommandError(f'{path} does not exist.')
+                except ImportFailed as e:
+                    raise CommandError(f'{kind}: {e}')
+                for row_number, error in result['errors']:
+                    self.stderr.write(f'{path} row {row_number}: {error}')
+                resumed = f" (resumed after row {result['resumed_at']})" if result['resumed_at'] else ''
+                self.stdout.write(self.style.SUCCESS(
+                    f"{kind}: {result['created']} created, {result['existing']} already present, "
+                    f"{len(result['errors'])} rejected of {result['read']} rows{resumed}"
+                ))
+        finally:
+            # Committed chunks are in the database even if a later one failed
+            finish_import([kind for kind, _ in files], after_booking_id=after_booking_id)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from parking.services import REBILL_CHUNK_SIZE, rebill_unpaid_bookings
+
+
+class Command(BaseCommand):
+    help = 'Re-price completed, unpaid bookings with the current tariffs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=REBILL_CHUNK_SIZE,
+                            help='Bookings priced per batch')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report the changes without saving them')
+
+    def handle(self, *args, **options):
+        checked, changed, difference = rebill_unpaid_bookings(
+            chunk_size=options['chunk_size'], dry_run=options['dry_run']
+        )
+        verb = 'Would change' if options['dry_run'] else 'Changed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {changed} of {checked} unpaid bookings (total ₹{difference:+.2f})'
+        ))
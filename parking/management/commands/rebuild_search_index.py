@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from parking import search
+
+
+class Command(BaseCommand):
+    help = 'Create (if needed) and repopulate the FTS5 search index over areas and sub-areas'
+
+    def handle(self, *args, **options):
+        if not search.fts_supported():
+            self.stdout.write(self.style.WARNING(
+                'FTS5 is not available on this database; search uses the in-memory index.'
+            ))
+            return
+        with connection.schema_editor() as schema_editor:
+            search.create_fts_table(schema_editor)
+        count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} areas and sub-areas'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from parking import occupancy
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-SubArea and per-Area occupancy counters from slots and bookings'
+
+    def handle(self, *args, **options):
+        count = occupancy.recount()
+        self.stdout.write(self.style.SUCCESS(f'Recounted occupancy for {count} sub-areas'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from parking.rollups import refresh_booking_rollups, refresh_feedback_rollups
+
+
+class Command(BaseCommand):
+    help = 'Roll complete days of feedback and complete hours of bookings into the rollup tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Rebuild everything instead of continuing from the watermarks')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Processes for the booking rollups (default: PARKING_ROLLUP_WORKERS or one per CPU)')
+
+    def handle(self, *args, **options):
+        days = refresh_feedback_rollups(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'Rolled up feedback for {days} days'))
+        rows = refresh_booking_rollups(full=options['full'], workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {rows} hourly booking rollup rows'))
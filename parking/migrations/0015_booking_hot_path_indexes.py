@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0014_alter_loginregisterlog_user'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['parking_slot', 'start_time', 'end_time'], name='booking_slot_window_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'expiry_time'], name='booking_status_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', 'reservation_time'], name='booking_user_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', 'status', 'paid'], name='booking_user_unpaid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('status__in', ['reserved', 'active'])), fields=['parking_slot', 'start_time', 'end_time'], name='booking_live_window_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('status', 'reserved')), fields=['expiry_time'], name='booking_reserved_expiry_idx'),
+        ),
+    ]
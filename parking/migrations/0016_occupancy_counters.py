@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:35
+
+import django.db.models.deletion
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def populate_counters(apps, schema_editor):
+    Area = apps.get_model('parking', 'Area')
+    SubArea = apps.get_model('parking', 'SubArea')
+    Booking = apps.get_model('parking', 'Booking')
+    AreaOccupancy = apps.get_model('parking', 'AreaOccupancy')
+    SubAreaOccupancy = apps.get_model('parking', 'SubAreaOccupancy')
+
+    counts = {}
+    for sub_area_id, area_id, total, free in SubArea.objects.values_list('id', 'area_id').annotate(
+        total=Count('parkingslots'),
+        free=Count('parkingslots', filter=Q(parkingslots__is_available=True)),
+    ):
+        counts[sub_area_id] = (area_id, Counter(total=total, free=free))
+    for sub_area_id, status, n in Booking.objects.filter(status__in=['reserved', 'active']).values_list(
+        'parking_slot__sub_area_id', 'status'
+    ).annotate(n=Count('id')).order_by():
+        counts[sub_area_id][1][status] += n
+
+    area_counts = {area_id: Counter() for area_id in Area.objects.values_list('id', flat=True)}
+    for area_id, counter in counts.values():
+        area_counts[area_id].update(counter)
+
+    def fields(counter):
+        return {f'{name}_slots': counter[name] for name in ('total', 'free', 'reserved', 'active')}
+
+    SubAreaOccupancy.objects.bulk_create(
+        SubAreaOccupancy(sub_area_id=sub_area_id, **fields(counter)) for sub_area_id, (_, counter) in counts.items()
+    )
+    AreaOccupancy.objects.bulk_create(
+        AreaOccupancy(area_id=area_id, **fields(counter)) for area_id, counter in area_counts.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0015_booking_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AreaOccupancy',
+            fields=[
+                ('area', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='occupancy', serialize=False, to='parking.area')),
+                ('total_slots', models.IntegerField(default=0)),
+                ('free_slots', models.IntegerField(default=0)),
+                ('reserved_slots', models.IntegerField(default=0)),
+                ('active_slots', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SubAreaOccupancy',
+            fields=[
+                ('sub_area', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='occupancy', serialize=False, to='parking.subarea')),
+                ('total_slots', models.IntegerField(default=0)),
+                ('free_slots', models.IntegerField(default=0)),
+                ('reserved_slots', models.IntegerField(default=0)),
+                ('active_slots', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0016_occupancy_counters'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='booking',
+            name='booking_user_history_idx',
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', 'reservation_time', 'id'], name='booking_user_history_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+from django.db import DatabaseError, migrations
+
+# Frozen copies of the table name and DDL in parking.search as of this migration
+FTS_TABLE = 'parking_search'
+
+
+def fts_supported(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if cursor.fetchone()[0]:
+            return True
+        try:
+            cursor.execute("CREATE VIRTUAL TABLE temp.parking_fts5_probe USING fts5(x)")
+            cursor.execute("DROP TABLE temp.parking_fts5_probe")
+            return True
+        except DatabaseError:
+            return False
+
+
+def create_search_index(apps, schema_editor):
+    # Only SQLite builds with FTS5 get the table; elsewhere parking.search
+    # falls back to its in-memory index
+    if not fts_supported(schema_editor.connection):
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "kind UNINDEXED, object_id UNINDEXED, area_id UNINDEXED, name, area_name, description, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+
+    Area = apps.get_model('parking', 'Area')
+    SubArea = apps.get_model('parking', 'SubArea')
+    rows = [
+        ('area', area_id, area_id, name, '', description)
+        for area_id, name, description in Area.objects.values_list('id', 'name', 'description')
+    ]
+    rows += [
+        ('subarea', subarea_id, area_id, name, area_name, description)
+        for subarea_id, area_id, name, area_name, description in SubArea.objects.values_list(
+            'id', 'area_id', 'name', 'area__name', 'description'
+        )
+    ]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (kind, object_id, area_id, name, area_name, description) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            rows,
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0017_booking_history_keyset_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0018_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userauthenticationregistration',
+            name='action',
+            field=models.CharField(choices=[('login', 'Login'), ('login_failed', 'Login Failed'), ('register', 'Register'), ('password_reset', 'Password Reset')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='userauthenticationregistration',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='auth_registrations', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0020_feedback_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingHourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('slot_type', models.CharField(max_length=20)),
+                ('vehicle_type', models.CharField(max_length=20)),
+                ('occupied_minutes', models.FloatField(default=0)),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'end_time'], name='booking_status_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['reservation_time'], name='booking_reserved_at_idx'),
+        ),
+        migrations.AddField(
+            model_name='bookinghourlyrollup',
+            name='area',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_rollups', to='parking.area'),
+        ),
+        migrations.AddField(
+            model_name='bookinghourlyrollup',
+            name='sub_area',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_rollups', to='parking.subarea'),
+        ),
+        migrations.AddIndex(
+            model_name='bookinghourlyrollup',
+            index=models.Index(fields=['area', 'hour'], name='booking_rollup_area_hour_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='bookinghourlyrollup',
+            unique_together={('hour', 'sub_area', 'slot_type', 'vehicle_type')},
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0021_booking_hourly_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tariff',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('slot_type', models.CharField(blank=True, choices=[('covered', 'Covered'), ('open', 'Open')], max_length=20)),
+                ('vehicle_type', models.CharField(blank=True, choices=[('2-wheeler', '2-Wheeler'), ('4-wheeler', '4-Wheeler')], max_length=20)),
+                ('start_hour', models.PositiveSmallIntegerField(default=0)),
+                ('end_hour', models.PositiveSmallIntegerField(default=24)),
+                ('hourly_rate', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('is_active', models.BooleanField(default=True)),
+                ('area', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tariffs', to='parking.area')),
+            ],
+        ),
+    ]
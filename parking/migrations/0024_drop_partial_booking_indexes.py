@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:51
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0023_import_checkpoints'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='booking',
+            name='booking_live_window_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='booking',
+            name='booking_reserved_expiry_idx',
+        ),
+    ]
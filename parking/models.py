@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Count, Exists, OuterRef, Q
 from django.core.exceptions import ValidationError
 from datetime import timedelta
 from django.utils import timezone
@@ -7,6 +8,8 @@ from django.conf import settings
 from django.contrib.auth.models import User
 import math
 
+from .availability import availability_index
+
 # Custom User model
 class User(AbstractUser):
     # No need to redefine groups and user_permissions as they are already in AbstractUser
@@ -34,6 +37,30 @@ class SubArea(models.Model):
     def __str__(self):
         return f"{self.name} ({self.area.name})"
 
+# Parking Slot QuerySet with set-based availability lookups
+class ParkingSlotQuerySet(models.QuerySet):
+    def free_between(self, start_time, end_time, sub_area=None):
+        """Slots with no live booking overlapping the window, in one anti-join."""
+        overlapping = Booking.objects.filter(
+            parking_slot=OuterRef('pk'),
+            status__in=Booking.LIVE_STATUSES,
+            start_time__lt=end_time,
+            end_time__gt=start_time,
+        )
+        slots = self.filter(~Exists(overlapping))
+        if sub_area is not None:
+            if isinstance(sub_area, (SubArea, int, str)):
+                sub_area = [sub_area]
+            slots = slots.filter(sub_area__in=sub_area)
+        return slots
+
+    def counts_by_sub_area(self):
+        """Map of sub_area_id -> number of slots in this queryset."""
+        return dict(
+            self.order_by().values('sub_area').annotate(total=Count('id')).values_list('sub_area', 'total')
+        )
+
+
 # Parking Slot Model
 class ParkingSlot(models.Model):
     sub_area = models.ForeignKey(SubArea, on_delete=models.CASCADE, related_name='parkingslots')
@@ -41,6 +68,8 @@ class ParkingSlot(models.Model):
     slot_type = models.CharField(max_length=20, choices=[('covered', 'Covered'), ('open', 'Open')], default='open')
     is_available = models.BooleanField(default=True)
 
+    objects = ParkingSlotQuerySet.as_manager()
+
     class Meta:
         unique_together = ('sub_area', 'slot_number')
 
@@ -48,7 +77,12 @@ class ParkingSlot(models.Model):
         return f"Slot {self.slot_number} in {self.sub_area.name}, {self.sub_area.area.name}"
 
     def is_slot_available(self, start_time, end_time):
+        # Answered from the in-memory interval index when it covers the window
+        is_free = availability_index.is_free(self.pk, start_time, end_time)
+        if is_free is not None:
+            return is_free
         return not self.bookings.filter(
+            status__in=Booking.LIVE_STATUSES,
             start_time__lt=end_time,
             end_time__gt=start_time
         ).exists()
@@ -59,14 +93,59 @@ class ParkingSlot(models.Model):
 
     def mark_unavailable(self):
         self.is_available = False
-        self.save()
+        self.save(update_fields=['is_available'])
 
     def mark_available(self):
         self.is_available = True
-        self.save()
+        self.save(update_fields=['is_available'])
+
+# Occupancy counters per SubArea, rolled up per Area. Maintained in the same
+# transaction as every slot-state change (see parking.occupancy); free counts
+# available slots, reserved/active count live bookings in that state.
+class SubAreaOccupancy(models.Model):
+    sub_area = models.OneToOneField(SubArea, on_delete=models.CASCADE, primary_key=True, related_name='occupancy')
+    total_slots = models.IntegerField(default=0)
+    free_slots = models.IntegerField(default=0)
+    reserved_slots = models.IntegerField(default=0)
+    active_slots = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.free_slots} of {self.total_slots} free in sub-area {self.sub_area_id}"
+
+class AreaOccupancy(models.Model):
+    area = models.OneToOneField(Area, on_delete=models.CASCADE, primary_key=True, related_name='occupancy')
+    total_slots = models.IntegerField(default=0)
+    free_slots = models.IntegerField(default=0)
+    reserved_slots = models.IntegerField(default=0)
+    active_slots = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.free_slots} of {self.total_slots} free in area {self.area_id}"
+
+# Booking QuerySet for the per-user booking lists
+class BookingQuerySet(models.QuerySet):
+    # Columns the booking tables render, with the slot/sub-area/area names
+    # joined in rather than fetched lazily per row
+    LISTING_FIELDS = (
+        'id', 'status', 'paid', 'start_time', 'end_time', 'reservation_time', 'expiry_time',
+        'parking_slot__slot_number',
+        'parking_slot__sub_area__name',
+        'parking_slot__sub_area__area__name',
+    )
+
+    def for_listing(self):
+        return self.select_related('parking_slot__sub_area__area').only(*self.LISTING_FIELDS)
+
+    def current(self):
+        """Bookings that still need the user: live ones and unpaid completed ones."""
+        return self.filter(Q(status__in=Booking.LIVE_STATUSES) | Q(status='completed', paid=False))
+
 
 # Booking Model
 class Booking(models.Model):
+    # Statuses that hold a slot for their time window
+    LIVE_STATUSES = ('reserved', 'active')
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='bookings')
     parking_slot = models.ForeignKey(ParkingSlot, on_delete=models.CASCADE, related_name='bookings')
     vehicle_type = models.CharField(max_length=20, choices=[('2-wheeler', '2-Wheeler'), ('4-wheeler', '4-Wheeler')], default='2-wheeler')
@@ -79,10 +158,27 @@ class Booking(models.Model):
     paid = models.BooleanField(default=False)
     status = models.CharField(max_length=10, choices=[('reserved', 'Reserved'), ('active', 'Active'), ('completed', 'Completed'), ('expired', 'Expired'), ('cancelled', 'Cancelled')], default='reserved')
 
+    objects = BookingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Composite indexes for the hot filters
+            models.Index(fields=['parking_slot', 'start_time', 'end_time'], name='booking_slot_window_idx'),
+            models.Index(fields=['status', 'expiry_time'], name='booking_status_expiry_idx'),
+            # Matches the keyset order of the booking history (see parking.pagination)
+            models.Index(fields=['user', 'reservation_time', 'id'], name='booking_user_history_idx'),
+            models.Index(fields=['user', 'status', 'paid'], name='booking_user_unpaid_idx'),
+            # Incremental reporting windows (see parking.rollups)
+            models.Index(fields=['status', 'end_time'], name='booking_status_end_idx'),
+            models.Index(fields=['reservation_time'], name='booking_reserved_at_idx'),
+        ]
+
     def calculate_amount(self):
+        # Same tariff and rounding as end_parking_session (see parking.tariffs)
         if self.start_time and self.end_time:
-            duration = (self.end_time - self.start_time).total_seconds() / 3600  # Hours
-            return round(duration * 20, 2)  # Example rate: ₹20/hour
+            from .tariffs import price_bookings
+
+            return price_bookings([self])[0]
         return 0
 
     def is_grace_period_expired(self):
@@ -90,9 +186,35 @@ class Booking(models.Model):
             return timezone.now() > self.expiry_time
         return False
 
+    def effective_status(self):
+        # Reservations past their grace period read as expired even before
+        # the background expiry job has updated the row
+        return 'expired' if self.is_grace_period_expired() else self.status
+
     def __str__(self):
         return f"Booking {self.id} - {self.parking_slot} ({self.status})"
 
+# Hourly rate for part of the day, optionally limited to an area, slot
+# type and vehicle type; the most specific matching tariff wins (see
+# parking.tariffs). Hours run from start_hour up to end_hour, wrapping
+# past midnight when end_hour <= start_hour.
+class Tariff(models.Model):
+    name = models.CharField(max_length=100)
+    area = models.ForeignKey(Area, on_delete=models.CASCADE, null=True, blank=True, related_name='tariffs')
+    slot_type = models.CharField(max_length=20, blank=True, choices=ParkingSlot._meta.get_field('slot_type').choices)
+    vehicle_type = models.CharField(max_length=20, blank=True, choices=Booking._meta.get_field('vehicle_type').choices)
+    start_hour = models.PositiveSmallIntegerField(default=0)
+    end_hour = models.PositiveSmallIntegerField(default=24)
+    hourly_rate = models.DecimalField(max_digits=8, decimal_places=2)
+    is_active = models.BooleanField(default=True)
+
+    def clean(self):
+        if self.start_hour > 23 or not 1 <= self.end_hour <= 24:
+            raise ValidationError("Hours must be 0-23 for the start and 1-24 for the end.")
+
+    def __str__(self):
+        return f"{self.name}: ₹{self.hourly_rate}/hour"
+
 # User Authentication and Registration Log
 class LoginRegisterLog(models.Model):
     user = models.ForeignKey(
@@ -119,10 +241,12 @@ class LoginRegisterLog(models.Model):
 
 
 class UserAuthenticationRegistration(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='auth_registrations')
+    # Null for failed logins with an unknown username/email
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='auth_registrations', null=True, blank=True)
     email = models.EmailField()
     action = models.CharField(max_length=20, choices=[
         ('login', 'Login'),
+        ('login_failed', 'Login Failed'),
         ('register', 'Register'),
         ('password_reset', 'Password Reset')
     ])
@@ -134,7 +258,7 @@ class UserAuthenticationRegistration(models.Model):
         verbose_name_plural = 'User Authentication Registrations'
 
     def __str__(self):
-        return f"{self.user.username} - {self.action} - {self.timestamp}"
+        return f"{self.user.username if self.user else self.email} - {self.action} - {self.timestamp}"
      
 # Contact Model
 class Contact(models.Model):
@@ -180,4 +304,63 @@ class Feedback(models.Model):
 
     def __str__(self):
         user_info = self.user.username if self.user else "Anonymous"
-        return f"{user_info} - Rating: {self.rating}"
\ No newline at end of file
+        return f"{user_info} - Rating: {self.rating}"
+
+# Progress marker for incremental rollup jobs: everything before ``position``
+# has been rolled up (see parking.rollups)
+class RollupWatermark(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    position = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
+
+# Progress of a bulk import (see parking.importer): rows of the file already
+# written, committed together with each chunk
+class ImportCheckpoint(models.Model):
+    key = models.CharField(max_length=255, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    rows_done = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key}: {self.rows_done} rows"
+
+# Feedback counts per day for each answer of each dimension (rating,
+# goal_achievement, reason, issue); '' stands for no answer
+class FeedbackDailyRollup(models.Model):
+    DIMENSIONS = ('rating', 'goal_achievement', 'reason', 'issue')
+
+    day = models.DateField()
+    dimension = models.CharField(max_length=20)
+    value = models.CharField(max_length=50, blank=True)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('day', 'dimension', 'value')
+
+    def __str__(self):
+        return f"{self.day} {self.dimension}={self.value or '-'}: {self.count}"
+
+# Booking facts per hour for each sub-area, slot type and vehicle type:
+# slot-minutes occupied by completed sessions, bookings made and revenue
+# billed in the hour (see parking.rollups)
+class BookingHourlyRollup(models.Model):
+    hour = models.DateTimeField()
+    area = models.ForeignKey(Area, on_delete=models.CASCADE, related_name='hourly_rollups')
+    sub_area = models.ForeignKey(SubArea, on_delete=models.CASCADE, related_name='hourly_rollups')
+    slot_type = models.CharField(max_length=20)
+    vehicle_type = models.CharField(max_length=20)
+    occupied_minutes = models.FloatField(default=0)
+    bookings = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('hour', 'sub_area', 'slot_type', 'vehicle_type')
+        indexes = [
+            models.Index(fields=['area', 'hour'], name='booking_rollup_area_hour_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H:00} {self.sub_area_id}/{self.slot_type}/{self.vehicle_type}"
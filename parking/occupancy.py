@@ -0,0 +1,144 @@
+"""
+Denormalised occupancy counters (SubAreaOccupancy / AreaOccupancy).
+
+Every slot-state change calls ``apply_deltas`` inside its own transaction,
+so the counters move together with the rows they describe. Direct saves
+and deletes of slots and bookings (e.g. in the admin) are counted by the
+signal receivers through ``slot_changed`` and ``booking_changed``; code
+that adjusts the counters itself does its saves inside ``suspended()``.
+``recount`` rebuilds them from scratch (see the recount_occupancy command).
+"""
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+COUNTERS = ('total', 'free', 'reserved', 'active')
+
+_local = threading.local()
+
+
+def _changes(delta):
+    return {f'{name}_slots': F(f'{name}_slots') + amount for name, amount in delta.items() if amount}
+
+
+def apply_deltas(deltas):
+    """Apply ``{sub_area_id: {'free': -1, 'reserved': 1, ...}}`` to both levels."""
+    from .models import AreaOccupancy, SubAreaOccupancy
+
+    for sub_area_id, delta in deltas.items():
+        changes = _changes(delta)
+        if changes:
+            SubAreaOccupancy.objects.filter(sub_area_id=sub_area_id).update(**changes)
+            AreaOccupancy.objects.filter(area__subareas=sub_area_id).update(**changes)
+
+
+def record(sub_area_id, **delta):
+    apply_deltas({sub_area_id: delta})
+
+
+def record_for_slot(slot_id, **delta):
+    """Like ``record`` but keyed by slot, resolved inside the UPDATEs."""
+    from .models import AreaOccupancy, SubAreaOccupancy
+
+    changes = _changes(delta)
+    if changes:
+        SubAreaOccupancy.objects.filter(sub_area__parkingslots=slot_id).update(**changes)
+        AreaOccupancy.objects.filter(area__subareas__parkingslots=slot_id).update(**changes)
+
+
+@contextmanager
+def suspended():
+    """Saves and deletes in this block (this thread) leave the counters alone."""
+    _local.depth = getattr(_local, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _local.depth -= 1
+
+
+def tracking():
+    return not getattr(_local, 'depth', 0)
+
+
+def slot_changed(slot_id, old, new):
+    """Count a slot edit; ``old`` and ``new`` are (sub_area_id, is_available)."""
+    from .models import Booking
+
+    (old_sub_area_id, was_free), (sub_area_id, free) = old, new
+    if old_sub_area_id == sub_area_id:
+        record(sub_area_id, free=int(free) - int(was_free))
+        return
+    # Moved: its live bookings move with it
+    live = Counter(Booking.objects.filter(
+        parking_slot_id=slot_id, status__in=Booking.LIVE_STATUSES
+    ).values_list('status', flat=True))
+    apply_deltas({
+        old_sub_area_id: {'total': -1, 'free': -int(was_free), **{status: -n for status, n in live.items()}},
+        sub_area_id: {'total': 1, 'free': int(free), **live},
+    })
+
+
+def booking_changed(old, new):
+    """Count a booking edit; ``old`` and ``new`` are (slot_id, status) or None."""
+    from .models import Booking
+
+    deltas = defaultdict(Counter)
+    for state, sign in ((old, -1), (new, 1)):
+        if state is not None and state[1] in Booking.LIVE_STATUSES:
+            deltas[state[0]][state[1]] += sign
+    for slot_id, delta in deltas.items():
+        record_for_slot(slot_id, **delta)
+
+
+def for_areas(area_ids=None):
+    """``{area_id: {'total': .., 'free': .., 'reserved': .., 'active': ..}}`` in one query."""
+    from .models import AreaOccupancy
+
+    rows = AreaOccupancy.objects.all()
+    if area_ids is not None:
+        rows = rows.filter(area_id__in=area_ids)
+    return {
+        area_id: dict(zip(COUNTERS, counts))
+        for area_id, *counts in rows.values_list(
+            'area_id', 'total_slots', 'free_slots', 'reserved_slots', 'active_slots'
+        )
+    }
+
+
+def recount():
+    """Recompute every counter from ParkingSlot and Booking; returns sub-areas counted."""
+    from .models import Area, AreaOccupancy, Booking, SubArea, SubAreaOccupancy
+
+    counts = defaultdict(Counter)
+    slot_counts = SubArea.objects.values_list('id').annotate(
+        total=Count('parkingslots'),
+        free=Count('parkingslots', filter=Q(parkingslots__is_available=True)),
+    )
+    for sub_area_id, total, free in slot_counts:
+        counts[sub_area_id].update(total=total, free=free)
+    booking_counts = Booking.objects.filter(status__in=Booking.LIVE_STATUSES).values_list(
+        'parking_slot__sub_area_id', 'status'
+    ).annotate(n=Count('id')).order_by()
+    for sub_area_id, status, n in booking_counts:
+        counts[sub_area_id][status] += n
+
+    area_of = dict(SubArea.objects.values_list('id', 'area_id'))
+    area_counts = {area_id: Counter() for area_id in Area.objects.values_list('id', flat=True)}
+    for sub_area_id, counter in counts.items():
+        area_counts[area_of[sub_area_id]].update(counter)
+
+    with transaction.atomic():
+        SubAreaOccupancy.objects.all().delete()
+        SubAreaOccupancy.objects.bulk_create(
+            SubAreaOccupancy(sub_area_id=sub_area_id, **{f'{n}_slots': counter[n] for n in COUNTERS})
+            for sub_area_id, counter in counts.items()
+        )
+        AreaOccupancy.objects.all().delete()
+        AreaOccupancy.objects.bulk_create(
+            AreaOccupancy(area_id=area_id, **{f'{n}_slots': counter[n] for n in COUNTERS})
+            for area_id, counter in area_counts.items()
+        )
+    return len(counts)
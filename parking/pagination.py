@@ -0,0 +1,140 @@
+"""
+Keyset (seek) pagination for newest-first lists.
+
+Pages are addressed by the (timestamp, id) of a boundary row rather than an
+OFFSET, so every page costs one index range scan of ``page_size + 1`` rows
+however deep into the history it is.
+
+EstimatedCountPaginator serves the admin changelists of large tables.
+"""
+import base64
+import binascii
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+
+class KeysetPage:
+    def __init__(self, items, newer_cursor=None, older_cursor=None):
+        self.items = items
+        self.newer_cursor = newer_cursor
+        self.older_cursor = older_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_newer(self):
+        return self.newer_cursor is not None
+
+    @property
+    def has_older(self):
+        return self.older_cursor is not None
+
+
+def encode_cursor(timestamp, pk):
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{pk}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(timestamp, pk) from a cursor, or None if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, pk = raw.split('|')
+        timestamp = parse_datetime(timestamp)
+        return (timestamp, int(pk)) if timestamp is not None else None
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def keyset_page(queryset, before=None, after=None, page_size=20, field='reservation_time'):
+    """One page of ``queryset`` ordered by ``-field, -pk``.
+
+    ``before`` pages towards older rows and ``after`` towards newer ones;
+    both are cursors taken from a previous page. Bad cursors give the first page.
+    """
+    before = decode_cursor(before) if before else None
+    after = decode_cursor(after) if after else None
+
+    if after is not None:
+        timestamp, pk = after
+        rows = list(
+            queryset.filter(Q(**{f'{field}__gt': timestamp}) | Q(**{field: timestamp, 'pk__gt': pk}))
+            .order_by(field, 'pk')[:page_size + 1]
+        )
+        has_newer = len(rows) > page_size
+        items = rows[:page_size][::-1]
+        has_older = True
+    else:
+        if before is not None:
+            timestamp, pk = before
+            queryset = queryset.filter(Q(**{f'{field}__lt': timestamp}) | Q(**{field: timestamp, 'pk__lt': pk}))
+        rows = list(queryset.order_by(f'-{field}', '-pk')[:page_size + 1])
+        has_older = len(rows) > page_size
+        items = rows[:page_size]
+        has_newer = before is not None
+
+    if not items:
+        return KeysetPage(items)
+    first, last = items[0], items[-1]
+    return KeysetPage(
+        items,
+        newer_cursor=encode_cursor(getattr(first, field), first.pk) if has_newer else None,
+        older_cursor=encode_cursor(getattr(last, field), last.pk) if has_older else None,
+    )
+
+
+# -------------------------------
+# Admin changelists
+# -------------------------------
+def estimated_count(model):
+    """Row count of ``model``'s table from database statistics, or None.
+
+    PostgreSQL keeps one in pg_class; SQLite has one in sqlite_stat1 once
+    ANALYZE has run, and otherwise the highest rowid is a close upper bound
+    for tables rows are rarely deleted from.
+    """
+    from django.db import connections, router
+    from django.db.models import Max
+
+    db = router.db_for_read(model)
+    connection = connections[db]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)', [table])
+            row = cursor.fetchone()
+            # -1 until the table has been vacuumed or analyzed
+            return int(row[0]) if row and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            cursor.execute("SELECT name FROM sqlite_master WHERE name = 'sqlite_stat1'")
+            if cursor.fetchone():
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+                row = cursor.fetchone()
+                if row:
+                    return int(row[0].split()[0])
+            return model._default_manager.using(db).aggregate(top=Max('pk'))['top'] or 0
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that skips COUNT(*) for the unfiltered list of a large table.
+
+    Below PARKING_ADMIN_EXACT_COUNT_LIMIT rows, and for any filtered list,
+    the count is exact.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = estimated_count(self.object_list.model)
+            if estimate is not None and estimate > getattr(settings, 'PARKING_ADMIN_EXACT_COUNT_LIMIT', 100000):
+                return estimate
+        return super().count
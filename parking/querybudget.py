@@ -0,0 +1,112 @@
+"""
+Per-request database query budgets.
+
+QueryBudgetMiddleware wraps every query a request runs on its thread's
+connections (``connection.execute_wrapper``) and counts them along with
+their time. Budgets are looked up by the resolved view name in
+PARKING_QUERY_BUDGETS: ``'parking:dashboard'``, then its namespace
+(``'admin'``), then ``'default'``; each is a dict with ``queries`` and/or
+``time_ms``. A request over budget is logged with the statements it ran
+more than once, normalised to fingerprints so an N+1 loop shows up as one
+line with its repeat count.
+
+With PARKING_QUERY_BUDGET_RAISE (on under ``manage.py test``) going over
+the query budget raises QueryBudgetExceeded instead; DB time is only
+logged, as timings are too noisy to fail tests on. Queries run after the
+response is returned (streamed bodies) are not counted.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Duplicates listed per over-budget log line
+REPORTED_DUPLICATES = 5
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def fingerprint(sql):
+    """``sql`` with literals and placeholders as ``?`` and IN lists as ``(...)``."""
+    sql = _LITERALS.sub('?', sql.replace('%s', '?'))
+    return ' '.join(_PLACEHOLDER_LISTS.sub('(...)', sql).split())
+
+
+class QueryRecorder:
+    """execute_wrapper that tallies queries, their time and their fingerprints."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def time_ms(self):
+        return self.seconds * 1000
+
+    def duplicates(self, limit=REPORTED_DUPLICATES):
+        return [(sql, n) for sql, n in self.fingerprints.most_common(limit) if n > 1]
+
+
+def get_budget(view_name):
+    """``{'queries': ..., 'time_ms': ...}`` for a view, either may be None."""
+    budgets = getattr(settings, 'PARKING_QUERY_BUDGETS', None) or {}
+    budget = {'queries': None, 'time_ms': None}
+    keys = ['default']
+    if view_name:
+        keys += [view_name.rpartition(':')[0], view_name]
+    for key in keys:
+        budget.update(budgets.get(key) or {})
+    return budget
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'PARKING_QUERY_BUDGETS', None):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for connection in connections.all(initialized_only=False):
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        request.query_stats = recorder
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else None
+        budget = get_budget(view_name)
+        over_queries = budget['queries'] is not None and recorder.count > budget['queries']
+        over_time = budget['time_ms'] is not None and recorder.time_ms > budget['time_ms']
+        if over_queries or over_time:
+            message = (
+                f"{view_name or request.path}: {recorder.count} queries in {recorder.time_ms:.1f} ms "
+                f"(budget {budget['queries']} queries, {budget['time_ms']} ms)"
+            )
+            repeated = ''.join(f"\n  {n}x {sql}" for sql, n in recorder.duplicates())
+            if over_queries and getattr(settings, 'PARKING_QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message + repeated)
+            logger.warning(message + repeated)
+        return response
@@ -0,0 +1,345 @@
+"""
+Incremental daily rollups for reporting.
+
+``refresh_feedback_rollups`` rolls complete days of Feedback into
+FeedbackDailyRollup and advances the 'feedback_daily' RollupWatermark to the
+start of the first day not rolled up yet (normally today). Reports read the
+rollups for days before the watermark and count the rows after it live, so
+their cost grows with the number of days, not the number of rows.
+
+``refresh_booking_rollups`` does the same per hour for bookings
+(BookingHourlyRollup, watermark 'booking_hourly'), spreading the work for
+each area over a process pool.
+
+Run by the background runner and the refresh_rollups command.
+"""
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connections, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractHour, TruncDate, TruncHour
+from django.utils import timezone
+
+FEEDBACK_WATERMARK = 'feedback_daily'
+BOOKING_WATERMARK = 'booking_hourly'
+
+ROLLUP_FIELDS = ('occupied_minutes', 'bookings', 'revenue')
+
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def get_watermark(name):
+    from .models import RollupWatermark
+
+    return RollupWatermark.objects.filter(name=name).values_list('position', flat=True).first()
+
+
+def set_watermark(name, position):
+    from .models import RollupWatermark
+
+    RollupWatermark.objects.update_or_create(name=name, defaults={'position': position})
+
+
+def claim_watermark(name, expected, position):
+    """Move the watermark from ``expected`` to ``position``; False if it has moved.
+
+    Run it first in the transaction that writes the rollups: the conditional
+    UPDATE locks the row, so of two runs that read the same watermark only
+    one merges its window.
+    """
+    from .models import RollupWatermark
+
+    return RollupWatermark.objects.filter(name=name, position=expected).update(
+        position=position, updated_at=timezone.now()
+    ) == 1
+
+
+# -------------------------------
+# Feedback
+# -------------------------------
+def _tally_feedback(queryset, by_day=True):
+    """One grouped query over ``queryset``: ``{day: {dimension: Counter}}``.
+
+    With ``by_day=False`` everything lands under the key None.
+    """
+    from .models import FeedbackDailyRollup
+
+    dimensions = FeedbackDailyRollup.DIMENSIONS
+    fields = (['day'] if by_day else []) + list(dimensions)
+    if by_day:
+        queryset = queryset.annotate(day=TruncDate('submitted_on'))
+    tallies = defaultdict(lambda: {dimension: Counter() for dimension in dimensions})
+    for *group, n in queryset.order_by().values_list(*fields).annotate(n=Count('id')):
+        day = group.pop(0) if by_day else None
+        for dimension, value in zip(dimensions, group):
+            tallies[day][dimension]['' if value is None else str(value)] += n
+    return tallies
+
+
+def refresh_feedback_rollups(full=False, today=None):
+    """Roll every complete day since the watermark; returns the days written."""
+    from .models import Feedback, FeedbackDailyRollup
+
+    today = today or timezone.localdate()
+    end = start_of_day(today)
+    start = None if full else get_watermark(FEEDBACK_WATERMARK)
+    if start is not None and start >= end:
+        return 0
+    feedback = Feedback.objects.filter(submitted_on__lt=end)
+    if start is not None:
+        feedback = feedback.filter(submitted_on__gte=start)
+    tallies = _tally_feedback(feedback)
+
+    rows = [
+        FeedbackDailyRollup(day=day, dimension=dimension, value=value, count=n)
+        for day, by_dimension in tallies.items()
+        for dimension, counter in by_dimension.items()
+        for value, n in counter.items()
+    ]
+    with transaction.atomic():
+        stale = FeedbackDailyRollup.objects.filter(day__lt=today)
+        if start is not None:
+            stale = stale.filter(day__gte=timezone.localtime(start).date())
+        stale.delete()
+        FeedbackDailyRollup.objects.bulk_create(rows)
+        set_watermark(FEEDBACK_WATERMARK, end)
+    return len(tallies)
+
+
+def feedback_summary(since_day=None):
+    """Totals per dimension for feedback from ``since_day`` (None: all time) until now.
+
+    Rollups cover the days before the watermark; rows after it are counted
+    live in one grouped query. Returns ``{dimension: Counter}``.
+    """
+    from .models import Feedback, FeedbackDailyRollup
+
+    watermark = get_watermark(FEEDBACK_WATERMARK)
+    summary = {dimension: Counter() for dimension in FeedbackDailyRollup.DIMENSIONS}
+
+    live = Feedback.objects.all()
+    if watermark is not None:
+        rollups = FeedbackDailyRollup.objects.filter(day__lt=timezone.localtime(watermark).date())
+        if since_day is not None:
+            rollups = rollups.filter(day__gte=since_day)
+        for dimension, value, n in rollups.values_list('dimension', 'value').annotate(n=Sum('count')).order_by():
+            summary[dimension][value] += n
+        live = live.filter(submitted_on__gte=watermark)
+    if since_day is not None:
+        live = live.filter(submitted_on__gte=start_of_day(since_day))
+    for dimension, counter in _tally_feedback(live, by_day=False)[None].items():
+        summary[dimension].update(counter)
+    return summary
+
+
+def rollup_days(days):
+    """First day of a window of ``days`` days ending today."""
+    return timezone.localdate() - timedelta(days=days - 1)
+
+
+# -------------------------------
+# Bookings
+# -------------------------------
+def start_of_hour(moment):
+    # Local hours, like TruncHour
+    return timezone.localtime(moment).replace(minute=0, second=0, microsecond=0)
+
+
+def _split_by_hour(start, end):
+    """``(hour, minutes)`` for each hour the interval [start, end) overlaps."""
+    hour = start_of_hour(start)
+    while hour < end:
+        next_hour = hour + timedelta(hours=1)
+        minutes = (min(end, next_hour) - max(start, hour)).total_seconds() / 60
+        if minutes > 0:
+            yield hour, minutes
+        hour = next_hour
+
+
+def booking_facts(area_id, start, end):
+    """Hourly facts for one area from the bookings in the window [start, end).
+
+    Completed sessions that ended in the window add their slot-minutes to
+    every hour they spanned, which may lie before ``start``, and their
+    amount to the hour they ended in. Bookings made in the window are
+    counted in the hour they were made. ``start`` None means from the
+    beginning. Returns ``{(hour, sub_area_id, slot_type, vehicle_type):
+    [minutes, bookings, revenue]}``.
+
+    Runs in a worker process when rollups are refreshed in parallel.
+    """
+    from .models import Booking
+
+    bookings = Booking.objects.filter(parking_slot__sub_area__area_id=area_id).order_by()
+    facts = defaultdict(lambda: [0.0, 0, Decimal('0')])
+
+    sessions = bookings.filter(status='completed', end_time__lt=end, start_time__isnull=False)
+    if start is not None:
+        sessions = sessions.filter(end_time__gte=start)
+    for started, ended, amount, sub_area_id, slot_type, vehicle_type in sessions.values_list(
+        'start_time', 'end_time', 'amount', 'parking_slot__sub_area_id', 'parking_slot__slot_type', 'vehicle_type'
+    ).iterator(chunk_size=2000):
+        for hour, minutes in _split_by_hour(started, ended):
+            facts[(hour, sub_area_id, slot_type, vehicle_type)][0] += minutes
+        facts[(start_of_hour(ended), sub_area_id, slot_type, vehicle_type)][2] += amount or 0
+
+    made = bookings.filter(reservation_time__lt=end)
+    if start is not None:
+        made = made.filter(reservation_time__gte=start)
+    for hour, sub_area_id, slot_type, vehicle_type, n in made.annotate(
+        made_in=TruncHour('reservation_time')
+    ).values_list(
+        'made_in', 'parking_slot__sub_area_id', 'parking_slot__slot_type', 'vehicle_type'
+    ).annotate(n=Count('id')):
+        facts[(hour, sub_area_id, slot_type, vehicle_type)][1] += n
+
+    return dict(facts)
+
+
+def _init_worker():
+    import django
+
+    django.setup()
+
+
+def _collect_booking_facts(area_ids, start, end, workers):
+    """``{area_id: facts}``, computed in a pool of ``workers`` processes if above 1."""
+    if workers <= 1 or len(area_ids) <= 1:
+        return {area_id: booking_facts(area_id, start, end) for area_id in area_ids}
+    # Children must open their own connections, not share the parent's
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=min(workers, len(area_ids)), initializer=_init_worker) as pool:
+        futures = {area_id: pool.submit(booking_facts, area_id, start, end) for area_id in area_ids}
+        return {area_id: future.result() for area_id, future in futures.items()}
+
+
+def _rollup_rows(by_area):
+    from .models import BookingHourlyRollup
+
+    rows = {}
+    for area_id, facts in by_area.items():
+        for (hour, sub_area_id, slot_type, vehicle_type), values in facts.items():
+            rows[(hour, sub_area_id, slot_type, vehicle_type)] = BookingHourlyRollup(
+                hour=hour, area_id=area_id, sub_area_id=sub_area_id, slot_type=slot_type,
+                vehicle_type=vehicle_type, **dict(zip(ROLLUP_FIELDS, values)),
+            )
+    return rows
+
+
+def _write_rollups(rows):
+    from .models import BookingHourlyRollup
+
+    BookingHourlyRollup.objects.bulk_create(
+        rows.values(),
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['hour', 'sub_area', 'slot_type', 'vehicle_type'],
+        update_fields=list(ROLLUP_FIELDS),
+    )
+
+
+def _recompute_booking_rollups(start, end, area_ids, workers):
+    """Rewrite the rolled-up hours in [start, end) from the bookings.
+
+    ``end`` is the watermark: no hour after it has rollups yet. Sessions
+    that ended in the window but began before ``start`` keep the minutes
+    earlier runs gave the hours before it.
+    """
+    from .models import BookingHourlyRollup
+
+    while True:
+        rows = _rollup_rows(_collect_booking_facts(area_ids, start, end, workers))
+        rows = {key: row for key, row in rows.items() if key[0] >= start}
+        with transaction.atomic():
+            # A run that moved the watermark meanwhile merged into these hours
+            if claim_watermark(BOOKING_WATERMARK, end, end):
+                BookingHourlyRollup.objects.filter(hour__gte=start).delete()
+                _write_rollups(rows)
+                return len(rows)
+        end = get_watermark(BOOKING_WATERMARK)
+        if end is None or end <= start:
+            return 0
+
+
+def refresh_booking_rollups(full=False, now=None, workers=None, since=None):
+    """Roll every complete hour since the watermark; returns the rows written.
+
+    ``workers`` defaults to PARKING_ROLLUP_WORKERS, or the CPU count.
+    Sessions still running are picked up by the run after they complete.
+    ``since`` is for bookings inserted behind the watermark (bulk imports)
+    that neither started nor were made before it: the hours from then to
+    the watermark are recomputed first.
+    """
+    from django.conf import settings
+
+    from .models import Area, BookingHourlyRollup
+
+    end = start_of_hour(now or timezone.now())
+    start = None if full else get_watermark(BOOKING_WATERMARK)
+    if workers is None:
+        workers = getattr(settings, 'PARKING_ROLLUP_WORKERS', None) or os.cpu_count() or 1
+    area_ids = list(Area.objects.values_list('id', flat=True))
+    written = 0
+    if since is not None and start is not None and since < start:
+        written = _recompute_booking_rollups(start_of_hour(since), start, area_ids, workers)
+    if start is not None and start >= end:
+        return written
+    rows = _rollup_rows(_collect_booking_facts(area_ids, start, end, workers))
+
+    with transaction.atomic():
+        if start is None:
+            BookingHourlyRollup.objects.all().delete()
+            set_watermark(BOOKING_WATERMARK, end)
+        elif not claim_watermark(BOOKING_WATERMARK, start, end):
+            # Another run rolled this window up first
+            return written
+        elif rows:
+            # Facts add up: long sessions land in hours rolled up by earlier runs
+            existing = BookingHourlyRollup.objects.filter(
+                hour__in={key[0] for key in rows}, sub_area_id__in={key[1] for key in rows}
+            )
+            for rollup in existing:
+                row = rows.get((rollup.hour, rollup.sub_area_id, rollup.slot_type, rollup.vehicle_type))
+                if row is not None:
+                    for field in ROLLUP_FIELDS:
+                        setattr(row, field, getattr(row, field) + getattr(rollup, field))
+        _write_rollups(rows)
+    return written + len(rows)
+
+
+def booking_summary(since, area_id=None):
+    """Booking facts from the hour ``since`` on, read only from the rollups.
+
+    Returns lists of dicts with occupied_hours, bookings and revenue per day
+    (``daily``), per hour of day (``by_hour``), per area (``by_area``) and
+    per slot and vehicle type (``by_type``).
+    """
+    from .models import BookingHourlyRollup
+
+    rollups = BookingHourlyRollup.objects.filter(hour__gte=since).order_by()
+    if area_id is not None:
+        rollups = rollups.filter(area_id=area_id)
+    totals = {
+        'occupied_minutes': Sum('occupied_minutes'),
+        'bookings': Sum('bookings'),
+        'revenue': Sum('revenue'),
+    }
+
+    def grouped(queryset, *fields):
+        rows = list(queryset.values(*fields).annotate(**totals).order_by(*fields))
+        for row in rows:
+            row['occupied_hours'] = round((row.pop('occupied_minutes') or 0) / 60, 1)
+        return rows
+
+    return {
+        'daily': grouped(rollups.annotate(day=TruncDate('hour')), 'day'),
+        'by_hour': grouped(rollups.annotate(hour_of_day=ExtractHour('hour')), 'hour_of_day'),
+        'by_area': grouped(rollups, 'area_id', 'area__name'),
+        'by_type': grouped(rollups, 'slot_type', 'vehicle_type'),
+    }
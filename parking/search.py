@@ -0,0 +1,309 @@
+"""
+Ranked search over Area and SubArea names and descriptions.
+
+Two indexes back it:
+
+- an SQLite FTS5 table (``parking_search``, created by migration 0018 when
+  the SQLite build has FTS5), used for ranked full-text search and kept
+  current by the Area/SubArea signals in ``parking.signals``;
+- an in-memory prefix trie built from the cached inventory and rebuilt
+  whenever the inventory version changes. It answers autocomplete without
+  touching the database, and stands in for search where FTS5 is missing
+  (other databases, or an SQLite build without it).
+"""
+import logging
+import re
+import threading
+import unicodedata
+
+from django.db import DatabaseError, connection
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'parking_search'
+
+# Relative weight of a match in each field
+NAME_WEIGHT = 10.0
+AREA_NAME_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 1.0
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _TOKEN_RE.findall(text.casefold())
+
+
+# -------------------------------
+# In-memory prefix trie
+# -------------------------------
+class PrefixTrie:
+    """Maps every prefix of every indexed token to ``{doc: weight}``.
+
+    Postings are stored on each prefix node, so a lookup is one walk down
+    the query token and no subtree traversal.
+    """
+
+    def __init__(self):
+        self._root = {}
+
+    def add(self, token, doc, weight):
+        node = self._root
+        for ch in token:
+            node = node.setdefault(ch, {})
+            postings = node.setdefault('', {})
+            if postings.get(doc, 0) < weight:
+                postings[doc] = weight
+        # Exact-token matches rank above prefix matches
+        exact = node.setdefault('=', {})
+        if exact.get(doc, 0) < weight:
+            exact[doc] = weight
+
+    def lookup(self, prefix):
+        """``{doc: score}`` for docs with a token starting with ``prefix``."""
+        node = self._root
+        for ch in prefix:
+            node = node.get(ch)
+            if node is None:
+                return {}
+        matches = dict(node.get('', {}))
+        for doc, weight in node.get('=', {}).items():
+            matches[doc] += weight / 2
+        return matches
+
+
+class TrieIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._trie = PrefixTrie()
+        self._docs = {}
+
+    def _current(self):
+        from .inventory import get_inventory, get_version
+
+        version = get_version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._build(get_inventory(copy=False))
+                    self._version = version
+        return self._trie, self._docs
+
+    def _build(self, inventory):
+        trie, docs = PrefixTrie(), {}
+        for area in inventory:
+            doc = ('area', area['id'])
+            docs[doc] = {'kind': 'area', 'id': area['id'], 'area_id': area['id'], 'name': area['name']}
+            self._add_fields(trie, doc, (area['name'], NAME_WEIGHT), (area['description'], DESCRIPTION_WEIGHT))
+            for subarea in area['subareas']:
+                doc = ('subarea', subarea['id'])
+                docs[doc] = {
+                    'kind': 'subarea', 'id': subarea['id'], 'area_id': area['id'],
+                    'name': f"{subarea['name']}, {area['name']}",
+                }
+                self._add_fields(
+                    trie, doc,
+                    (subarea['name'], NAME_WEIGHT),
+                    (area['name'], AREA_NAME_WEIGHT),
+                    (subarea['description'], DESCRIPTION_WEIGHT),
+                )
+        self._trie, self._docs = trie, docs
+
+    @staticmethod
+    def _add_fields(trie, doc, *fields):
+        for text, weight in fields:
+            for token in tokenize(text):
+                trie.add(token, doc, weight)
+
+    def search(self, query, limit=20):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        trie, docs = self._current()
+        scores = None
+        for token in tokens:
+            matches = trie.lookup(token)
+            if scores is None:
+                scores = matches
+            else:
+                # Every token has to match (AND), scores add up
+                scores = {doc: score + matches[doc] for doc, score in scores.items() if doc in matches}
+            if not scores:
+                return []
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], docs[item[0]]['name']))
+        return [dict(docs[doc], score=score) for doc, score in ranked[:limit]]
+
+
+trie_index = TrieIndex()
+
+
+# -------------------------------
+# SQLite FTS5 index
+# -------------------------------
+_fts_state = {'available': None}
+
+
+def fts_supported(conn=connection):
+    """Whether this SQLite build can create FTS5 tables."""
+    if conn.vendor != 'sqlite':
+        return False
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if cursor.fetchone()[0]:
+            return True
+        try:
+            cursor.execute("CREATE VIRTUAL TABLE temp.parking_fts5_probe USING fts5(x)")
+            cursor.execute("DROP TABLE temp.parking_fts5_probe")
+            return True
+        except DatabaseError:
+            return False
+
+
+def fts_available():
+    if _fts_state['available'] is None:
+        try:
+            _fts_state['available'] = (
+                connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+            )
+        except DatabaseError:
+            return False
+    return _fts_state['available']
+
+
+def reset_fts_state():
+    # After switching databases
+    _fts_state['available'] = None
+
+
+def create_fts_table(schema_editor):
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "kind UNINDEXED, object_id UNINDEXED, area_id UNINDEXED, name, area_name, description, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    _fts_state['available'] = None
+
+
+def _fts_match_expression(tokens):
+    # Each token as a quoted prefix query; adjacent terms are ANDed
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def fts_search(query, limit=20):
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT kind, object_id, area_id, name, area_name, "
+            f"bm25({FTS_TABLE}, 0, 0, 0, %s, %s, %s) AS rank "
+            f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rank, kind, name LIMIT %s",
+            [NAME_WEIGHT, AREA_NAME_WEIGHT, DESCRIPTION_WEIGHT, _fts_match_expression(tokens), limit],
+        )
+        rows = cursor.fetchall()
+    return [
+        {
+            'kind': kind, 'id': int(object_id), 'area_id': int(area_id),
+            'name': f"{name}, {area_name}" if kind == 'subarea' else name,
+            'score': -rank,
+        }
+        for kind, object_id, area_id, name, area_name, rank in rows
+    ]
+
+
+def _fts_replace(cursor, rows):
+    for kind, object_id, *_ in rows:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE kind = %s AND object_id = %s", [kind, object_id])
+    cursor.executemany(
+        f"INSERT INTO {FTS_TABLE} (kind, object_id, area_id, name, area_name, description) "
+        "VALUES (%s, %s, %s, %s, %s, %s)",
+        rows,
+    )
+
+
+def index_area(area_id):
+    """(Re)index an area and its sub-areas, which carry its name."""
+    from .models import Area, SubArea
+
+    if not fts_available():
+        return
+    area = Area.objects.filter(pk=area_id).values_list('id', 'name', 'description').first()
+    if area is None:
+        return remove('area', area_id)
+    rows = [('area', area[0], area[0], area[1], '', area[2])]
+    rows += [
+        ('subarea', subarea_id, area[0], name, area[1], description)
+        for subarea_id, name, description in SubArea.objects.filter(area_id=area_id).values_list(
+            'id', 'name', 'description'
+        )
+    ]
+    with connection.cursor() as cursor:
+        _fts_replace(cursor, rows)
+
+
+def index_subarea(subarea_id):
+    from .models import SubArea
+
+    if not fts_available():
+        return
+    subarea = SubArea.objects.filter(pk=subarea_id).values_list(
+        'id', 'area_id', 'name', 'area__name', 'description'
+    ).first()
+    if subarea is None:
+        return remove('subarea', subarea_id)
+    with connection.cursor() as cursor:
+        _fts_replace(cursor, [('subarea', *subarea)])
+
+
+def remove(kind, object_id):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE kind = %s AND object_id = %s", [kind, object_id])
+
+
+def rebuild():
+    """Repopulate the FTS5 table from scratch; returns documents indexed."""
+    from .models import Area, SubArea
+
+    if not fts_available():
+        return 0
+    rows = [
+        ('area', area_id, area_id, name, '', description)
+        for area_id, name, description in Area.objects.values_list('id', 'name', 'description')
+    ]
+    rows += [
+        ('subarea', subarea_id, area_id, name, area_name, description)
+        for subarea_id, area_id, name, area_name, description in SubArea.objects.values_list(
+            'id', 'area_id', 'name', 'area__name', 'description'
+        )
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (kind, object_id, area_id, name, area_name, description) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            rows,
+        )
+    return len(rows)
+
+
+# -------------------------------
+# Public entry points
+# -------------------------------
+def search(query, limit=20):
+    """Ranked hits (dicts with kind, id, area_id, name, score), best first."""
+    if fts_available():
+        try:
+            return fts_search(query, limit)
+        except DatabaseError as e:
+            logger.warning(f"FTS search failed, using the in-memory index: {e}")
+    return trie_index.search(query, limit)
+
+
+def autocomplete(query, limit=8):
+    """Prefix completions from the in-memory index; no database access."""
+    return trie_index.search(query, limit)
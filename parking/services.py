@@ -0,0 +1,298 @@
+"""
+Booking lifecycle services shared by the views, management commands and any
+future API. Each state change runs in its own transaction.
+"""
+import logging
+import random
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from . import instrumentation, occupancy
+from .availability import availability_index, touch_slots
+from .events import publish_slots
+from .models import Booking, ParkingSlot
+from .tariffs import price_bookings
+
+logger = logging.getLogger(__name__)
+
+# Grace period between reserving a slot and starting to park
+RESERVATION_GRACE_PERIOD = timedelta(minutes=15)
+
+# Attempts after the first when the database reports lock contention
+RESERVATION_RETRIES = 3
+RESERVATION_RETRY_DELAY = 0.05  # seconds, doubled on every retry
+
+# Reservations expired per transaction
+EXPIRY_CHUNK_SIZE = 500
+
+
+class SlotUnavailableError(ValidationError):
+    pass
+
+
+class BookingStateError(ValidationError):
+    pass
+
+
+# -------------------------------
+# Reserve a slot
+# -------------------------------
+def reserve_slot(user, slot, vehicle_type, vehicle_number, start_time, end_time, retries=RESERVATION_RETRIES):
+    """Claim ``slot`` for the window and create the reservation atomically.
+
+    Raises SlotUnavailableError if a live booking overlaps the window.
+    Lock timeouts and serialisation failures are retried with backoff.
+    """
+    slot_id = getattr(slot, 'pk', slot)
+    for attempt in range(retries + 1):
+        try:
+            booking = _claim_and_book(user, slot_id, vehicle_type, vehicle_number, start_time, end_time)
+        except OperationalError as e:
+            if attempt == retries:
+                raise
+            delay = RESERVATION_RETRY_DELAY * (2 ** attempt)
+            logger.debug(f"Reservation of slot {slot_id} hit contention ({e}); retrying in {delay:.2f}s.")
+            time.sleep(delay * (1 + random.random()))
+            continue
+        if isinstance(slot, ParkingSlot):
+            slot.is_available = False
+            booking.parking_slot = slot
+        return booking
+
+
+def _claim_and_book(user, slot_id, vehicle_type, vehicle_number, start_time, end_time):
+    overlapping = Booking.objects.filter(
+        parking_slot=OuterRef('pk'),
+        status__in=Booking.LIVE_STATUSES,
+        start_time__lt=end_time,
+        end_time__gt=start_time,
+    )
+    with transaction.atomic():
+        slots = ParkingSlot.objects.filter(pk=slot_id)
+        if connection.features.has_select_for_update:
+            # Row-locking backends: serialise claimers on the slot row so the
+            # overlap check below sees every booking committed before us.
+            list(slots.select_for_update().values_list('pk', flat=True))
+
+        # Conditional UPDATE: claims the slot only if nothing overlaps. On
+        # SQLite this is the first write, so it runs under the write lock.
+        # The common case (slot currently free) is a single statement; the
+        # second one only runs for slots already held for another window.
+        free_before = slots.filter(~Exists(overlapping), is_available=True).update(is_available=False)
+        claimed = free_before or slots.filter(~Exists(overlapping)).update(is_available=False)
+        if not claimed:
+            raise SlotUnavailableError("The selected parking slot is already booked during this time.")
+
+        occupancy.record_for_slot(slot_id, free=-free_before, reserved=1)
+        _publish_on_commit('reserved', [slot_id])
+
+        reservation_time = timezone.now()
+        with occupancy.suspended():
+            return Booking.objects.create(
+                user=user,
+                parking_slot_id=slot_id,
+                vehicle_type=vehicle_type,
+                vehicle_number=vehicle_number,
+                start_time=start_time,
+                end_time=end_time,
+                status='reserved',
+                reservation_time=reservation_time,
+                expiry_time=reservation_time + RESERVATION_GRACE_PERIOD,
+            )
+
+
+# -------------------------------
+# Start / end a parking session
+# -------------------------------
+def start_parking_session(booking, now=None):
+    """reserved -> active, as long as the grace period has not run out."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        started = Booking.objects.filter(
+            pk=booking.pk, status='reserved', expiry_time__gte=now
+        ).update(status='active', start_time=now)
+        if not started:
+            raise BookingStateError("Your booking has expired or is invalid.")
+        occupancy.record_for_slot(booking.parking_slot_id, reserved=-1, active=1)
+        booking.status, booking.start_time = 'active', now
+        _sync_index_on_commit(booking)
+        _publish_on_commit('started', [booking.parking_slot_id])
+    return booking
+
+
+def end_parking_session(booking, now=None):
+    """active -> completed, charging every started hour at the tariff rates."""
+    now = now or timezone.now()
+    if booking.status != 'active' or booking.start_time is None:
+        # Nothing to price; the conditional UPDATE below still guards stale instances
+        raise BookingStateError("Invalid booking status.")
+    amount = price_bookings([booking], end=now)[0]
+    with transaction.atomic():
+        ended = Booking.objects.filter(pk=booking.pk, status='active').update(
+            status='completed', end_time=now, amount=amount
+        )
+        if not ended:
+            raise BookingStateError("Invalid booking status.")
+        occupancy.record_for_slot(booking.parking_slot_id, active=-1)
+        booking.status, booking.end_time, booking.amount = 'completed', now, amount
+        _sync_index_on_commit(booking)
+        _publish_on_commit('ended', [booking.parking_slot_id])
+    return booking
+
+
+# -------------------------------
+# Payment and cancellation
+# -------------------------------
+def record_payment(booking):
+    """Mark the booking paid and give its slot back."""
+    with transaction.atomic():
+        Booking.objects.filter(pk=booking.pk).update(paid=True)
+        released = _release_slots([booking.parking_slot_id])
+        occupancy.record_for_slot(booking.parking_slot_id, free=len(released))
+        transaction.on_commit(lambda: touch_slots(booking.parking_slot_id))
+        _publish_on_commit('paid', [booking.parking_slot_id])
+    booking.paid = True
+    return booking
+
+
+def cancel_reservation(booking):
+    """Delete the booking and give its slot back."""
+    status, slot_id = booking.status, booking.parking_slot_id
+    with transaction.atomic():
+        with occupancy.suspended():
+            booking.delete()
+        released = _release_slots([slot_id])
+        occupancy.record_for_slot(
+            slot_id,
+            free=len(released),
+            reserved=-(status == 'reserved'),
+            active=-(status == 'active'),
+        )
+        _publish_on_commit('cancelled', [slot_id])
+
+
+# -------------------------------
+# Expire stale reservations
+# -------------------------------
+def expire_stale_reservations(now=None, chunk_size=EXPIRY_CHUNK_SIZE):
+    """Expire reservations whose grace period has passed and free their slots.
+
+    Works in chunks of ``chunk_size``, one transaction per chunk with
+    set-based UPDATEs for the bookings, the slots and the occupancy
+    counters. Returns the number of bookings expired.
+    """
+    now = now or timezone.now()
+    total = 0
+    while True:
+        # Read outside the transaction so that on SQLite the first statement
+        # inside it is a write and takes the lock up front.
+        rows = list(
+            Booking.objects.filter(status='reserved', expiry_time__lt=now)
+            .order_by('expiry_time')
+            .values_list('id', 'parking_slot_id', 'parking_slot__sub_area_id')[:chunk_size]
+        )
+        if not rows:
+            break
+        booking_ids = [booking_id for booking_id, _, _ in rows]
+        slot_ids = {slot_id for _, slot_id, _ in rows}
+
+        with transaction.atomic():
+            # Re-check the status: a booking may have been started meanwhile
+            expired = Booking.objects.filter(id__in=booking_ids, status='reserved').update(status='expired')
+            released = _release_slots(slot_ids)
+            if expired == len(booking_ids):
+                deltas = defaultdict(Counter)
+                for _, _, sub_area_id in rows:
+                    deltas[sub_area_id]['reserved'] -= 1
+                for _, sub_area_id in released:
+                    deltas[sub_area_id]['free'] += 1
+                occupancy.apply_deltas(deltas)
+            else:
+                # Raced with another writer on some of these rows
+                transaction.on_commit(occupancy.recount)
+            transaction.on_commit(lambda ids=booking_ids: availability_index.discard(*ids))
+            transaction.on_commit(lambda ids=slot_ids: touch_slots(*ids))
+            _publish_on_commit('expired', slot_ids)
+
+        total += expired
+        if len(rows) < chunk_size:
+            break
+    return total
+
+
+# -------------------------------
+# Re-bill completed bookings
+# -------------------------------
+REBILL_CHUNK_SIZE = 2000
+
+
+def rebill_unpaid_bookings(chunk_size=REBILL_CHUNK_SIZE, dry_run=False):
+    """Re-price completed, unpaid bookings with the current tariffs.
+
+    Prices each chunk in one batch and writes only the amounts that
+    changed. Returns (bookings checked, bookings changed, total change).
+    """
+    checked = changed = 0
+    difference = 0
+    last_id = 0
+    while True:
+        bookings = list(
+            Booking.objects.filter(status='completed', paid=False, start_time__isnull=False,
+                                   end_time__isnull=False, id__gt=last_id)
+            .order_by('id')
+            .only('id', 'parking_slot_id', 'vehicle_type', 'start_time', 'end_time', 'amount')[:chunk_size]
+        )
+        if not bookings:
+            break
+        updated = []
+        for booking, amount in zip(bookings, price_bookings(bookings)):
+            if booking.amount != amount:
+                difference += amount - (booking.amount or 0)
+                booking.amount = amount
+                updated.append(booking)
+        if updated and not dry_run:
+            Booking.objects.bulk_update(updated, ['amount'])
+        checked += len(bookings)
+        changed += len(updated)
+        last_id = bookings[-1].id
+        if len(bookings) < chunk_size:
+            break
+    return checked, changed, difference
+
+
+# -------------------------------
+# Helpers
+# -------------------------------
+def _release_slots(slot_ids):
+    """Mark slots available unless a live booking still holds them.
+
+    Returns the released slots as (slot_id, sub_area_id) pairs.
+    """
+    still_held = Booking.objects.filter(parking_slot=OuterRef('pk'), status__in=Booking.LIVE_STATUSES)
+    released = list(
+        ParkingSlot.objects.filter(id__in=slot_ids, is_available=False)
+        .exclude(Exists(still_held))
+        .values_list('id', 'sub_area_id')
+    )
+    if released:
+        ParkingSlot.objects.filter(id__in=[slot_id for slot_id, _ in released]).update(is_available=True)
+    return released
+
+
+def _sync_index_on_commit(booking):
+    # QuerySet.update() skips the post_save receiver that normally does this
+    values = (booking.pk, booking.parking_slot_id, booking.status, booking.start_time, booking.end_time)
+    transaction.on_commit(lambda: availability_index.sync(*values))
+    transaction.on_commit(lambda: touch_slots(values[1]))
+
+
+def _publish_on_commit(event, slot_ids):
+    slot_ids = list(slot_ids)
+    transaction.on_commit(lambda: instrumentation.record_booking_event(event, len(slot_ids)))
+    transaction.on_commit(lambda: publish_slots(event, slot_ids))
@@ -1,35 +1,143 @@
 from django.contrib.auth.signals import user_login_failed
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
-from .models import UserAuthenticationRegistration  # Updated import to use UserAuthenticationRegistration
-from django.contrib.auth import get_user_model
-
-User = get_user_model()
+from .models import (
+    Area, SubArea, ParkingSlot, Booking, AreaOccupancy, SubAreaOccupancy, Tariff,
+)
+from .availability import availability_index, touch_slots
+from . import audit, inventory, occupancy, search, tariffs
 
 @receiver(user_login_failed)
 def log_failed_login(sender, credentials, request, **kwargs):
-    login_input = credentials.get('username')  # This is the form input (username or email)
-    user = None
-    email = None
-
-    # Try to get user by username
-    try:
-        user = User.objects.get(username=login_input)
-        email = user.email  # Assign the user's email
-    except User.DoesNotExist:
-        # Try to get user by email
-        try:
-            user = User.objects.get(email=login_input)
-            email = login_input  # Assign the input email
-        except User.DoesNotExist:
-            user = None
-            email = login_input  # Save the entered input as email if no user is found
-
-    print(f"[DEBUG] Login Input: {login_input}")
-    print(f"[DEBUG] User Found: {user}")
-    print(f"[DEBUG] Email to Save: {email}")
-
-    UserAuthenticationRegistration.objects.create(
-        user=user,  # Save the user object (username if found)
-        email=email,  # Save the email address or input
-        action="Invalid username/email or password"
-    )
\ No newline at end of file
+    # Buffered; the username/email is matched to a user when the batch is written
+    audit.log_failed_login(credentials.get('username'))
+
+
+# Keep the in-memory availability index in step with committed bookings
+@receiver(post_save, sender=Booking)
+def sync_availability_index(sender, instance, **kwargs):
+    values = (instance.pk, instance.parking_slot_id, instance.status, instance.start_time, instance.end_time)
+    transaction.on_commit(lambda: availability_index.sync(*values))
+    transaction.on_commit(lambda: touch_slots(values[1]))
+
+
+@receiver(post_delete, sender=Booking)
+def discard_from_availability_index(sender, instance, **kwargs):
+    booking_id, slot_id = instance.pk, instance.parking_slot_id
+    transaction.on_commit(lambda: availability_index.discard(booking_id))
+    transaction.on_commit(lambda: touch_slots(slot_id))
+
+
+# Invalidate the cached Area -> SubArea -> ParkingSlot hierarchy
+@receiver(post_save, sender=Area)
+@receiver(post_delete, sender=Area)
+@receiver(post_save, sender=SubArea)
+@receiver(post_delete, sender=SubArea)
+@receiver(post_save, sender=ParkingSlot)
+@receiver(post_delete, sender=ParkingSlot)
+def invalidate_inventory(sender, update_fields=None, **kwargs):
+    # Availability flips are not part of the cached inventory
+    if sender is ParkingSlot and update_fields == frozenset({'is_available'}):
+        slot_id = kwargs['instance'].pk
+        transaction.on_commit(lambda: touch_slots(slot_id))
+        return
+    transaction.on_commit(inventory.bump_version)
+
+
+# Recompile the tariff rate tables
+@receiver(post_save, sender=Tariff)
+@receiver(post_delete, sender=Tariff)
+def invalidate_tariffs(sender, **kwargs):
+    transaction.on_commit(tariffs.bump_version)
+
+
+# Occupancy counter rows and slot totals for inventory changes
+@receiver(post_save, sender=Area)
+def create_area_occupancy(sender, instance, created, **kwargs):
+    if created:
+        AreaOccupancy.objects.get_or_create(area=instance)
+
+
+@receiver(post_save, sender=SubArea)
+def create_subarea_occupancy(sender, instance, created, **kwargs):
+    if created:
+        SubAreaOccupancy.objects.get_or_create(sub_area=instance)
+
+
+# Direct slot and booking edits. The services move the counters in their
+# own UPDATEs and save inside occupancy.suspended().
+@receiver(pre_save, sender=ParkingSlot)
+def remember_slot_state(sender, instance, update_fields=None, **kwargs):
+    instance._occupancy_was = None
+    if instance._state.adding or not occupancy.tracking():
+        return
+    if update_fields is not None and not {'sub_area', 'is_available'} & set(update_fields):
+        return
+    instance._occupancy_was = sender.objects.filter(pk=instance.pk).values_list(
+        'sub_area_id', 'is_available'
+    ).first()
+
+
+@receiver(post_save, sender=ParkingSlot)
+def count_slot(sender, instance, created, **kwargs):
+    if created:
+        if occupancy.tracking():
+            occupancy.record(instance.sub_area_id, total=1, free=int(instance.is_available))
+        return
+    was = getattr(instance, '_occupancy_was', None)
+    if was is not None:
+        occupancy.slot_changed(instance.pk, was, (instance.sub_area_id, instance.is_available))
+
+
+@receiver(post_delete, sender=ParkingSlot)
+def uncount_deleted_slot(sender, instance, **kwargs):
+    if occupancy.tracking():
+        occupancy.record(instance.sub_area_id, total=-1, free=-int(instance.is_available))
+
+
+@receiver(pre_save, sender=Booking)
+def remember_booking_state(sender, instance, update_fields=None, **kwargs):
+    instance._occupancy_was = None
+    if instance._state.adding or not occupancy.tracking():
+        return
+    if update_fields is not None and not {'parking_slot', 'status'} & set(update_fields):
+        return
+    instance._occupancy_was = sender.objects.filter(pk=instance.pk).values_list(
+        'parking_slot_id', 'status'
+    ).first()
+
+
+@receiver(post_save, sender=Booking)
+def count_booking(sender, instance, created, **kwargs):
+    was = getattr(instance, '_occupancy_was', None)
+    if created and occupancy.tracking():
+        occupancy.booking_changed(None, (instance.parking_slot_id, instance.status))
+    elif was is not None:
+        occupancy.booking_changed(was, (instance.parking_slot_id, instance.status))
+
+
+@receiver(post_delete, sender=Booking)
+def uncount_deleted_booking(sender, instance, **kwargs):
+    if occupancy.tracking():
+        occupancy.booking_changed((instance.parking_slot_id, instance.status), None)
+
+
+# Keep the full-text search index in step with Area/SubArea edits
+@receiver(post_save, sender=Area)
+def index_area_for_search(sender, instance, **kwargs):
+    area_id = instance.pk
+    transaction.on_commit(lambda: search.index_area(area_id))
+
+
+@receiver(post_save, sender=SubArea)
+def index_subarea_for_search(sender, instance, **kwargs):
+    subarea_id = instance.pk
+    transaction.on_commit(lambda: search.index_subarea(subarea_id))
+
+
+@receiver(post_delete, sender=Area)
+@receiver(post_delete, sender=SubArea)
+def remove_from_search(sender, instance, **kwargs):
+    kind, object_id = ('area' if sender is Area else 'subarea'), instance.pk
+    transaction.on_commit(lambda: search.remove(kind, object_id))
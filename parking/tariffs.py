@@ -0,0 +1,211 @@
+"""
+Parking tariffs compiled into rate tables for fast batch pricing.
+
+Once per tariff version the active Tariff rows are resolved into a table of
+24 hourly rates (in paise) for every (area, slot_type, vehicle_type)
+combination some tariff singles out; all other combinations share the
+wildcard rows. Every started hour of a stay is charged at the rate for the
+hour of day it starts in, so pricing a stay is two lookups in the row's
+prefix sums, whatever its length.
+
+``TariffTable.price_hours`` prices whole arrays in one vectorised call when
+NumPy is installed and loops in plain Python otherwise, with the same
+results. Tariff save/delete signals bump the version (see parking.signals).
+"""
+import math
+import threading
+import time
+from decimal import Decimal
+from itertools import accumulate
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+VERSION_KEY = 'parking:tariffs:version'
+HOURS_PER_DAY = 24
+
+# Specificity of a match: an area beats a slot type beats a vehicle type
+AREA_WEIGHT = 4
+SLOT_TYPE_WEIGHT = 2
+VEHICLE_TYPE_WEIGHT = 1
+
+_table = {'version': None, 'table': None}
+_table_lock = threading.Lock()
+
+
+def default_hourly_rate():
+    """Rate where no tariff applies."""
+    return Decimal(str(getattr(settings, 'PARKING_DEFAULT_HOURLY_RATE', 20)))
+
+
+def get_version():
+    return cache.get_or_set(VERSION_KEY, int(time.time() * 1000), None)
+
+
+def bump_version():
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        return get_version()
+
+
+def to_paise(amount):
+    return int((Decimal(amount) * 100).to_integral_value())
+
+
+def from_paise(paise):
+    return Decimal(int(paise)).scaleb(-2)
+
+
+def _specificity(tariff):
+    return (
+        AREA_WEIGHT * (tariff['area_id'] is not None)
+        + SLOT_TYPE_WEIGHT * bool(tariff['slot_type'])
+        + VEHICLE_TYPE_WEIGHT * bool(tariff['vehicle_type'])
+    )
+
+
+def _covers(tariff, hour):
+    start, end = tariff['start_hour'], tariff['end_hour']
+    if start < end:
+        return start <= hour < end
+    # Wraps past midnight
+    return hour >= start or hour < end
+
+
+# -------------------------------
+# Compiled rate table
+# -------------------------------
+class TariffTable:
+    def __init__(self, tariffs, default_rate):
+        """``tariffs``: dicts with the Tariff fields, area as ``area_id``."""
+        self.default_paise = to_paise(default_rate)
+        self.area_ids = {None} | {tariff['area_id'] for tariff in tariffs}
+        self.slot_types = {''} | {tariff['slot_type'] for tariff in tariffs}
+        self.vehicle_types = {''} | {tariff['vehicle_type'] for tariff in tariffs}
+        # Most specific first, then the newest
+        tariffs = sorted(tariffs, key=lambda tariff: (_specificity(tariff), tariff['id']), reverse=True)
+
+        self.rows = {}
+        self.rates = []
+        for area_id in self.area_ids:
+            for slot_type in self.slot_types:
+                for vehicle_type in self.vehicle_types:
+                    matching = [
+                        tariff for tariff in tariffs
+                        if tariff['area_id'] in (None, area_id)
+                        and tariff['slot_type'] in ('', slot_type)
+                        and tariff['vehicle_type'] in ('', vehicle_type)
+                    ]
+                    self.rows[(area_id, slot_type, vehicle_type)] = len(self.rates)
+                    self.rates.append([
+                        next((to_paise(t['hourly_rate']) for t in matching if _covers(t, hour)), self.default_paise)
+                        for hour in range(HOURS_PER_DAY)
+                    ])
+        # Prefix sums over two days: a stay of up to a day never wraps
+        self.cumulative = [[0, *accumulate(rates + rates)] for rates in self.rates]
+        self._cumulative_array = np.array(self.cumulative, dtype=np.int64) if np is not None else None
+
+    def row(self, area_id, slot_type, vehicle_type):
+        # Combinations no tariff singles out share the wildcard rows
+        return self.rows[(
+            area_id if area_id in self.area_ids else None,
+            slot_type if slot_type in self.slot_types else '',
+            vehicle_type if vehicle_type in self.vehicle_types else '',
+        )]
+
+    def price_hours(self, rows, start_hours, hours):
+        """Paise for ``hours`` started hours from hour of day ``start_hours``, per row.
+
+        Takes equal-length sequences (or NumPy arrays) and returns a NumPy
+        array when NumPy is available, a list otherwise.
+        """
+        if self._cumulative_array is not None:
+            rows = np.asarray(rows, dtype=np.intp)
+            start_hours = np.asarray(start_hours, dtype=np.intp)
+            days, rest = np.divmod(np.maximum(np.asarray(hours, dtype=np.int64), 0), HOURS_PER_DAY)
+            cumulative = self._cumulative_array
+            return (
+                days * cumulative[rows, HOURS_PER_DAY]
+                + cumulative[rows, start_hours + rest]
+                - cumulative[rows, start_hours]
+            )
+        prices = []
+        for row, start_hour, n in zip(rows, start_hours, hours):
+            days, rest = divmod(max(n, 0), HOURS_PER_DAY)
+            cumulative = self.cumulative[row]
+            prices.append(
+                days * cumulative[HOURS_PER_DAY] + cumulative[start_hour + rest] - cumulative[start_hour]
+            )
+        return prices
+
+
+def get_table():
+    """The TariffTable for the current tariff version."""
+    from .models import Tariff
+
+    version = get_version()
+    if _table['version'] != version:
+        with _table_lock:
+            if _table['version'] != version:
+                tariffs = list(Tariff.objects.filter(is_active=True).values(
+                    'id', 'area_id', 'slot_type', 'vehicle_type', 'start_hour', 'end_hour', 'hourly_rate'
+                ))
+                _table['table'] = TariffTable(tariffs, default_hourly_rate())
+                _table['version'] = version
+    return _table['table']
+
+
+# -------------------------------
+# Pricing
+# -------------------------------
+def billable_hours(start, end):
+    """Every started hour is charged."""
+    return max(math.ceil((end - start).total_seconds() / 3600), 0)
+
+
+def price_stays(stays):
+    """Amounts for ``(area_id, slot_type, vehicle_type, start, end)`` tuples, in one batch."""
+    table = get_table()
+    rows, start_hours, hours = [], [], []
+    for area_id, slot_type, vehicle_type, start, end in stays:
+        rows.append(table.row(area_id, slot_type, vehicle_type))
+        start_hours.append(timezone.localtime(start).hour)
+        hours.append(billable_hours(start, end))
+    return [from_paise(paise) for paise in table.price_hours(rows, start_hours, hours)]
+
+
+def quote(area_id, slot_type, vehicle_type, start, end):
+    return price_stays([(area_id, slot_type, vehicle_type, start, end)])[0]
+
+
+def price_bookings(bookings, end=None):
+    """Amounts for bookings with a start time, ending at ``end`` or their own end_time.
+
+    Slot areas and types come from the cached inventory; slots missing from
+    it are looked up in one query.
+    """
+    from .inventory import slot_attributes
+    from .models import ParkingSlot
+
+    slot_ids = {booking.parking_slot_id for booking in bookings}
+    slots = slot_attributes(slot_ids)
+    missing = slot_ids - slots.keys()
+    if missing:
+        for slot_id, area_id, sub_area_id, slot_type in ParkingSlot.objects.filter(pk__in=missing).values_list(
+            'id', 'sub_area__area_id', 'sub_area_id', 'slot_type'
+        ):
+            slots[slot_id] = (area_id, sub_area_id, slot_type)
+
+    def stays():
+        for booking in bookings:
+            area_id, _, slot_type = slots.get(booking.parking_slot_id, (None, None, ''))
+            yield area_id, slot_type, booking.vehicle_type, booking.start_time, end or booking.end_time
+
+    return price_stays(stays())
@@ -1,3 +1,1432 @@
-from django.test import TestCase
+import contextlib
+import csv
+import gzip
+import json
+import logging
+import os
+import random
+import tempfile
+import unittest
+from collections import Counter
+from unittest import mock
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.template import TemplateDoesNotExist
+from django.db.migrations.executor import MigrationExecutor
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
+
+from .admin import BookingAdmin
+from . import audit, instrumentation, inventory, occupancy, search, services, tariffs
+from .importer import ImportFailed, import_file
+from .rollups import (
+    BOOKING_WATERMARK, FEEDBACK_WATERMARK, feedback_summary, get_watermark, refresh_booking_rollups,
+    refresh_feedback_rollups, start_of_day,
+)
+from .bench import data as bench_data, runner as bench_runner
+from .bench.scenarios import SCENARIOS
+from .allocator import slot_allocator
+from .tariffs import TariffTable, default_hourly_rate, price_stays, to_paise
+from .availability import OccupancyGrid, SlotIntervals, availability_index
+from .inventory import get_inventory, subareas_of
+from .models import (
+    Area, AreaOccupancy, Booking, BookingHourlyRollup, Feedback, LoginRegisterLog, ParkingSlot, SubArea,
+    SubAreaOccupancy, Tariff, User, UserAuthenticationRegistration,
+)
+from .pagination import decode_cursor, encode_cursor
+from .querybudget import QueryBudgetExceeded, QueryBudgetMiddleware, fingerprint, get_budget
+
+
+def form_time(moment):
+    return timezone.localtime(moment).strftime('%Y-%m-%dT%H:%M')
+
+
+class ParkingTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # At least two of everything, so a query per row shows up as a higher count
+        cls.user = User.objects.create_user('driver', 'driver@example.com', 'secret-pass')
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'secret-pass', is_staff=True)
+        cls.slots = []
+        for area_name in ('North', 'South'):
+            area = Area.objects.create(name=area_name, description=f'{area_name} car park')
+            for level in ('L1', 'L2'):
+                sub_area = SubArea.objects.create(area=area, name=level)
+                for number in range(1, 4):
+                    cls.slots.append(ParkingSlot.objects.create(
+                        sub_area=sub_area, slot_number=str(number), slot_type='covered' if number % 2 else 'open',
+                    ))
+        cls.area, cls.sub_area = cls.slots[0].sub_area.area, cls.slots[0].sub_area
+
+        now = timezone.now()
+        cls.reserved, cls.active, cls.completed = [
+            Booking.objects.create(
+                user=cls.user, parking_slot=cls.slots[i], vehicle_number=f'KA01AB{i}', status=status,
+                start_time=now + timedelta(hours=start), end_time=now + timedelta(hours=start + 2),
+                expiry_time=now + timedelta(minutes=30),
+            )
+            for i, (status, start) in enumerate([('reserved', 3), ('active', -1), ('completed', -5)])
+        ]
+        ParkingSlot.objects.filter(pk__in=[cls.slots[0].pk, cls.slots[1].pk]).update(is_available=False)
+        for rating in (3, 5):
+            Feedback.objects.create(user=cls.user, rating=rating, goal_achievement='yes')
+        occupancy.recount()
+
+    def setUp(self):
+        # Per-process caches outlive the rolled-back test transactions
+        cache.clear()
+        inventory.reset_local_copy()
+        availability_index.reset()
+        slot_allocator.reset()
+        # Probed once per process; settle it outside the counted requests
+        search.fts_available()
+        self.client.force_login(self.user)
+
+    def assertQueries(self, num, url, method='get', status=200, **kwargs):
+        with self.assertNumQueries(num):
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def assertQueriesBeforeError(self, num, url, error=TemplateDoesNotExist):
+        # For views that currently fail (e.g. their template is not in the
+        # tree yet): pin the queries they run up to the failure
+        with self.assertNumQueries(num), self.assertRaises(error):
+            self.client.get(url)
+
+
+# -------------------------------
+# Query counts per view
+# -------------------------------
+class PageQueryCountTests(ParkingTestCase):
+    def test_register(self):
+        self.client.logout()
+        self.assertQueries(0, reverse('parking:register'))
+
+    def test_login_page(self):
+        self.client.logout()
+        self.assertQueries(0, reverse('parking:login'))
+
+    def test_logout(self):
+        self.assertQueries(7, reverse('parking:logout'), status=302)
+
+    def test_home(self):
+        self.assertQueries(5, reverse('parking:home'))
+
+    def test_home_search(self):
+        self.assertQueries(5, reverse('parking:home'), data={'search_query': 'North'})
+
+    def test_dashboard(self):
+        self.assertQueries(11, reverse('parking:dashboard'))
+
+    def test_slots(self):
+        self.assertQueries(1, reverse('parking:slots'))
+
+    def test_profile(self):
+        self.assertQueries(3, reverse('parking:profile'))
+
+    def test_book_slot_form(self):
+        self.assertQueries(3, reverse('parking:book_slot', args=[self.slots[4].pk]))
+
+    def test_book_slot(self):
+        start = timezone.now() + timedelta(hours=3)
+        self.assertQueries(13, reverse('parking:book_slot', args=[self.slots[4].pk]), method='post', status=302, data={
+            'vehicle_type': '4-wheeler', 'vehicle_number': 'KA02CD1234',
+            'start_time': form_time(start), 'end_time': form_time(start + timedelta(hours=1)),
+        })
+
+    def test_book_slot_direct(self):
+        # Redirects to a URL name that no longer exists
+        self.assertQueriesBeforeError(2, reverse('parking:book_slot_direct'), NoReverseMatch)
+
+    def test_allocate_slot_form(self):
+        self.assertQueries(5, reverse('parking:allocate_slot', args=[self.sub_area.pk]))
+
+    def test_allocate_slot(self):
+        start = timezone.now() + timedelta(hours=3)
+        response = self.assertQueries(
+            12, reverse('parking:allocate_slot', args=[self.sub_area.pk]), method='post', status=201,
+            HTTP_ACCEPT='application/json', data={
+                'vehicle_type': '2-wheeler', 'vehicle_number': 'KA03EF5678',
+                'start_time': form_time(start), 'end_time': form_time(start + timedelta(hours=1)),
+            },
+        )
+        self.assertEqual(response.json()['slot'], self.slots[2].pk)
+
+    def test_start_parking(self):
+        self.assertQueries(8, reverse('parking:start_parking', args=[self.reserved.pk]), status=302)
+
+    def test_end_parking(self):
+        self.assertQueries(12, reverse('parking:end_parking', args=[self.active.pk]), status=302)
+
+    def test_payment_page(self):
+        self.assertQueries(3, reverse('parking:payment_page', args=[self.completed.pk]))
+
+    def test_payment_success(self):
+        self.assertQueries(
+            5, reverse('parking:payment_success'), method='post', data={'booking_id': self.completed.pk}
+        )
+
+    def test_cancel_booking(self):
+        self.assertQueries(10, reverse('parking:cancel_booking', args=[self.reserved.pk]), status=302)
+
+    def test_booking_detail(self):
+        self.assertQueriesBeforeError(3, reverse('parking:booking_detail', args=[self.reserved.pk]))
+
+    def test_booking_success(self):
+        self.assertQueries(0, reverse('parking:booking_success'))
+
+    def test_areas(self):
+        self.assertQueriesBeforeError(3, reverse('parking:areas_view'))
+
+    def test_search_area(self):
+        self.assertQueries(3, reverse('parking:search_area'), data={'q': 'North'})
+
+    def test_search_autocomplete(self):
+        response = self.assertQueries(3, reverse('parking:search_autocomplete'), data={'q': 'Nor'})
+        self.assertEqual(response.json()['results'][0]['label'], 'North')
+
+    def test_search_autocomplete_links_render(self):
+        response = self.client.get(reverse('parking:search_autocomplete'), {'q': 'L'})
+        results = response.json()['results']
+        self.assertEqual({result['kind'] for result in results}, {'subarea'})
+        for result in results:
+            self.assertEqual(self.client.get(result['url']).status_code, 200)
+
+    def test_area_detail(self):
+        self.assertQueries(3, reverse('parking:area_detail', args=[self.area.pk]))
+
+    def test_subareas_and_slots(self):
+        self.assertQueriesBeforeError(3, reverse('parking:subareas_and_slots'))
+
+    def test_subarea_detail(self):
+        self.assertQueriesBeforeError(6, reverse('parking:subarea_detail', args=[self.sub_area.pk]))
+
+    def test_availability(self):
+        response = self.assertQueries(6, reverse('parking:availability'), data={'area': self.area.pk})
+        self.assertIn(self.slots[1].pk, response.json()['booked'])
+
+    def test_availability_not_modified(self):
+        url = reverse('parking:availability')
+        etag = self.client.get(url)['ETag']
+        self.assertQueries(0, url, status=304, HTTP_IF_NONE_MATCH=etag)
+
+    def test_availability_stream_under_wsgi(self):
+        self.assertQueries(0, reverse('parking:availability_stream'), status=204)
+
+    def test_contact(self):
+        self.assertQueries(0, reverse('parking:contact'))
+
+    def test_contact_submit(self):
+        self.assertQueries(1, reverse('parking:contact'), method='post', status=302, data={
+            'name': 'Asha', 'email': 'asha@example.com', 'message': 'Hello',
+        })
+
+    def test_feedback(self):
+        self.assertQueries(2, reverse('parking:feedback'))
+
+    def test_feedback_submit(self):
+        self.assertQueries(3, reverse('parking:feedback'), method='post', status=302, data={'rating': 4})
+
+    def test_feedback_dashboard(self):
+        self.client.force_login(self.staff)
+        self.assertQueries(5, reverse('parking:feedback_dashboard'))
+
+    def test_booking_report(self):
+        self.client.force_login(self.staff)
+        self.assertQueries(8, reverse('parking:booking_report'), data={'days': 30})
+
+
+# -------------------------------
+# Booking history pages
+# -------------------------------
+class BookingHistoryPageTests(ParkingTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        created = Booking.objects.bulk_create(
+            Booking(user=cls.staff, parking_slot=cls.slots[n % 12], vehicle_number=f'KA09{n:04d}', status='completed')
+            for n in range(45)
+        )
+        # Groups of three bookings made at the same moment, so ties straddle page breaks
+        base = timezone.now().replace(microsecond=0)
+        for n, booking in enumerate(created):
+            Booking.objects.filter(pk=booking.pk).update(reservation_time=base - timedelta(hours=n // 3))
+        cls.newest_first = list(
+            Booking.objects.filter(user=cls.staff).order_by('-reservation_time', '-id').values_list('id', flat=True)
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.staff)
+
+    def page(self, url, **params):
+        page = self.client.get(url, params).context['user_bookings']
+        return [booking.pk for booking in page], page
+
+    def test_cursors_walk_the_history_both_ways(self):
+        for url in (reverse('parking:dashboard'), reverse('parking:profile')):
+            with self.subTest(url=url):
+                pages, params = [], {}
+                while True:
+                    ids, page = self.page(url, **params)
+                    pages.append(ids)
+                    if not page.has_older:
+                        break
+                    params = {'before': page.older_cursor}
+                self.assertEqual([len(ids) for ids in pages], [20, 20, 5])
+                # Every booking once, in order
+                self.assertEqual(sum(pages, []), self.newest_first)
+                back = []
+                while page.has_newer:
+                    ids, page = self.page(url, after=page.newer_cursor)
+                    back.append(ids)
+                self.assertEqual(back, pages[-2::-1])
+
+    def test_malformed_cursors_are_ignored(self):
+        url = reverse('parking:profile')
+        first, _ = self.page(url)
+        for cursor in ('not-a-cursor', '!!!', 'MjAyNHxhYmM', encode_cursor(timezone.now(), 1)[:-3]):
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(decode_cursor(cursor))
+                self.assertEqual(self.page(url, before=cursor)[0], first)
+                self.assertEqual(self.page(url, after=cursor)[0], first)
+
+
+# -------------------------------
+# Query budget middleware
+# -------------------------------
+class QueryBudgetTests(ParkingTestCase):
+    def test_fingerprint_normalises_literals_and_in_lists(self):
+        self.assertEqual(
+            fingerprint('SELECT "a" FROM "t" WHERE "id" IN (%s, %s, %s) AND "n" = 12 AND "s" = \'x\''),
+            'SELECT "a" FROM "t" WHERE "id" IN (...) AND "n" = ? AND "s" = ?',
+        )
+
+    @override_settings(PARKING_QUERY_BUDGETS={
+        'default': {'queries': 10, 'time_ms': 100},
+        'admin': {'queries': 30},
+        'parking:dashboard': {'time_ms': 400},
+    })
+    def test_budget_falls_back_from_view_to_namespace_to_default(self):
+        self.assertEqual(get_budget('parking:dashboard'), {'queries': 10, 'time_ms': 400})
+        self.assertEqual(get_budget('admin:index'), {'queries': 30, 'time_ms': 100})
+        self.assertEqual(get_budget(None), {'queries': 10, 'time_ms': 100})
+
+    @override_settings(PARKING_QUERY_BUDGETS={'parking:profile': {'queries': 2}})
+    def test_over_budget_raises_in_tests(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'parking:profile: 3 queries'):
+            self.client.get(reverse('parking:profile'))
+
+    @override_settings(PARKING_QUERY_BUDGETS={'default': {'queries': 1}}, PARKING_QUERY_BUDGET_RAISE=False)
+    def test_over_budget_logs_repeated_sql(self):
+        def view(request):
+            for slot in self.slots[:3]:
+                ParkingSlot.objects.get(pk=slot.pk)
+            return None
+
+        request = RequestFactory().get('/n-plus-one/')
+        with self.assertLogs('parking.querybudget', logging.WARNING) as logs:
+            QueryBudgetMiddleware(view)(request)
+        self.assertEqual(request.query_stats.count, 3)
+        self.assertIn('3x SELECT', logs.output[0])
+
+    @override_settings(PARKING_QUERY_BUDGETS={'default': {'queries': 100}})
+    def test_within_budget_is_quiet(self):
+        self.client.get(reverse('parking:profile'))
+
+
+# -------------------------------
+# Metrics
+# -------------------------------
+class MetricsTests(ParkingTestCase):
+    def counter(self, metric, *labels):
+        return metric.shards.totals()[labels]
+
+    def test_metrics_is_staff_only(self):
+        self.assertQueries(2, reverse('metrics'), status=403)
+
+    def test_metrics_for_staff(self):
+        self.client.get(reverse('parking:slots'))
+        self.client.force_login(self.staff)
+        response = self.assertQueries(2, reverse('metrics'))
+        self.assertEqual(response['Content-Type'], instrumentation.CONTENT_TYPE)
+        body = response.content.decode()
+        self.assertIn('# TYPE parking_http_request_duration_seconds histogram', body)
+        self.assertRegex(body, r'parking_http_requests_total\{view="parking:slots",method="GET",status="200"\} \d+')
+        self.assertIn('parking_http_request_duration_seconds_bucket{view="parking:slots",le="+Inf"}', body)
+        self.assertIn('parking_http_requests_in_flight{view="metrics"} 1', body)
+
+    def test_unknown_methods_share_one_label(self):
+        def others():
+            return sum(
+                n for (view, method, _), n in instrumentation.http_requests.shards.totals().items()
+                if (view, method) == ('parking:slots', 'other')
+            )
+
+        before = others()
+        for method in ('PROPFIND', 'X-RANDOM-1', 'X-RANDOM-2'):
+            self.client.generic(method, reverse('parking:slots'))
+        self.assertEqual(others(), before + 3)
+        methods = {method for _, method, _ in instrumentation.http_requests.shards.totals()}
+        self.assertLessEqual(methods, instrumentation.HTTP_METHODS | {'other'})
+
+    @override_settings(PARKING_METRICS_TOKEN='scrape-me')
+    def test_metrics_with_token(self):
+        self.client.logout()
+        self.assertQueries(0, reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertQueries(0, reverse('metrics'), status=403, HTTP_AUTHORIZATION='Bearer guess')
+
+    def test_booking_events_counted_on_commit(self):
+        before = self.counter(instrumentation.booking_events, 'started')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('parking:start_parking', args=[self.reserved.pk]))
+        self.assertEqual(self.counter(instrumentation.booking_events, 'started'), before + 1)
+
+    def test_totals_of_other_processes_are_added(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(PARKING_METRICS_DIR=directory):
+            instrumentation.flush(force=True)
+            self.assertTrue(os.path.exists(os.path.join(directory, f'{os.getpid()}.json')))
+            # An exited worker: its counters still count, its in-flight requests don't
+            with open(os.path.join(directory, '999999999.json'), 'w') as f:
+                json.dump({
+                    'parking_booking_events_total': [[['expired'], 40]],
+                    'parking_http_requests_in_flight': [[['parking:dashboard'], 3]],
+                    'parking_http_request_duration_seconds': [[[['parking:dashboard'], 0], 2], [[['parking:dashboard'], 'sum'], 0.004]],
+                }, f)
+            expired = self.counter(instrumentation.booking_events, 'expired')
+            body = instrumentation.render()
+        self.assertIn(f'parking_booking_events_total{{event="expired"}} {expired + 40:g}', body)
+        self.assertNotIn('parking_http_requests_in_flight{view="parking:dashboard"} 3', body)
+        self.assertIn('parking_http_request_duration_seconds_bucket{view="parking:dashboard",le="0.005"}', body)
+
+
+def clear_search_index():
+    # TransactionTestCase flushes the model tables, not the FTS5 table
+    if search.fts_available():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.FTS_TABLE}')
+
+
+class BenchTests(TransactionTestCase):
+    SIZE = {'areas': 1, 'subareas': 2, 'slots': 5, 'users': 5, 'bookings': 100}
+
+    def setUp(self):
+        cache.clear()
+        inventory.reset_local_copy()
+        availability_index.reset()
+        slot_allocator.reset()
+        self.addCleanup(clear_search_index)
+
+    def generate(self, seed):
+        """Rows of a generated city relative to its anchor, rolled back afterwards."""
+        with transaction.atomic():
+            city = bench_data.generate_city(self.SIZE, seed=seed)
+            rows = [
+                (status, vehicle_number, start_time - city['anchor'])
+                for status, vehicle_number, start_time in Booking.objects.filter(
+                    parking_slot_id__in=city['slot_ids']
+                ).order_by('pk').values_list('status', 'vehicle_number', 'start_time')
+            ]
+            self.assertEqual(len(city['slot_ids']), 10)
+            self.assertEqual(ParkingSlot.objects.filter(pk__in=city['slot_ids'], is_available=False).count(), 1)
+            transaction.set_rollback(True)
+        return rows
+
+    def test_city_is_deterministic(self):
+        rows = self.generate(seed=7)
+        self.assertEqual(len(rows), 100)
+        self.assertEqual(rows, self.generate(seed=7))
+        self.assertNotEqual(rows, self.generate(seed=8))
+
+    def test_bench_results_compare_against_baseline(self):
+        @contextlib.contextmanager
+        def scratch_database():
+            # The test database stands in for the scratch one, emptied instead of dropped
+            yield
+            call_command('flush', interactive=False, verbosity=0)
+            clear_search_index()
+
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(bench_data, 'scratch_database', side_effect=scratch_database) as scratch:
+            path = os.path.join(directory, 'bench.json')
+            options = {**self.SIZE, 'iterations': 2, 'warmup': 1, 'memory_runs': 1, 'stdout': StringIO()}
+            call_command('bench', output=path, **options)
+            results = bench_runner.load(path)
+            out = StringIO()
+            call_command('bench', **{**options, 'baseline': path, 'scenarios': 'search,book', 'stdout': out})
+        self.assertEqual(scratch.call_count, 2)
+        self.assertCountEqual(results['scenarios'], SCENARIOS)
+        self.assertEqual((results['size'], results['seed']), (self.SIZE, 42))
+        self.assertIn('book       queries', out.getvalue())
+
+
+# -------------------------------
+# Login throttle
+# -------------------------------
+@override_settings(PARKING_LOGIN_THROTTLE={'username': {'capacity': 3, 'per_seconds': 300}})
+class LoginThrottleTests(ParkingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.logout()
+
+    def fail_logins(self, url, count):
+        for _ in range(count):
+            response = self.client.post(url, {'username': 'driver', 'password': 'wrong'})
+            self.assertEqual(response.status_code, 200)
+
+    def test_throttled_login_skips_authenticate(self):
+        url = reverse('parking:login')
+        self.fail_logins(url, 3)
+        with mock.patch('django.contrib.auth.forms.authenticate') as authenticate:
+            response = self.client.post(url, {'username': 'driver', 'password': 'secret-pass'})
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(response['Retry-After'].isdigit())
+        authenticate.assert_not_called()
+        self.assertFalse(response.context['form'].is_bound)
+        self.assertIn('Too many failed login attempts', response.content.decode())
+
+    def test_throttled_login_view_function(self):
+        url = reverse('login')
+        self.fail_logins(url, 3)
+        with mock.patch('parking.views.authenticate') as authenticate:
+            response = self.client.post(url, {'username': 'driver', 'password': 'secret-pass'})
+        self.assertEqual(response.status_code, 429)
+        authenticate.assert_not_called()
+
+    def test_successful_login_resets_the_username_bucket(self):
+        url = reverse('parking:login')
+        self.fail_logins(url, 2)
+        response = self.client.post(url, {'username': 'driver', 'password': 'secret-pass'})
+        self.assertEqual(response.status_code, 302)
+        self.client.logout()
+        # Three fresh failures are allowed again before the fourth is turned away
+        self.fail_logins(url, 3)
+        response = self.client.post(url, {'username': 'driver', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 429)
+
+
+# -------------------------------
+# Buffered audit log
+# -------------------------------
+@override_settings(PARKING_AUDIT_SYNC=False, PARKING_AUDIT_BATCH_SIZE=3, PARKING_AUDIT_FLUSH_INTERVAL=0.5)
+class AuditBufferTests(ParkingTestCase):
+    def setUp(self):
+        super().setUp()
+        with mock.patch('atexit.register') as register:
+            self.buffer = audit.AuditBuffer()
+        self.at_exit = register.call_args.args[0]
+        # The flush thread would write on its own connection, outside the test transaction
+        patcher = mock.patch.object(self.buffer, '_ensure_thread')
+        self.ensure_thread = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def inserts(self, flush):
+        with CaptureQueriesContext(connection) as queries:
+            flush()
+        return [query['sql'].split('(')[0].strip() for query in queries if query['sql'].startswith('INSERT')]
+
+    def test_events_wait_for_one_bulk_write(self):
+        self.buffer.add('auth', user_id=self.user.pk, action='login')
+        self.buffer.add('auth', user_id=self.staff.pk, action='logout')
+        self.buffer.add('login_failed', login_input='driver@example.com')
+        self.buffer.add('login_failed', login_input='nobody')
+        self.assertFalse(LoginRegisterLog.objects.exists())
+        self.ensure_thread.assert_called()
+        self.assertEqual(self.inserts(self.buffer.flush), [
+            'INSERT INTO "parking_loginregisterlog"', 'INSERT INTO "parking_userauthenticationregistration"',
+        ])
+        self.assertEqual(len(self.buffer), 0)
+        self.assertCountEqual(LoginRegisterLog.objects.values_list('user__username', 'action'), [
+            ('driver', 'login'), ('staff', 'logout'),
+        ])
+        failures = UserAuthenticationRegistration.objects.filter(action='login_failed')
+        self.assertCountEqual(failures.values_list('user__username', 'email'), [
+            ('driver', 'driver@example.com'), (None, 'nobody'),
+        ])
+
+    def test_full_batch_wakes_the_flush_thread(self):
+        self.buffer.add('auth', user_id=self.user.pk, action='login')
+        self.buffer.add('auth', user_id=self.user.pk, action='logout')
+        self.assertFalse(self.buffer._wakeup.is_set())
+        self.buffer.add('auth', user_id=self.user.pk, action='login')
+        self.assertTrue(self.buffer._wakeup.is_set())
+
+    def test_flush_thread_writes_every_interval(self):
+        class Stop(Exception):
+            pass
+
+        self.buffer.add('auth', user_id=self.user.pk, action='login')
+        flush = self.buffer.flush
+        with mock.patch.object(self.buffer._wakeup, 'wait', return_value=False) as wait, \
+                mock.patch.object(self.buffer, 'flush', side_effect=[flush(), Stop]), \
+                mock.patch('parking.audit.close_old_connections'):
+            self.assertRaises(Stop, self.buffer._run)
+        self.assertEqual(wait.call_args_list, [mock.call(0.5), mock.call(0.5)])
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_pending_events_are_written_at_exit(self):
+        self.buffer.add('auth', user_id=self.user.pk, action='logout')
+        self.assertEqual(self.at_exit, self.buffer.flush)
+        self.assertEqual(self.inserts(self.at_exit), ['INSERT INTO "parking_loginregisterlog"'])
+        self.assertTrue(LoginRegisterLog.objects.filter(user=self.user, action='logout').exists())
+
+    @override_settings(PARKING_AUDIT_MAX_PENDING=2)
+    def test_full_buffer_drops_events(self):
+        for action in ('login', 'logout', 'login'):
+            self.buffer.add('auth', user_id=self.user.pk, action=action)
+        self.assertEqual((len(self.buffer), self.buffer.dropped), (2, 1))
+        with self.assertLogs('parking.audit', 'WARNING'):
+            self.assertEqual(self.buffer.flush(), 2)
+
+
+# -------------------------------
+# Admin CSV exports
+# -------------------------------
+class AdminExportTests(ParkingTestCase):
+    def setUp(self):
+        super().setUp()
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret-pass')
+        self.client.force_login(admin)
+
+    def export(self, model, action, objects):
+        response = self.client.post(reverse(f'admin:parking_{model._meta.model_name}_changelist'), {
+            'action': action, '_selected_action': [obj.pk for obj in objects],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def rows(self, content):
+        return list(csv.reader(StringIO(content.decode('utf-8'))))
+
+    def test_bookings_as_csv(self):
+        response, content = self.export(Booking, 'export_as_csv', [self.reserved, self.active])
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=booking.csv')
+        header, *rows = self.rows(content)
+        self.assertEqual(header[:3], ['id', 'user__username', 'user__email'])
+        self.assertEqual(sorted(row[0] for row in rows), sorted(str(b.pk) for b in (self.reserved, self.active)))
+        self.assertEqual({row[1] for row in rows}, {'driver'})
+
+    def test_default_columns_export_the_username(self):
+        _, content = self.export(Feedback, 'export_as_csv', Feedback.objects.all())
+        header, *rows = self.rows(content)
+        self.assertEqual(header[:2], ['id', 'user'])
+        self.assertEqual([row[1] for row in rows], ['driver', 'driver'])
+
+    def test_gzip_matches_the_csv(self):
+        bookings = [self.reserved, self.active, self.completed]
+        _, plain = self.export(Booking, 'export_as_csv', bookings)
+        # Tiny blocks, so the stream is made of several compressed chunks
+        with mock.patch.object(BookingAdmin, 'export_gzip_block_size', 64):
+            response, compressed = self.export(Booking, 'export_as_csv_gzip', bookings)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=booking.csv.gz')
+        self.assertEqual(gzip.decompress(compressed), plain)
+
+
+# -------------------------------
+# Bulk import
+# -------------------------------
+class ImportTests(ParkingTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'bookings.ndjson')
+
+    def write(self, lines):
+        with open(self.path, 'w') as f:
+            for line in lines:
+                f.write((line if isinstance(line, str) else json.dumps(line)) + '\n')
+
+    def row(self, slot_number='3', start=1, hours=1, status='completed', username='driver'):
+        start_time = timezone.now().replace(microsecond=0) + timedelta(hours=start)
+        return {
+            'area': 'North', 'sub_area': 'L1', 'slot_number': slot_number, 'username': username,
+            'vehicle_number': 'KA02CD1234', 'status': status,
+            'start_time': start_time.isoformat(), 'end_time': (start_time + timedelta(hours=hours)).isoformat(),
+        }
+
+    def test_rows_repeated_in_the_file_are_created_once(self):
+        row = self.row(start=-30)
+        self.write([row, row])
+        result = import_file('bookings', self.path)
+        self.assertEqual((result['created'], result['existing'], result['errors']), (1, 1, []))
+        # A second run skips everything already imported
+        result = import_file('bookings', self.path, restart=True)
+        self.assertEqual((result['created'], result['existing']), (0, 2))
+
+    def test_live_bookings_may_not_overlap(self):
+        self.write([
+            self.row(slot_number='1', start=4, status='reserved'),  # the fixture holds slot 1 from +3h to +5h
+            self.row(start=3, hours=2, status='reserved'),
+            self.row(start=4, hours=2, status='active'),
+            self.row(start=5, hours=1, status='reserved'),  # back to back
+            self.row(start=4, hours=2, status='completed'),  # history may overlap
+        ])
+        result = import_file('bookings', self.path)
+        self.assertEqual(result['created'], 3)
+        self.assertEqual([row_number for row_number, _ in result['errors']], [1, 3])
+        self.assertIn('Overlaps a live booking', result['errors'][0][1])
+
+    def test_lines_that_are_not_objects_are_reported(self):
+        self.write(['[1, 2]', '42', self.row(start=-30)])
+        result = import_file('bookings', self.path)
+        self.assertEqual(result['created'], 1)
+        self.assertEqual(result['errors'], [
+            (1, 'Line 1 is not a JSON object.'), (2, 'Line 2 is not a JSON object.'),
+        ])
+
+    def test_failed_chunk_resumes_after_the_last_committed_one(self):
+        self.write([self.row(start=-30), self.row(start=-28), self.row(start=-26, username='nobody'), self.row(start=-24)])
+        before = Booking.objects.count()
+        with self.assertRaises(ImportFailed):
+            import_file('bookings', self.path, chunk_size=2, max_errors=0)
+        self.assertEqual(Booking.objects.count(), before + 2)
+        result = import_file('bookings', self.path, chunk_size=2, max_errors=5)
+        self.assertEqual((result['resumed_at'], result['read'], result['created']), (2, 2, 1))
+        self.assertEqual(result['errors'], [(3, "Unknown user 'nobody'.")])
+
+    def test_changed_file_needs_restart(self):
+        self.write([self.row(start=-30)])
+        call_command('import_parking_data', bookings=self.path, stdout=StringIO())
+        self.write([self.row(start=-20)])
+        with self.assertRaisesMessage(CommandError, '--restart'):
+            call_command('import_parking_data', bookings=self.path, stdout=StringIO())
+        call_command('import_parking_data', bookings=self.path, restart=True, stdout=StringIO())
+        self.assertEqual(Booking.objects.filter(vehicle_number='KA02CD1234').count(), 2)
+
+    def test_changes_past_the_first_block_are_noticed(self):
+        # Well over the 64 KiB the fingerprint used to stop at
+        rows = [{**self.row(start=-30 - n), 'vehicle_number': f'KA02CD{n:04d}'} for n in range(700)]
+        self.write(rows)
+        self.assertGreater(os.path.getsize(self.path), 2 * 64 * 1024)
+        call_command('import_parking_data', bookings=self.path, stdout=StringIO())
+        for changed in (
+            rows + [self.row(start=-800)],  # appended
+            rows[:-1] + [{**rows[-1], 'vehicle_number': 'KA02CD9999'}],  # same size
+        ):
+            self.write(changed)
+            with self.assertRaisesMessage(CommandError, '--restart'):
+                call_command('import_parking_data', bookings=self.path, stdout=StringIO())
+
+    @override_settings(PARKING_ROLLUP_WORKERS=1)
+    def test_imported_history_reaches_the_booking_rollups(self):
+        def rollups():
+            return set(BookingHourlyRollup.objects.values_list(
+                'hour', 'sub_area_id', 'slot_type', 'vehicle_type', 'occupied_minutes', 'bookings', 'revenue'
+            ))
+
+        refresh_booking_rollups()
+        before = rollups()
+        # Behind the watermark, overlapping the fixture's completed session (-5h to -3h)
+        self.write([
+            {**self.row(slot_number='2', start=-4, hours=2), 'amount': '40'},
+            {**self.row(start=-30, hours=3), 'amount': '60'},
+        ])
+        call_command('import_parking_data', bookings=self.path, stdout=StringIO())
+        imported = rollups()
+        self.assertNotEqual(imported, before)
+        refresh_booking_rollups(full=True)
+        self.assertEqual(imported, rollups())
+
+    def test_finish_import_updates_slot_flags_and_occupancy(self):
+        slot = self.slots[2]
+        counts = SubAreaOccupancy.objects.get(sub_area=slot.sub_area)
+        self.assertTrue(slot.is_available)
+        self.write([self.row(start=1, status='reserved')])
+        call_command('import_parking_data', bookings=self.path, stdout=StringIO())
+        slot.refresh_from_db()
+        self.assertFalse(slot.is_available)
+        after = SubAreaOccupancy.objects.get(sub_area=slot.sub_area)
+        self.assertEqual(
+            (after.free_slots, after.reserved_slots), (counts.free_slots - 1, counts.reserved_slots + 1)
+        )
+
+
+# -------------------------------
+# Inventory cache
+# -------------------------------
+class InventoryCacheTests(ParkingTestCase):
+    def edit(self, change):
+        version = inventory.get_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        return inventory.get_version() != version
+
+    def test_inventory_edits_bump_the_version(self):
+        slot = ParkingSlot.objects.get(pk=self.slots[4].pk)
+        edits = {
+            'area': lambda: Area.objects.get(pk=self.area.pk).save(),
+            'new sub-area': lambda: SubArea.objects.create(area=self.area, name='L3'),
+            'sub-area': lambda: SubArea.objects.get(pk=self.sub_area.pk).save(),
+            'slot': lambda: slot.save(),
+            'deleted slot': lambda: ParkingSlot.objects.get(pk=self.slots[5].pk).delete(),
+        }
+        for name, change in edits.items():
+            with self.subTest(name):
+                self.assertTrue(self.edit(change))
+        # Availability is not part of the inventory
+        slot.is_available = False
+        self.assertFalse(self.edit(lambda: slot.save(update_fields=['is_available'])))
+
+    def test_read_from_the_cache_once_per_version(self):
+        shared = inventory.get_inventory(copy=False)
+        with mock.patch.object(inventory.cache, 'get', wraps=inventory.cache.get) as cache_get:
+            self.assertIs(inventory.get_inventory(copy=False), shared)
+            self.assertEqual(inventory.get_inventory(), shared)
+            # Only the version is read
+            self.assertEqual({call.args[0] for call in cache_get.call_args_list}, {inventory.VERSION_KEY})
+        self.edit(lambda: ParkingSlot.objects.create(sub_area=self.sub_area, slot_number='9'))
+        fresh = inventory.get_inventory(copy=False)
+        self.assertIsNot(fresh, shared)
+        self.assertIn('9', [slot['slot_number'] for subarea in subareas_of(fresh) for slot in subarea['slots']])
+
+    def test_copies_can_be_annotated(self):
+        areas = inventory.get_inventory()
+        areas[0]['occupancy'] = {'free': 1}
+        areas[0]['subareas'][0]['free_count'] = 1
+        inventory.get_subarea(self.sub_area.pk)['free_count'] = 2
+        shared = inventory.get_inventory(copy=False)
+        self.assertNotIn('occupancy', shared[0])
+        self.assertNotIn('free_count', subareas_of(shared)[0])
+
+
+# -------------------------------
+# Availability index
+# -------------------------------
+class SlotIntervalsTests(TestCase):
+    def setUp(self):
+        self.base = timezone.now()
+        self.intervals = SlotIntervals()
+        for booking_id, start, end in ((1, 4, 6), (2, 0, 10), (3, 12, 13)):
+            self.intervals.add(booking_id, self.at(start), self.at(end))
+
+    def at(self, hours):
+        return self.base + timedelta(hours=hours)
+
+    def overlaps(self, start, end):
+        return self.intervals.overlaps(self.at(start), self.at(end))
+
+    def test_overlaps(self):
+        self.assertEqual(self.intervals.ids, [2, 1, 3])
+        self.assertTrue(self.overlaps(8, 9))  # inside the long booking that starts first
+        self.assertTrue(self.overlaps(12, 14))
+        self.assertFalse(self.overlaps(10, 12))  # back to back on both sides
+        self.assertFalse(self.overlaps(13, 20))
+        self.assertFalse(self.overlaps(-2, 0))
+
+    def test_remove(self):
+        self.assertTrue(self.intervals.remove(2))
+        self.assertFalse(self.intervals.remove(2))
+        self.assertFalse(self.overlaps(8, 9))
+        self.assertTrue(self.overlaps(5, 8))
+        self.assertEqual(len(self.intervals), 2)
+
+
+class OccupancyGridTests(TestCase):
+    def setUp(self):
+        self.origin = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.grid = OccupancyGrid(self.origin + timedelta(minutes=20), days=1)
+
+    def at(self, minutes):
+        return self.origin + timedelta(minutes=minutes)
+
+    def test_origin_is_floored_to_a_bucket(self):
+        self.assertEqual(self.grid.origin, self.at(15))
+        self.assertEqual(self.grid.size, 96)
+
+    def test_mask_covers_every_touched_bucket(self):
+        self.assertEqual(self.grid.mask(self.at(15), self.at(30)), 0b1)
+        self.assertEqual(self.grid.mask(self.at(20), self.at(50)), 0b111)
+        self.assertEqual(self.grid.mask(self.at(0), self.at(15)), 0)  # before the origin
+        self.assertEqual(self.grid.mask(self.at(45), self.at(45)), 0)
+
+    def test_refresh_sets_and_clears_slot_bits(self):
+        intervals = SlotIntervals()
+        intervals.add(1, self.at(15), self.at(45))
+        intervals.add(2, self.at(60), self.at(61))
+        self.grid.refresh(7, intervals)
+        self.assertEqual(self.grid.bits[7], 0b1011)
+        intervals.remove(1)
+        self.grid.refresh(7, intervals)
+        self.assertEqual(self.grid.bits[7], 0b1000)
+        self.grid.refresh(7, None)
+        self.assertNotIn(7, self.grid.bits)
+
+
+class AvailabilityIndexTests(ParkingTestCase):
+    def windows(self):
+        now = timezone.now()
+        for start, hours in ((1, 1), (2, 2), (3, 1), (4, 3), (5, 1), (30, 2), (24 * 20, 1)):
+            yield now + timedelta(hours=start), now + timedelta(hours=start + hours)
+
+    def assertMatchesDatabase(self):
+        subareas = subareas_of(get_inventory())
+        for start, end in self.windows():
+            expected = set(ParkingSlot.objects.free_between(start, end).values_list('id', flat=True))
+            self.assertEqual(availability_index.free_slots(subareas, start, end), expected)
+
+    def test_free_slots_match_free_between(self):
+        self.assertMatchesDatabase()
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(
+                user=self.user, parking_slot=self.slots[4], vehicle_number='KA01AB9', status='reserved',
+                start_time=timezone.now() + timedelta(hours=2), end_time=timezone.now() + timedelta(hours=4),
+            )
+        self.assertMatchesDatabase()
+
+    def test_grid_rolls_forward(self):
+        subareas = subareas_of(get_inventory())
+        availability_index.warm()
+        grid = availability_index._grid
+        later = timezone.now() + timedelta(days=2)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            availability_index.free_slots(subareas, later + timedelta(hours=1), later + timedelta(hours=2))
+        self.assertIsNot(availability_index._grid, grid)
+        self.assertEqual(availability_index._grid.origin, OccupancyGrid(later, 1).origin)
+        self.assertMatchesDatabase()
+
+    def test_index_follows_saves_cancellations_and_deletes(self):
+        start, end = timezone.now() + timedelta(hours=20), timezone.now() + timedelta(hours=22)
+        slot = self.slots[4]
+        self.assertTrue(availability_index.is_free(slot.pk, start, end))
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = services.reserve_slot(self.user, slot.pk, '4-wheeler', 'KA01AB9', start, end)
+        self.assertFalse(availability_index.is_free(slot.pk, start, end))
+        with self.captureOnCommitCallbacks(execute=True):
+            services.cancel_reservation(booking)
+        self.assertTrue(availability_index.is_free(slot.pk, start, end))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = services.reserve_slot(self.user, slot.pk, '4-wheeler', 'KA01AB9', start, end)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.status = 'completed'
+            booking.save()
+        self.assertTrue(availability_index.is_free(slot.pk, start, end))
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.status = 'reserved'
+            booking.save()
+        self.assertFalse(availability_index.is_free(slot.pk, start, end))
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.delete()
+        self.assertTrue(availability_index.is_free(slot.pk, start, end))
+
+    def test_is_free_sees_changes_from_other_processes(self):
+        start, end = self.reserved.start_time, self.reserved.end_time
+        self.assertFalse(availability_index.is_free(self.slots[0].pk, start, end))
+        # Expired elsewhere: no signal here, only the area's new version in the cache
+        Booking.objects.filter(pk=self.reserved.pk).update(status='expired')
+        cache.set(f'parking:availability:area:{self.area.pk}', 0, None)
+        self.assertTrue(availability_index.is_free(self.slots[0].pk, start, end))
+        self.assertTrue(self.slots[0].is_slot_available(start, end))
+
+    def test_reset_while_reloading_a_changed_area(self):
+        subareas = subareas_of(get_inventory())
+        availability_index.warm()
+        cache.set(f'parking:availability:area:{self.area.pk}', 0, None)  # changed by "another process"
+
+        def reset_meanwhile(**kwargs):
+            availability_index.reset()
+            return get_inventory(**kwargs)
+
+        start, end = next(self.windows())
+        with mock.patch('parking.inventory.get_inventory', side_effect=reset_meanwhile):
+            self.assertIsNone(availability_index.free_slots(subareas, start, end))
+        self.assertFalse(availability_index.is_warm)
+
+
+# -------------------------------
+# Reservations
+# -------------------------------
+class ReserveSlotTests(ParkingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.slot = self.slots[4]  # free, no bookings
+        self.start = timezone.now() + timedelta(hours=10)
+
+    def reserve(self, start, hours):
+        with self.captureOnCommitCallbacks(execute=True):
+            return services.reserve_slot(
+                self.user, self.slot.pk, '4-wheeler', 'KA01AB9',
+                self.start + timedelta(hours=start), self.start + timedelta(hours=start + hours),
+            )
+
+    def test_overlapping_reservation_is_refused(self):
+        self.reserve(0, 2)
+        with self.assertRaises(services.SlotUnavailableError):
+            self.reserve(1, 2)
+        with self.assertRaises(services.SlotUnavailableError):
+            self.reserve(-1, 4)
+        self.assertEqual(Booking.objects.filter(parking_slot=self.slot).count(), 1)
+
+    def test_back_to_back_reservations(self):
+        self.reserve(0, 2)
+        self.reserve(2, 1)
+        self.reserve(-1, 1)
+        self.assertEqual(Booking.objects.filter(parking_slot=self.slot, status='reserved').count(), 3)
+
+    def test_side_effects(self):
+        sub_area = SubAreaOccupancy.objects.get(sub_area=self.slot.sub_area)
+        area = AreaOccupancy.objects.get(area=self.slot.sub_area.area)
+        booking = self.reserve(0, 2)
+        self.assertEqual(booking.status, 'reserved')
+        self.assertAlmostEqual(
+            booking.expiry_time, booking.reservation_time + services.RESERVATION_GRACE_PERIOD, delta=timedelta(seconds=1)
+        )
+        self.slot.refresh_from_db()
+        self.assertFalse(self.slot.is_available)
+        after = SubAreaOccupancy.objects.get(sub_area=self.slot.sub_area)
+        self.assertEqual(
+            (after.free_slots, after.reserved_slots), (sub_area.free_slots - 1, sub_area.reserved_slots + 1)
+        )
+        self.assertEqual(AreaOccupancy.objects.get(area=area.area).free_slots, area.free_slots - 1)
+        # A second window on a held slot counts a reservation but no free slot
+        self.reserve(3, 1)
+        after = SubAreaOccupancy.objects.get(sub_area=self.slot.sub_area)
+        self.assertEqual(
+            (after.free_slots, after.reserved_slots), (sub_area.free_slots - 1, sub_area.reserved_slots + 2)
+        )
+        # A refused claim changes nothing
+        with self.assertRaises(services.SlotUnavailableError):
+            self.reserve(0, 1)
+        after = SubAreaOccupancy.objects.get(sub_area=self.slot.sub_area)
+        self.assertEqual(after.reserved_slots, sub_area.reserved_slots + 2)
+
+
+class ExpiryTests(ParkingTestCase):
+    def stale(self, slot, hours=10):
+        """A reservation on ``slot`` whose grace period ran out a minute ago."""
+        start = timezone.now() + timedelta(hours=hours)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = services.reserve_slot(
+                self.user, slot.pk, '4-wheeler', 'KA01AB9', start, start + timedelta(hours=1)
+            )
+        Booking.objects.filter(pk=booking.pk).update(expiry_time=timezone.now() - timedelta(minutes=1))
+        return booking
+
+    def counters(self):
+        return occupancy.for_areas(), set(SubAreaOccupancy.objects.values_list(
+            'sub_area_id', 'free_slots', 'reserved_slots', 'active_slots'
+        ))
+
+    def test_expires_in_chunks(self):
+        slots = self.slots[4:9]
+        bookings = [self.stale(slot) for slot in slots]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(services.expire_stale_reservations(chunk_size=2), len(bookings))
+        statuses = Booking.objects.filter(pk__in=[booking.pk for booking in bookings]).values_list('status', flat=True)
+        self.assertEqual(set(statuses), {'expired'})
+        flags = ParkingSlot.objects.filter(pk__in=[slot.pk for slot in slots]).values_list('is_available', flat=True)
+        self.assertTrue(all(flags))
+        self.reserved.refresh_from_db()
+        self.assertEqual(self.reserved.status, 'reserved')  # still in its grace period
+        counted = self.counters()
+        occupancy.recount()
+        self.assertEqual(counted, self.counters())
+
+    def test_slot_held_by_a_later_booking_stays_unavailable(self):
+        slot = self.slots[4]
+        self.stale(slot)
+        with self.captureOnCommitCallbacks(execute=True):
+            later = services.reserve_slot(
+                self.user, slot.pk, '4-wheeler', 'KA01AB9',
+                timezone.now() + timedelta(hours=20), timezone.now() + timedelta(hours=21),
+            )
+        before = SubAreaOccupancy.objects.get(sub_area=slot.sub_area)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(services.expire_stale_reservations(), 1)
+        self.assertFalse(ParkingSlot.objects.get(pk=slot.pk).is_available)
+        self.assertEqual(Booking.objects.get(pk=later.pk).status, 'reserved')
+        after = SubAreaOccupancy.objects.get(sub_area=slot.sub_area)
+        self.assertEqual(
+            (after.free_slots, after.reserved_slots), (before.free_slots, before.reserved_slots - 1)
+        )
+
+    def test_booking_started_meanwhile_triggers_a_recount(self):
+        bookings = [self.stale(slot) for slot in self.slots[4:7]]
+        started = bookings[1]
+        atomic, raced = transaction.atomic, []
+
+        def racing_atomic(*args, **kwargs):
+            # Another request starts one of the bookings between the read and the UPDATE
+            if not raced:
+                raced.append(True)
+                services.start_parking_session(started, now=timezone.now() - timedelta(minutes=2))
+            return atomic(*args, **kwargs)
+
+        with mock.patch('django.db.transaction.atomic', side_effect=racing_atomic), \
+                mock.patch.object(occupancy, 'recount', wraps=occupancy.recount) as recount, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(services.expire_stale_reservations(), 2)
+        recount.assert_called_once_with()
+        self.assertEqual(Booking.objects.get(pk=started.pk).status, 'active')
+        self.assertFalse(ParkingSlot.objects.get(pk=started.parking_slot_id).is_available)
+        counted = self.counters()
+        occupancy.recount()
+        self.assertEqual(counted, self.counters())
+
+    def test_command(self):
+        self.stale(self.slots[4])
+        out = StringIO()
+        call_command('expire_reserved_bookings', chunk_size=1, stdout=out)
+        self.assertIn('Successfully expired 1 bookings', out.getvalue())
+
+    def test_loop_runs_until_interrupted(self):
+        self.stale(self.slots[4])
+        out = StringIO()
+        with mock.patch('time.sleep', side_effect=[None, KeyboardInterrupt]) as sleep:
+            call_command('expire_reserved_bookings', loop=True, interval=5, stdout=out)
+        self.assertEqual(sleep.call_args_list, [mock.call(5), mock.call(5)])
+        # Quiet passes print nothing when nothing expired
+        self.assertEqual(out.getvalue().count('Successfully expired'), 1)
+        self.assertIn('Successfully expired 1 bookings', out.getvalue())
+        self.assertTrue(out.getvalue().rstrip().endswith('Stopped.'))
+
+
+# -------------------------------
+# Occupancy counters
+# -------------------------------
+class OccupancyCounterTests(ParkingTestCase):
+    def counters(self):
+        return occupancy.for_areas(), set(SubAreaOccupancy.objects.values_list(
+            'sub_area_id', 'total_slots', 'free_slots', 'reserved_slots', 'active_slots'
+        ))
+
+    def assertMatchesRecount(self):
+        counted = self.counters()
+        occupancy.recount()
+        self.assertEqual(counted, self.counters())
+
+    def test_services_keep_the_counters(self):
+        start = timezone.now() + timedelta(hours=10)
+
+        def reserve(slot):
+            return services.reserve_slot(self.user, slot.pk, '4-wheeler', 'KA01AB9', start, start + timedelta(hours=1))
+
+        steps = [
+            lambda: reserve(self.slots[4]),
+            lambda: services.start_parking_session(self.reserved),
+            lambda: services.end_parking_session(self.active),
+            lambda: services.record_payment(self.active),
+            lambda: services.cancel_reservation(Booking.objects.get(parking_slot=self.slots[4])),
+            lambda: reserve(self.slots[5]),
+            lambda: services.expire_stale_reservations(now=timezone.now() + timedelta(hours=1)),
+        ]
+        for step in steps:
+            with self.captureOnCommitCallbacks(execute=True):
+                step()
+            self.assertMatchesRecount()
+
+    def test_direct_slot_edits(self):
+        slot = ParkingSlot.objects.get(pk=self.slots[4].pk)
+        slot.is_available = False
+        slot.save()
+        self.assertMatchesRecount()
+        slot.is_available = True
+        slot.save(update_fields=['is_available'])
+        self.assertMatchesRecount()
+        # Moving a slot takes its live bookings along
+        held = ParkingSlot.objects.get(pk=self.slots[0].pk)
+        held.sub_area, held.slot_number = self.slots[6].sub_area, '7'
+        held.save()
+        self.assertMatchesRecount()
+        ParkingSlot.objects.create(sub_area=self.sub_area, slot_number='9')
+        self.assertMatchesRecount()
+        held.delete()
+        self.assertMatchesRecount()
+
+    def test_direct_booking_edits(self):
+        booking = Booking.objects.get(pk=self.reserved.pk)
+        booking.status = 'active'
+        booking.save()
+        self.assertMatchesRecount()
+        booking.parking_slot = self.slots[7]
+        booking.save()
+        self.assertMatchesRecount()
+        booking.status = 'cancelled'
+        booking.save(update_fields=['status'])
+        self.assertMatchesRecount()
+        Booking.objects.create(
+            user=self.user, parking_slot=self.slots[8], vehicle_number='KA01AB9', status='reserved',
+        )
+        self.assertMatchesRecount()
+        Booking.objects.get(pk=self.active.pk).delete()
+        self.assertMatchesRecount()
+
+
+# -------------------------------
+# "Any free slot" allocation
+# -------------------------------
+class AllocatorTests(ParkingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.sub_area = self.slots[3].sub_area  # North L2: covered 1 and 3, open 2, no bookings
+        self.start = timezone.now() + timedelta(hours=10)
+        self.end = self.start + timedelta(hours=2)
+
+    def allocate(self, start=None, end=None, slot_type=''):
+        with self.captureOnCommitCallbacks(execute=True):
+            return slot_allocator.allocate(
+                self.user, self.sub_area.pk, '4-wheeler', 'KA01AB9', start or self.start, end or self.end,
+                slot_type=slot_type,
+            )
+
+    def post(self, **data):
+        data = {
+            'vehicle_type': '4-wheeler', 'vehicle_number': 'KA01AB9',
+            'start_time': form_time(self.start), 'end_time': form_time(self.end), 'slot_type': '', **data,
+        }
+        return self.client.post(
+            reverse('parking:allocate_slot', args=[self.sub_area.pk]), data, HTTP_ACCEPT='application/json'
+        )
+
+    def test_distinct_slots_until_the_pool_runs_out(self):
+        slot_ids = {self.post().json()['slot'] for _ in range(3)}
+        self.assertEqual(slot_ids, {slot.pk for slot in self.slots[3:6]})
+        response = self.post()
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('No parking slot is free', response.json()['error'])
+
+    def test_slot_type(self):
+        self.assertEqual(self.allocate(slot_type='open').parking_slot_id, self.slots[4].pk)
+        with self.assertRaises(services.SlotUnavailableError):
+            self.allocate(slot_type='open')
+        self.assertEqual(self.allocate(slot_type='covered').parking_slot_id, self.slots[3].pk)
+
+    def test_lost_claim_falls_back_to_the_next_slot(self):
+        self.assertEqual(self.allocate().parking_slot_id, self.slots[3].pk)
+        # Taken by another process: this one's pool still lists the slot as free
+        later = self.end + timedelta(hours=5)
+        Booking.objects.create(
+            user=self.staff, parking_slot=self.slots[5], vehicle_number='KA01AB8', status='reserved',
+            start_time=later, end_time=later + timedelta(hours=2),
+        )
+        ParkingSlot.objects.filter(pk=self.slots[5].pk).update(is_available=False)
+        booking = self.allocate(later, later + timedelta(hours=1))
+        self.assertEqual(booking.parking_slot_id, self.slots[4].pk)
+
+    def test_held_slots_free_for_the_window_are_used(self):
+        for _ in range(3):
+            self.allocate()
+        # Every slot is held now, but all are free three hours later
+        later = self.end + timedelta(hours=3)
+        self.assertIsNotNone(self.allocate(later, later + timedelta(hours=1)))
+
+    def test_field_errors_are_shown(self):
+        response = self.client.post(
+            reverse('parking:allocate_slot', args=[self.sub_area.pk]),
+            {'vehicle_type': '4-wheeler', 'vehicle_number': 'X' * 20,
+             'start_time': form_time(self.start), 'end_time': form_time(self.end)},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Ensure this value has at most 15 characters')
+
+
+# -------------------------------
+# Tariffs
+# -------------------------------
+def tariff(id, hourly_rate, start_hour=0, end_hour=24, area_id=None, slot_type='', vehicle_type=''):
+    return {
+        'id': id, 'area_id': area_id, 'slot_type': slot_type, 'vehicle_type': vehicle_type,
+        'start_hour': start_hour, 'end_hour': end_hour, 'hourly_rate': Decimal(hourly_rate),
+    }
+
+
+class TariffTableTests(TestCase):
+    def setUp(self):
+        cache.clear()  # the compiled table follows the tariff version in the cache
+        # Day rate 30 from 08:00 to 20:00, night rate 10 from 22:00 to 06:00, 20 otherwise
+        self.table = TariffTable([tariff(1, '30', 8, 20), tariff(2, '10', 22, 6)], Decimal('20'))
+        self.row = self.table.row(None, '', '')
+
+    def price(self, start_hour, hours):
+        return list(self.table.price_hours([self.row], [start_hour], [hours]))[0]
+
+    def test_rate_changes_within_a_stay(self):
+        self.assertEqual(self.price(7, 2), to_paise(20 + 30))
+        self.assertEqual(self.price(19, 4), to_paise(30 + 20 + 20 + 10))
+        self.assertEqual(self.price(10, 0), 0)
+
+    def test_stays_across_midnight(self):
+        self.assertEqual(self.price(23, 3), to_paise(10 * 3))
+        self.assertEqual(self.price(21, 10), to_paise(20 + 10 * 8 + 20))
+        day = 30 * 12 + 10 * 8 + 20 * 4
+        self.assertEqual(self.price(23, 25), to_paise(day + 10))
+
+    def test_most_specific_tariff_wins(self):
+        table = TariffTable([tariff(1, '30'), tariff(2, '50', area_id=7), tariff(3, '40', slot_type='covered')], Decimal('20'))
+        prices = table.price_hours(
+            [table.row(7, 'covered', '2-wheeler'), table.row(8, 'covered', ''), table.row(8, 'open', '')],
+            [0, 0, 0], [1, 1, 1],
+        )
+        self.assertEqual(list(prices), [to_paise(50), to_paise(40), to_paise(30)])
+
+    def test_default_rate_matches_the_old_flat_rate(self):
+        # Before tariffs every started hour cost a flat 20
+        self.assertEqual(default_hourly_rate(), Decimal('20'))
+        start = timezone.now()
+        self.assertEqual(
+            price_stays([(None, 'open', '2-wheeler', start, start + timedelta(minutes=150))]), [Decimal('60.00')]
+        )
+
+    @unittest.skipIf(tariffs.np is None, 'NumPy is not installed')
+    def test_numpy_and_plain_python_prices_agree(self):
+        rows = [
+            tariff(1, '30', 8, 20), tariff(2, '10', 22, 6), tariff(3, '45.50', 9, 17, area_id=7),
+            tariff(4, '12.25', 0, 24, slot_type='covered'), tariff(5, '60', 18, 2, area_id=7, vehicle_type='4-wheeler'),
+        ]
+        vectorised = TariffTable(rows, Decimal('20'))
+        with mock.patch.object(tariffs, 'np', None):
+            plain = TariffTable(rows, Decimal('20'))
+        keys = [(area_id, slot_type, vehicle_type) for area_id in (None, 7, 8)
+                for slot_type in ('', 'open', 'covered') for vehicle_type in ('', '2-wheeler', '4-wheeler')]
+        rng = random.Random(18)
+        stays = [(rng.choice(keys), rng.randrange(24), rng.choice([-1, 0, 1, 23, 24, 25, rng.randrange(24 * 9)]))
+                 for _ in range(2000)]
+
+        def prices(table):
+            return [int(price) for price in table.price_hours(
+                [table.row(*key) for key, _, _ in stays], [start for _, start, _ in stays], [hours for _, _, hours in stays],
+            )]
+
+        self.assertIsInstance(vectorised.price_hours([0], [0], [1]), tariffs.np.ndarray)
+        self.assertIsInstance(plain.price_hours([0], [0], [1]), list)
+        self.assertEqual(prices(vectorised), prices(plain))
+
+
+class EndParkingSessionTests(ParkingTestCase):
+    def test_ending_charges_the_tariff(self):
+        Tariff.objects.create(name='Flat', hourly_rate=Decimal('35'))
+        start = self.active.start_time
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = services.end_parking_session(self.active, now=start + timedelta(minutes=61))
+        self.assertEqual(booking.amount, Decimal('70.00'))
+        self.active.refresh_from_db()
+        self.assertEqual((self.active.status, self.active.amount), ('completed', Decimal('70.00')))
+
+    def test_only_active_bookings_can_end(self):
+        never_started = Booking.objects.create(
+            user=self.user, parking_slot=self.slots[5], vehicle_number='KA01AB9', status='reserved',
+        )
+        for booking in (never_started, self.reserved, self.completed):
+            with self.assertRaisesMessage(services.BookingStateError, 'Invalid booking status.'):
+                services.end_parking_session(booking)
+
+
+# -------------------------------
+# Rollups
+# -------------------------------
+@override_settings(PARKING_ROLLUP_WORKERS=1)
+class BookingRollupTests(ParkingTestCase):
+    def totals(self):
+        return set(BookingHourlyRollup.objects.values_list(
+            'hour', 'sub_area_id', 'occupied_minutes', 'bookings', 'revenue'
+        ))
+
+    def test_runs_from_the_same_watermark_merge_once(self):
+        now = timezone.now()
+        refresh_booking_rollups(now=now - timedelta(hours=6))
+        stale = get_watermark(BOOKING_WATERMARK)
+        self.assertGreater(refresh_booking_rollups(now=now), 0)
+        totals = self.totals()
+        # A concurrent run that read the watermark before the first one moved it
+        with mock.patch('parking.rollups.get_watermark', return_value=stale):
+            self.assertEqual(refresh_booking_rollups(now=now), 0)
+        self.assertEqual(self.totals(), totals)
+        self.assertGreater(get_watermark(BOOKING_WATERMARK), stale)
+
+
+@override_settings(TIME_ZONE='Asia/Kolkata')
+class FeedbackRollupTests(ParkingTestCase):
+    def feedback(self, moment, rating, reason=''):
+        feedback = Feedback.objects.create(user=self.user, rating=rating, goal_achievement='Yes', reason=reason)
+        Feedback.objects.filter(pk=feedback.pk).update(submitted_on=moment)
+
+    def direct(self, since_day=None):
+        feedback = Feedback.objects.all()
+        if since_day is not None:
+            feedback = feedback.filter(submitted_on__gte=start_of_day(since_day))
+        counts = {dimension: Counter() for dimension in ('rating', 'goal_achievement', 'reason', 'issue')}
+        for row in feedback.values('rating', 'goal_achievement', 'reason', 'issue'):
+            for dimension, value in row.items():
+                counts[dimension]['' if value is None else str(value)] += 1
+        return counts
+
+    def test_rollups_and_live_rows_add_up_to_a_direct_count(self):
+        today = timezone.localdate()
+        watermark = start_of_day(today - timedelta(days=1))
+        for moment, rating, reason in [
+            (watermark - timedelta(days=3), 4, 'Support'),
+            (watermark - timedelta(microseconds=1), 2, 'Other'),  # last moment rolled up
+            (watermark, 1, 'Support'),  # first moment of the watermark day, counted live
+            (watermark + timedelta(hours=23), 5, ''),
+        ]:
+            self.feedback(moment, rating, reason)
+        refresh_feedback_rollups(today=today - timedelta(days=1))
+        self.assertEqual(get_watermark(FEEDBACK_WATERMARK), watermark)
+        # Arrives after the rollup ran
+        self.feedback(watermark + timedelta(hours=1), 3, 'Other')
+        for since_day in (None, today - timedelta(days=4), today - timedelta(days=2), today - timedelta(days=1), today):
+            with self.subTest(since_day=since_day):
+                self.assertEqual(feedback_summary(since_day), self.direct(since_day))
+
+
+# -------------------------------
+# Migrations
+# -------------------------------
+class MigrationTests(TransactionTestCase):
+    """Migrations 0015 onwards, which the test database (built from the models) skips.
+
+    The earlier ones do not apply to an empty database, so the schema is
+    marked as migrated, taken back to 0014 and migrated forward again.
+    """
+    before = ('parking', '0014_alter_loginregisterlog_user')
+
+    def migrate(self, target):
+        with override_settings(MIGRATION_MODULES={}):
+            executor = MigrationExecutor(connection)
+            executor.migrate([target])
+            return executor.loader.project_state(target).apps
+
+    def test_migrating_forward_from_0014(self):
+        with override_settings(MIGRATION_MODULES={}):
+            executor = MigrationExecutor(connection)
+            latest = executor.loader.graph.leaf_nodes('parking')[0]
+            for app_label, name in executor.loader.graph.forwards_plan(latest):
+                if app_label == 'parking':
+                    executor.recorder.record_applied(app_label, name)
+        self.addCleanup(clear_search_index)
+
+        old = self.migrate(self.before)
+        area = old.get_model('parking', 'Area').objects.create(name='Harbour', description='Dockside')
+        sub_area = old.get_model('parking', 'SubArea').objects.create(area=area, name='Basement')
+        ParkingSlotBefore = old.get_model('parking', 'ParkingSlot')
+        slots = [ParkingSlotBefore.objects.create(sub_area=sub_area, slot_number=str(n)) for n in range(3)]
+        ParkingSlotBefore.objects.filter(pk=slots[0].pk).update(is_available=False)
+        user = old.get_model('parking', 'User').objects.create(username='sailor')
+        old.get_model('parking', 'Booking').objects.create(
+            user=user, parking_slot=slots[0], vehicle_number='KA01AB1', status='reserved',
+        )
+
+        self.migrate(latest)
+        self.assertEqual(
+            occupancy.for_areas([area.pk])[area.pk], {'total': 3, 'free': 2, 'reserved': 1, 'active': 0}
+        )
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(cursor, Booking._meta.db_table)
+        names = {index.name for index in Booking._meta.indexes}
+        self.assertLessEqual(names, set(indexes))
+        self.assertFalse({'booking_live_window_idx', 'booking_reserved_expiry_idx'} & set(indexes))
+        if search.fts_supported():
+            hits = {(hit['kind'], hit['id']) for hit in search.fts_search('harbour')}
+            self.assertEqual(hits, {('area', area.pk), ('subarea', sub_area.pk)})
@@ -0,0 +1,104 @@
+"""
+Failed-login throttling with token buckets kept in the cache.
+
+Each client IP and each submitted username/email has a bucket of
+``capacity`` tokens that refills at ``capacity / per_seconds`` tokens per
+second. A failed login takes a token, and a successful one refills the
+username's bucket (not the IP's); a login attempt against an empty
+bucket is turned away before authenticate() runs, so it costs neither a
+password hash nor a database write. Only aggregate rejection counts are
+kept (``rejections``), plus one log line when a bucket runs dry.
+
+Buckets live in the Django cache, so with several server processes use a
+shared cache backend. Reads and writes are not atomic: under concurrent
+bursts a handful of extra attempts can get through, which is fine for
+throttling.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMITS = {
+    'ip': {'capacity': 20, 'per_seconds': 300},
+    'username': {'capacity': 5, 'per_seconds': 300},
+}
+
+KEY = 'parking:throttle:login:{scope}:{ident}'
+
+# Attempts turned away per scope since the process started
+rejections = Counter()
+_rejections_lock = threading.Lock()
+
+
+def _limits():
+    return getattr(settings, 'PARKING_LOGIN_THROTTLE', DEFAULT_LIMITS)
+
+
+def client_ip(request):
+    if getattr(settings, 'PARKING_THROTTLE_TRUST_X_FORWARDED_FOR', False):
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _refill(state, now, capacity, per_seconds):
+    """Tokens in a bucket stored as (tokens, timestamp), refilled up to now."""
+    if state is None:
+        return float(capacity)
+    tokens, updated = state
+    return min(float(capacity), tokens + (now - updated) * capacity / per_seconds)
+
+
+class LoginThrottle:
+    def __init__(self, request, username):
+        idents = {'ip': client_ip(request), 'username': (username or '').strip().casefold()}
+        limits = _limits()
+        # Hash identifiers: no raw usernames in cache keys, and a fixed key length
+        self.buckets = {
+            KEY.format(scope=scope, ident=hashlib.sha256(ident.encode()).hexdigest()[:32]): (scope, limits[scope])
+            for scope, ident in idents.items()
+            if ident and scope in limits
+        }
+
+    def retry_after(self):
+        """Seconds until an attempt is allowed, or 0 if it is allowed now."""
+        if not self.buckets:
+            return 0
+        now = time.time()
+        states = cache.get_many(list(self.buckets))
+        wait = 0
+        for key, (scope, limit) in self.buckets.items():
+            tokens = _refill(states.get(key), now, limit['capacity'], limit['per_seconds'])
+            if tokens < 1:
+                wait = max(wait, (1 - tokens) * limit['per_seconds'] / limit['capacity'])
+                with _rejections_lock:
+                    rejections[scope] += 1
+        return int(wait) + 1 if wait else 0
+
+    def record_failure(self):
+        if not self.buckets:
+            return
+        now = time.time()
+        states = cache.get_many(list(self.buckets))
+        updates = {}
+        for key, (scope, limit) in self.buckets.items():
+            tokens = _refill(states.get(key), now, limit['capacity'], limit['per_seconds']) - 1
+            if 0 <= tokens < 1:
+                logger.warning(f"Login throttle engaged for one {scope}.")
+            updates[key] = (max(tokens, 0.0), now)
+        timeout = max(limit['per_seconds'] for _, limit in self.buckets.values())
+        cache.set_many(updates, timeout)
+
+    def record_success(self):
+        """Forget the username's failures; the IP keeps its bucket."""
+        keys = [key for key, (scope, _) in self.buckets.items() if scope == 'username']
+        if keys:
+            cache.delete_many(keys)
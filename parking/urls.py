@@ -16,7 +16,7 @@ urlpatterns = [
     path('slots/', views.slots, name='slots'),
 
     # Custom Login Page (parking/login.html inside templates/)
-    path('accounts/login/', auth_views.LoginView.as_view(template_name='parking/login.html', redirect_authenticated_user=True), name='login'),  # Add redirect_authenticated_user=True
+    path('accounts/login/', views.ThrottledLoginView.as_view(template_name='parking/login.html', redirect_authenticated_user=True), name='login'),  # Add redirect_authenticated_user=True
 
     # Logout
     path('logout/', views.logout_view, name='logout'),
@@ -30,6 +30,9 @@ urlpatterns = [
     # Book Slot - New direct reservation implementation
     path('book/', views.book_slot, name='book_slot_direct'),
 
+    # Book Any Free Slot - The allocator picks a free slot in the sub-area
+    path('subarea/<int:subarea_id>/allocate/', views.allocate_slot, name='allocate_slot'),
+
     # Start and End Parking Session - NEW
     path('start-parking/<int:booking_id>/', views.start_parking, name='start_parking'),
     path('end-parking/<int:booking_id>/', views.end_parking, name='end_parking'),
@@ -50,9 +53,16 @@ urlpatterns = [
     # Search Area - Search for areas by name
     path('search_area/', views.search_area, name='search_area'),
 
+    # Search Autocomplete - Area/sub-area suggestions for the search box
+    path('search/autocomplete/', views.search_autocomplete, name='search_autocomplete'),
+
     # Area Detail - Shows specific area details with subareas and slots
     path('area/<int:area_id>/', views.area_detail, name='area_detail'),
 
+    # Availability JSON - booked slots and free counts, polled by the search results page
+    path('availability/', views.availability, name='availability'),
+    path('availability/stream/', views.availability_stream, name='availability_stream'),
+
     # Subareas and Slots - List of all subareas with their parking slots
     path('subareas-and-slots/', views.subareas_and_slots, name='subareas_and_slots'),
 
@@ -65,6 +75,12 @@ urlpatterns = [
     # Feedback Page - Form submission for feedback
     path('feedback/', login_required(views.feedback), name='feedback'),
 
+    # Feedback Dashboard - Staff-only feedback analytics
+    path('feedback/dashboard/', views.feedback_dashboard, name='feedback_dashboard'),
+
+    # Booking Report - Staff-only occupancy and revenue from the hourly rollups
+    path('reports/bookings/', views.booking_report, name='booking_report'),
+
     # Booking Success - Page displayed after successful booking
     path('booking_success/', views.booking_success, name='booking_success'),
 ]
\ No newline at end of file
@@ -1,5 +1,6 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
+from django.contrib.auth import views as auth_views
 from django.contrib import messages
 from django.utils import timezone
 from django.contrib.auth.decorators import login_required
@@ -10,33 +11,152 @@ from django.db.models import Q
 from django.db.models import Count, Avg
 from django.contrib.admin.views.decorators import staff_member_required
 from django.utils import timezone
-from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 from django.core.serializers.json import DjangoJSONEncoder
-from datetime import timedelta
+from django.utils.dateparse import parse_datetime
+from django.utils.cache import patch_cache_control
+from django.utils.http import urlencode
+from django.urls import reverse
+from django.views.decorators.http import condition, require_GET
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from asgiref.sync import sync_to_async
+from datetime import datetime, timedelta, timezone as dt_timezone
+import asyncio
+import hashlib
+import hmac
 import json
 import math
 import logging
 
 from .models import Area, SubArea, ParkingSlot, Booking, Feedback
-from .forms import UserRegistrationForm, BookingForm, ContactForm, FeedbackForm
+from .forms import UserRegistrationForm, BookingForm, ContactForm, FeedbackForm, SlotAllocationForm
 from .models import LoginRegisterLog, UserAuthenticationRegistration
+from .services import (
+    reserve_slot, start_parking_session, end_parking_session,
+    record_payment, cancel_reservation, expire_stale_reservations,
+)
+from . import audit, instrumentation, occupancy, search
+from .allocator import slot_allocator
+from .availability import area_versions, availability_index
+from .events import broker
+from .pagination import keyset_page
+from .rollups import BOOKING_WATERMARK, booking_summary, feedback_summary, get_watermark, rollup_days, start_of_day
+from .throttle import LoginThrottle
+from .inventory import get_inventory, get_area, get_subarea, subareas_of, get_version as get_inventory_version
 
 logger = logging.getLogger(__name__)
 
+# Window used for availability when the request does not give one
+DEFAULT_AVAILABILITY_WINDOW = timedelta(hours=1)
+
+# Seconds between keepalive comments on an idle event stream
+EVENT_STREAM_KEEPALIVE = 15
+
+# Most search hits considered per query, and completions per autocomplete
+SEARCH_RESULT_LIMIT = 50
+AUTOCOMPLETE_LIMIT = 8
+
+# Booking history rows per page, and cap on the "current bookings" list
+BOOKING_HISTORY_PAGE_SIZE = 20
+CURRENT_BOOKINGS_LIMIT = 50
+
+# -------------------------------
+# Availability helpers
+# -------------------------------
+def _parse_window_time(value):
+    try:
+        parsed = parse_datetime(value or '')
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+def get_availability_window(request, default_start=None):
+    """(start, end) from ?start=&end=, defaulting to the next hour."""
+    start_time = _parse_window_time(request.GET.get('start')) or default_start or timezone.now()
+    end_time = _parse_window_time(request.GET.get('end'))
+    if end_time is None or end_time <= start_time:
+        end_time = start_time + DEFAULT_AVAILABILITY_WINDOW
+    return start_time, end_time
+
+def annotate_free_slots(subareas, start_time, end_time, scoped=True):
+    """Set ``free_count`` on each inventory sub-area and return the set of free slot IDs.
+
+    This is the live availability overlay on top of the cached inventory.
+    The in-memory occupancy grid answers it when it covers the window;
+    otherwise it costs two queries however many sub-areas and slots are
+    involved. Pass ``scoped=False`` when ``subareas`` is the whole inventory.
+    """
+    free_slot_ids = availability_index.free_slots(subareas, start_time, end_time)
+    if free_slot_ids is not None:
+        for subarea in subareas:
+            subarea['free_count'] = sum(slot['id'] in free_slot_ids for slot in subarea['slots'])
+        return free_slot_ids
+
+    sub_area = [subarea['id'] for subarea in subareas] if scoped else None
+    free_slots = ParkingSlot.objects.free_between(start_time, end_time, sub_area=sub_area)
+    free_slot_ids = set(free_slots.values_list('id', flat=True))
+    free_counts = free_slots.counts_by_sub_area()
+    for subarea in subareas:
+        subarea['free_count'] = free_counts.get(subarea['id'], 0)
+    return free_slot_ids
+
+def availability_url(request, areas=None, view_name='parking:availability'):
+    """URL of the availability endpoint for ``areas`` (all areas if None) and the request's window."""
+    params = [('area', area['id']) for area in areas] if areas is not None else []
+    params += [(name, request.GET[name]) for name in ('start', 'end') if request.GET.get(name)]
+    url = reverse(view_name)
+    return f"{url}?{urlencode(params)}" if params else url
+
+def booking_history_page(request, bookings):
+    """Keyset page of ``bookings``, newest first, from ?before= / ?after= cursors."""
+    return keyset_page(
+        bookings,
+        before=request.GET.get('before'),
+        after=request.GET.get('after'),
+        page_size=BOOKING_HISTORY_PAGE_SIZE,
+    )
+
+def search_inventory(query, inventory=None):
+    """Areas matching ``query``, best first, and the sub-areas to show for them.
+
+    A hit on an area brings all of its sub-areas; a hit on a sub-area only
+    that sub-area.
+    """
+    inventory = inventory if inventory is not None else get_inventory()
+    areas_by_id = {area['id']: area for area in inventory}
+    ranked_areas, whole_area_ids, subarea_ids = {}, set(), set()
+    for hit in search.search(query, limit=SEARCH_RESULT_LIMIT):
+        area = areas_by_id.get(hit['area_id'])
+        if area is None:
+            continue  # index ahead of the cached inventory
+        ranked_areas.setdefault(area['id'], area)
+        if hit['kind'] == 'area':
+            whole_area_ids.add(area['id'])
+        else:
+            subarea_ids.add(hit['id'])
+    areas = list(ranked_areas.values())
+    subareas = [
+        subarea for area in areas for subarea in area['subareas']
+        if area['id'] in whole_area_ids or subarea['id'] in subarea_ids
+    ]
+    return areas, subareas
+
 # -------------------------------
 # Home view to display available areas and slots
 # -------------------------------
 def home(request):
     search_query = request.GET.get('search_query', '')
 
+    areas = get_inventory()
     if search_query:
-        areas = Area.objects.filter(name__icontains=search_query).prefetch_related('subareas__parkingslots')
-    else:
-        areas = Area.objects.prefetch_related('subareas__parkingslots')
+        areas, _ = search_inventory(search_query, areas)
 
-    if not areas.exists():
+    if not areas:
         messages.error(request, "No areas available.")
         return render(request, 'parking/home.html', {'areas': [], 'search_query': search_query, 'user': request.user})
 
@@ -55,7 +175,7 @@ def register(request):
         form = UserRegistrationForm(request.POST)
         if form.is_valid():
             user = form.save()
-            LoginRegisterLog.objects.create(user=user, action='register')
+            audit.log_auth_event(user, 'register')
             login(request, user)  # Automatically log in the user after registration
             messages.success(request, "Registration successful!")
             return redirect('home')  # Redirect to home.html after successful registration
@@ -68,20 +188,57 @@ def register(request):
 # -------------------------------
 # Login view for user authentication
 # -------------------------------
+def throttled_login_message(retry_after):
+    return f"Too many failed login attempts. Please try again in {retry_after} seconds."
+
 def login_view(request):
     if request.method == 'POST':
         username = request.POST.get('username')
         password = request.POST.get('password')
 
+        # Turn away throttled clients before paying for a password hash
+        throttle = LoginThrottle(request, username)
+        retry_after = throttle.retry_after()
+        if retry_after:
+            messages.error(request, throttled_login_message(retry_after))
+            response = render(request, 'parking/login.html', status=429)
+            response['Retry-After'] = str(retry_after)
+            return response
+
         user = authenticate(request, username=username, password=password)
         if user is not None:
+            throttle.record_success()
             login(request, user)
             return redirect('home')  # Redirect to home.html after successful login
         else:
+            throttle.record_failure()
             messages.error(request, "Invalid username or password. Please try again.")
     # Render login.html for GET requests
     return render(request, 'parking/login.html')
 
+class ThrottledLoginView(auth_views.LoginView):
+    """LoginView with the same failed-login throttle as login_view."""
+
+    def post(self, request, *args, **kwargs):
+        self.throttle = LoginThrottle(request, request.POST.get('username'))
+        retry_after = self.throttle.retry_after()
+        if retry_after:
+            # An unbound form: validating the posted one would run authenticate()
+            messages.error(request, throttled_login_message(retry_after))
+            form = self.get_form_class()(request=request)
+            response = self.render_to_response(self.get_context_data(form=form), status=429)
+            response['Retry-After'] = str(retry_after)
+            return response
+        return super().post(request, *args, **kwargs)
+
+    def form_valid(self, form):
+        self.throttle.record_success()
+        return super().form_valid(form)
+
+    def form_invalid(self, form):
+        self.throttle.record_failure()
+        return super().form_invalid(form)
+
 # -------------------------------
 # Logout view
 # -------------------------------
@@ -89,7 +246,7 @@ def logout_view(request):
     if request.user.is_authenticated:
         try:
             logger.debug(f"Creating log for user {request.user.username} with action 'logout'.")
-            LoginRegisterLog.objects.create(user=request.user, action='logout')
+            audit.log_auth_event(request.user, 'logout')
             logger.debug(f"Log successfully created for user {request.user.username} with action 'logout'.")
         except Exception as e:
             logger.error(f"Error creating logout log: {str(e)}")
@@ -102,32 +259,40 @@ def logout_view(request):
 # -------------------------------
 @login_required
 def dashboard(request):
+    # Read-only: stale reservations are expired by the background jobs
+    # (parking.background) or the expire_reserved_bookings command
     current_time = timezone.now()
 
-    # Update booking statuses based on current time
-    Booking.objects.filter(status='reserved', expiry_time__lt=current_time).update(status='completed')
+    # Live and unpaid bookings first (a handful per user), then one keyset
+    # page of the full history
+    user_bookings = Booking.objects.filter(user=request.user).for_listing()
+    current_bookings = list(user_bookings.current().order_by('-reservation_time', '-id')[:CURRENT_BOOKINGS_LIMIT])
+    history = booking_history_page(request, user_bookings)
 
-    # Get all user's bookings
-    user_bookings = Booking.objects.filter(user=request.user).order_by('-reservation_time')
+    # Get all areas and their subareas from the cached inventory
+    areas = get_inventory()
 
-    # Get available parking slots for new bookings
-    available_slots = ParkingSlot.objects.filter(is_available=True)
+    # Get parking slots that are free for the requested window
+    start_time, end_time = get_availability_window(request)
+    available_slots = ParkingSlot.objects.free_between(start_time, end_time)
+    free_slot_ids = annotate_free_slots(subareas_of(areas), start_time, end_time, scoped=False)
 
-    # Get all areas and their subareas
-    areas = Area.objects.prefetch_related('subareas__parkingslots').all()
+    # "X of Y free" per area from the occupancy counters
+    area_occupancy = occupancy.for_areas()
+    for area in areas:
+        area['occupancy'] = area_occupancy.get(area['id'])
 
     # Check if user has unpaid bookings
-    has_unpaid_bookings = Booking.objects.filter(
-        user=request.user,
-        status='completed',
-        paid=False
-    ).exists()
+    has_unpaid_bookings = any(booking.status == 'completed' and not booking.paid for booking in current_bookings)
+    if not has_unpaid_bookings and len(current_bookings) == CURRENT_BOOKINGS_LIMIT:
+        has_unpaid_bookings = Booking.objects.filter(user=request.user, status='completed', paid=False).exists()
 
     context = {
-        'user_bookings': user_bookings,
+        'user_bookings': history,
         'areas': areas,
-        'bookings': user_bookings,
+        'bookings': current_bookings,
         'available_slots': available_slots,
+        'free_slot_ids': free_slot_ids,
         'has_unpaid_bookings': has_unpaid_bookings,
         'current_time': current_time,
         'user': request.user,
@@ -142,26 +307,23 @@ def book_slot(request, slot_id=None):
     """Reserve a parking slot"""
     if slot_id:
         # Fetch the slot details
-        slot = get_object_or_404(ParkingSlot, id=slot_id)
+        slot = get_object_or_404(ParkingSlot.objects.select_related('sub_area__area'), id=slot_id)
 
         if request.method == 'POST':
             form = BookingForm(request.POST, parking_slot=slot)
 
             if form.is_valid():
-                booking = form.save(commit=False)
-                booking.user = request.user
-                booking.parking_slot = slot
-                booking.status = 'reserved'  # Set status to reserved
-                booking.reservation_time = timezone.now()  # Set the current time as reservation time
-                booking.expiry_time = booking.reservation_time + timedelta(minutes=15)  # Grace period starts from reservation time
-
                 try:
-                    booking.clean()  # Validate slot availability
-                    booking.save()
-
-                    # Mark the slot as unavailable
-                    slot.is_available = False
-                    slot.save()
+                    # Claims the slot and creates the reservation in one transaction;
+                    # the grace period starts from the reservation time
+                    booking = reserve_slot(
+                        request.user,
+                        slot,
+                        vehicle_type=form.cleaned_data['vehicle_type'],
+                        vehicle_number=form.cleaned_data['vehicle_number'],
+                        start_time=form.cleaned_data['start_time'],
+                        end_time=form.cleaned_data['end_time'],
+                    )
 
                     messages.success(request, f"Booking successful! Reserved at {booking.reservation_time}. Your grace period ends at {booking.expiry_time}.")
                     return redirect('parking:booking_success')  # Redirect to booking_success.html
@@ -179,20 +341,61 @@ def book_slot(request, slot_id=None):
     messages.error(request, "Invalid slot selection.")
     return redirect('parking:search_results')
 
+# -------------------------------
+# "Any free slot" booking
+# -------------------------------
+@login_required
+def allocate_slot(request, subarea_id):
+    """Reserve whichever slot of the sub-area is free; JSON for API clients."""
+    subarea = get_subarea(subarea_id)
+    if subarea is None:
+        raise Http404("No SubArea matches the given query.")
+    wants_json = 'application/json' in request.headers.get('Accept', '')
+
+    if request.method == 'POST':
+        form = SlotAllocationForm(request.POST)
+        if form.is_valid():
+            try:
+                booking = slot_allocator.allocate(
+                    request.user,
+                    subarea_id,
+                    vehicle_type=form.cleaned_data['vehicle_type'],
+                    vehicle_number=form.cleaned_data['vehicle_number'],
+                    start_time=form.cleaned_data['start_time'],
+                    end_time=form.cleaned_data['end_time'],
+                    slot_type=form.cleaned_data['slot_type'],
+                )
+            except ValidationError as e:
+                if wants_json:
+                    return JsonResponse({'error': e.messages[0]}, status=409)
+                form.add_error(None, e)
+            else:
+                if wants_json:
+                    return JsonResponse({
+                        'booking': booking.pk,
+                        'slot': booking.parking_slot_id,
+                        'expiry_time': booking.expiry_time,
+                    }, encoder=DjangoJSONEncoder, status=201)
+                messages.success(request, f"Booking successful! Reserved at {booking.reservation_time}. Your grace period ends at {booking.expiry_time}.")
+                return redirect('parking:booking_success')
+        elif wants_json:
+            return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+    else:
+        form = SlotAllocationForm()
+
+    return render(request, 'parking/allocate_slot.html', {'form': form, 'subarea': subarea})
+
 # -------------------------------
 # Start parking session
 # -------------------------------
 @login_required
 def start_parking(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id, user=request.user)
-    current_time = timezone.now()
 
-    if booking.status == 'reserved' and current_time <= booking.expiry_time:
-        booking.status = 'active'
-        booking.start_time = current_time
-        booking.save()
+    try:
+        start_parking_session(booking)
         messages.success(request, "Parking session started successfully.")
-    else:
+    except ValidationError:
         messages.error(request, "Your booking has expired or is invalid.")
 
     return redirect('parking:dashboard')
@@ -204,15 +407,11 @@ def start_parking(request, booking_id):
 def end_parking(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id, user=request.user)
     
-    if booking.status == 'active':
-        booking.end_time = timezone.now()
-        duration = (booking.end_time - booking.start_time).total_seconds() / 3600
-        duration_hours = math.ceil(duration)
-        rate_per_hour = 20
-        booking.amount = duration_hours * rate_per_hour
-        booking.status = 'completed'
-        booking.save()
+    try:
+        end_parking_session(booking)
         return redirect('parking:payment_page', booking_id=booking.id)
+    except ValidationError:
+        pass
     
     messages.error(request, "Invalid booking status.")
     return redirect('parking:dashboard')
@@ -225,10 +424,7 @@ def payment_success(request):
     if request.method == "POST":
         booking_id = request.POST.get('booking_id')
         booking = get_object_or_404(Booking, id=booking_id)
-        booking.paid = True
-        booking.save()
-        booking.parking_slot.is_available = True
-        booking.parking_slot.save()
+        record_payment(booking)
         messages.success(request, "Payment successful. Thank you for using our parking service!")
         return render(request, 'parking/payment_success.html')
     
@@ -239,7 +435,7 @@ def payment_success(request):
 # -------------------------------
 @login_required
 def payment_page(request, booking_id):
-    booking = get_object_or_404(Booking, id=booking_id, user=request.user)
+    booking = get_object_or_404(Booking.objects.select_related('parking_slot__sub_area__area'), id=booking_id, user=request.user)
     context = {
         'booking': booking,
     }
@@ -257,10 +453,7 @@ def booking_success(request):
 @login_required
 def cancel_booking(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id, user=request.user)
-    slot = booking.parking_slot
-    slot.is_available = True
-    slot.save()
-    booking.delete()
+    cancel_reservation(booking)
     messages.success(request, "Your booking has been cancelled.")
     return redirect('parking:dashboard')
 
@@ -269,14 +462,14 @@ def cancel_booking(request, booking_id):
 # -------------------------------
 @login_required
 def booking_detail(request, booking_id):
-    booking = get_object_or_404(Booking, id=booking_id, user=request.user)
+    booking = get_object_or_404(Booking.objects.select_related('parking_slot__sub_area__area'), id=booking_id, user=request.user)
     return render(request, 'parking/booking_detail.html', {'booking': booking})
 
 # -------------------------------
 # Areas View
 # -------------------------------
 def areas_view(request):
-    areas = Area.objects.all()
+    areas = get_inventory()
     return render(request, 'parking/areas.html', {'areas': areas})
 
 # -------------------------------
@@ -284,47 +477,212 @@ def areas_view(request):
 # -------------------------------
 def search_area(request):
     query = request.GET.get('q', '')
-    areas = Area.objects.filter(name__icontains=query) if query else Area.objects.all()
-    subareas = SubArea.objects.filter(area__in=areas).prefetch_related('parkingslots')
-
-    # Fetch booked slots using the is_available field
-    booked_slots = ParkingSlot.objects.filter(is_available=False)
-    booked_slot_ids = json.dumps(list(booked_slots.values_list('id', flat=True)), cls=DjangoJSONEncoder)
+    areas = get_inventory()
+    if query:
+        areas, subareas = search_inventory(query, areas)
+    else:
+        subareas = subareas_of(areas)
 
+    # The page fetches availability for these areas from the availability endpoint
     return render(request, 'parking/search_results.html', {
         'areas': areas,
         'subareas': subareas,
         'query': query,
-        'booked_slots': booked_slot_ids  # Pass booked slots to the template as JSON
+        'availability_url': availability_url(request, areas if query else None),
+        'availability_stream_url': availability_url(request, areas if query else None, 'parking:availability_stream'),
     })
 
+# -------------------------------
+# Search autocomplete
+# -------------------------------
+@require_GET
+def search_autocomplete(request):
+    """Area/sub-area completions for ?q=, served from the in-memory index."""
+    results = []
+    for hit in search.autocomplete(request.GET.get('q', ''), limit=AUTOCOMPLETE_LIMIT):
+        # Sub-areas link to their area's page, which lists them with their slots
+        results.append({
+            'label': hit['name'],
+            'kind': hit['kind'],
+            'url': reverse('parking:area_detail', args=[hit['area_id']]),
+        })
+    response = JsonResponse({'results': results})
+    patch_cache_control(response, max_age=60)
+    return response
+
 # -------------------------------
 # SubArea and Slots View
 # -------------------------------
 def subareas_and_slots(request):
-    subareas = SubArea.objects.prefetch_related('parkingslots').all()
+    subareas = subareas_of(get_inventory())
     return render(request, 'parking/subareas_and_slots.html', {'subareas': subareas})
 
 # -------------------------------
 # SubArea detail view
 # -------------------------------
 def subarea_detail(request, subarea_id):
-    subarea = get_object_or_404(SubArea, id=subarea_id)
-    slots = ParkingSlot.objects.filter(sub_area=subarea)
-    return render(request, 'parking/subarea_detail.html', {'subarea': subarea, 'slots': slots})
+    subarea = get_subarea(subarea_id)
+    if subarea is None:
+        raise Http404("No SubArea matches the given query.")
+    slots = subarea['slots']
+    start_time, end_time = get_availability_window(request)
+    free_slot_ids = annotate_free_slots([subarea], start_time, end_time)
+    return render(request, 'parking/subarea_detail.html', {
+        'subarea': subarea,
+        'slots': slots,
+        'free_slot_ids': free_slot_ids,
+    })
 
 # -------------------------------
 # Area detail view
 # -------------------------------
 def area_detail(request, area_id):
-    area = get_object_or_404(Area, id=area_id)
-    subareas = SubArea.objects.filter(area=area).prefetch_related('parkingslots')
+    area = get_area(area_id)
+    if area is None:
+        raise Http404("No Area matches the given query.")
+    subareas = area['subareas']
     return render(request, 'parking/search_results.html', {
         'area': area,
         'subareas': subareas,
-        'slots': ParkingSlot.objects.filter(sub_area__in=subareas),
+        'query': area['name'],
+        'slots': [slot for subarea in subareas for slot in subarea['slots']],
+        'availability_url': availability_url(request, [area]),
+        'availability_stream_url': availability_url(request, [area], 'parking:availability_stream'),
     })
 
+# -------------------------------
+# Availability JSON endpoint
+# -------------------------------
+def _id_list(request, name):
+    try:
+        return [int(value) for value in request.GET.getlist(name)]
+    except ValueError:
+        return None
+
+def _availability_scope(request):
+    """Resolve ?area=&sub_area= against the inventory, once per request.
+
+    Returns (area_ids, subareas, scoped), or None if the IDs are malformed.
+    """
+    if not hasattr(request, '_availability_scope'):
+        area_ids, subarea_ids = _id_list(request, 'area'), _id_list(request, 'sub_area')
+        if area_ids is None or subarea_ids is None:
+            request._availability_scope = None
+            return None
+        inventory = get_inventory()
+        scoped = bool(area_ids or subarea_ids)
+        wanted_areas, wanted_subareas = set(area_ids), set(subarea_ids)
+        subareas = [
+            subarea for subarea in subareas_of(inventory)
+            if not scoped or subarea['area_id'] in wanted_areas or subarea['id'] in wanted_subareas
+        ]
+        request._availability_scope = (
+            sorted({subarea['area_id'] for subarea in subareas} if scoped else {area['id'] for area in inventory}),
+            subareas,
+            scoped,
+        )
+    return request._availability_scope
+
+def _availability_window(request):
+    # Without an explicit start, use the current minute so that polls within
+    # the same minute share a window (and an ETag)
+    return get_availability_window(request, default_start=timezone.now().replace(second=0, microsecond=0))
+
+def _availability_etag(request):
+    scope = _availability_scope(request)
+    if scope is None:
+        return None
+    area_ids, subareas, _ = scope
+    start_time, end_time = _availability_window(request)
+    versions = area_versions(area_ids)
+    key = '|'.join([
+        str(get_inventory_version()),
+        ','.join(str(subarea['id']) for subarea in subareas),
+        ','.join(f"{area_id}:{versions[area_id]}" for area_id in area_ids),
+        start_time.isoformat(),
+        end_time.isoformat(),
+    ])
+    return hashlib.md5(key.encode()).hexdigest()
+
+def _availability_last_modified(request):
+    scope = _availability_scope(request)
+    if scope is None:
+        return None
+    area_ids = scope[0]
+    timestamps = list(area_versions(area_ids).values())
+    if 'start' not in request.GET:
+        # The default window moves with the clock
+        timestamps.append(_availability_window(request)[0].timestamp())
+    return datetime.fromtimestamp(max(timestamps), tz=dt_timezone.utc) if timestamps else None
+
+@require_GET
+@condition(etag_func=_availability_etag, last_modified_func=_availability_last_modified)
+def availability(request):
+    """Booked slots and free counts for the requested areas/sub-areas and window.
+
+    Clients should revalidate with If-None-Match; the ETag only changes when
+    a booking or slot in one of the areas changes, or the window moves.
+    """
+    scope = _availability_scope(request)
+    if scope is None:
+        return HttpResponseBadRequest("area and sub_area must be integer IDs.")
+    _, subareas, scoped = scope
+    start_time, end_time = _availability_window(request)
+    free_slot_ids = annotate_free_slots(subareas, start_time, end_time, scoped=scoped)
+    response = JsonResponse({
+        'start': start_time,
+        'end': end_time,
+        'free': {subarea['id']: subarea['free_count'] for subarea in subareas},
+        'booked': [
+            slot['id'] for subarea in subareas for slot in subarea['slots'] if slot['id'] not in free_slot_ids
+        ],
+    }, json_dumps_params={'separators': (',', ':')})
+    patch_cache_control(response, no_cache=True)
+    return response
+
+# -------------------------------
+# Availability event stream (Server-Sent Events)
+# -------------------------------
+async def _availability_events(area_ids):
+    subscription = broker.subscribe(area_ids)
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            try:
+                message = await subscription.get(EVENT_STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if subscription.overflowed:
+                # Fell behind and lost messages: the client refetches everything
+                subscription.overflowed = False
+                yield 'event: resync\ndata: {}\n\n'
+            yield f"event: slots\ndata: {json.dumps(message, separators=(',', ':'))}\n\n"
+    finally:
+        broker.unsubscribe(subscription)
+
+@require_GET
+async def availability_stream(request):
+    """Push slot state changes for ?area=/?sub_area= as they are committed.
+
+    Each ``slots`` event names the area and slots that changed; clients then
+    revalidate the availability endpoint. Needs an ASGI server: under WSGI
+    a stream would hold a worker thread, so it answers 204, which tells
+    EventSource to stop reconnecting and the page falls back to polling.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    scope = await sync_to_async(_availability_scope)(request)
+    if scope is None:
+        return HttpResponseBadRequest("area and sub_area must be integer IDs.")
+    area_ids, _, scoped = scope
+    response = StreamingHttpResponse(
+        _availability_events(area_ids if scoped else None), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+    return response
+
 # -------------------------------
 # Contact view
 # -------------------------------
@@ -380,57 +738,36 @@ def feedback(request):
 @staff_member_required
 def feedback_dashboard(request):
     period = request.GET.get('period', 'all')
-    feedback_queryset = Feedback.objects.all()
-    now = timezone.now()
-    if period == 'week':
-        start_date = now - timedelta(days=7)
-        feedback_queryset = feedback_queryset.filter(submitted_on__gte=start_date)
-    elif period == 'month':
-        start_date = now - timedelta(days=30)
-        feedback_queryset = feedback_queryset.filter(submitted_on__gte=start_date)
-    elif period == 'year':
-        start_date = now - timedelta(days=365)
-        feedback_queryset = feedback_queryset.filter(submitted_on__gte=start_date)
-    
-    total_feedback = feedback_queryset.count()
-    avg_rating = feedback_queryset.aggregate(Avg('rating'))['rating__avg'] or 0
-    goal_achievement = feedback_queryset.values('goal_achievement').annotate(
-        count=Count('id')).order_by('-count')
-    reason_breakdown = feedback_queryset.values('reason').annotate(
-        count=Count('id')).order_by('-count')
-    issue_breakdown = feedback_queryset.values('issue').annotate(
-        count=Count('id')).order_by('-count')
-    
-    goal_data = []
-    for item in goal_achievement:
-        if item['goal_achievement']:
-            goal_data.append({
-                'label': item['goal_achievement'],
-                'value': item['count']
-            })
-    
-    reason_data = []
-    for item in reason_breakdown:
-        if item['reason']:
-            reason_data.append({
-                'label': item['reason'],
-                'value': item['count']
-            })
-    
-    issue_data = []
-    for item in issue_breakdown:
-        if item['issue']:
-            issue_data.append({
-                'label': item['issue'],
-                'value': item['count']
-            })
-    
-    recent_feedback = feedback_queryset.order_by('-submitted_on')[:10]
-    
+    # Served from the daily rollups (parking.rollups) plus a live count of
+    # the rows not rolled up yet
+    period_days = {'week': 7, 'month': 30, 'year': 365}
+    since_day = rollup_days(period_days[period]) if period in period_days else None
+    summary = feedback_summary(since_day)
+
+    ratings = summary['rating']
+    total_feedback = sum(ratings.values())
+    avg_rating = sum(int(rating) * n for rating, n in ratings.items()) / total_feedback if total_feedback else 0
+
+    def breakdown(dimension):
+        # Most common first, unanswered left out
+        return [{'label': label, 'value': n} for label, n in summary[dimension].most_common() if label]
+
+    goal_data = breakdown('goal_achievement')
+    reason_data = breakdown('reason')
+    issue_data = breakdown('issue')
+
+    recent_feedback = Feedback.objects.select_related('user').order_by('-submitted_on')
+    if since_day is not None:
+        recent_feedback = recent_feedback.filter(submitted_on__gte=start_of_day(since_day))
+    recent_feedback = recent_feedback[:10]
+
     context = {
         'total_feedback': total_feedback,
         'avg_rating': round(avg_rating, 1),
         'period': period,
+        'goal_data': goal_data,
+        'reason_data': reason_data,
+        'issue_data': issue_data,
         'goal_data_json': json.dumps(goal_data),
         'reason_data_json': json.dumps(reason_data),
         'issue_data_json': json.dumps(issue_data),
@@ -439,13 +776,71 @@ def feedback_dashboard(request):
     
     return render(request, 'admin/feedback_dashboard.html', context)
 
+# -------------------------------
+# Booking Reports
+# -------------------------------
+BOOKING_REPORT_PERIODS = (1, 7, 30, 90)
+
+def with_bar_widths(rows, *fields):
+    # Percentage of the largest value per field, for the CSS bar charts
+    for field in fields:
+        peak = max((row[field] or 0 for row in rows), default=0)
+        for row in rows:
+            row[f'{field}_pct'] = round(100 * (row[field] or 0) / peak) if peak else 0
+    return rows
+
+@staff_member_required
+def booking_report(request):
+    try:
+        days = int(request.GET.get('days', 7))
+    except ValueError:
+        days = 7
+    if days not in BOOKING_REPORT_PERIODS:
+        days = 7
+    areas = list(Area.objects.order_by('name').values('id', 'name'))
+    area_id = request.GET.get('area')
+    area_id = int(area_id) if area_id and area_id.isdigit() else None
+
+    # Read from the hourly rollups (parking.rollups), never from Booking
+    since = start_of_day(rollup_days(days))
+    summary = booking_summary(since, area_id)
+    for key in ('daily', 'by_hour'):
+        with_bar_widths(summary[key], 'occupied_hours', 'bookings', 'revenue')
+
+    context = {
+        'days': days,
+        'periods': BOOKING_REPORT_PERIODS,
+        'areas': areas,
+        'area_id': area_id,
+        'rolled_up_to': get_watermark(BOOKING_WATERMARK),
+        'daily': summary['daily'],
+        'by_hour': summary['by_hour'],
+        'by_area': summary['by_area'],
+        'by_type': summary['by_type'],
+    }
+    return render(request, 'admin/booking_report.html', context)
+
+# -------------------------------
+# Metrics (Prometheus)
+# -------------------------------
+@require_GET
+def metrics(request):
+    """Request and booking metrics for staff or a scraper with PARKING_METRICS_TOKEN."""
+    token = getattr(settings, 'PARKING_METRICS_TOKEN', None)
+    authorization = request.headers.get('Authorization', '')
+    if not (token and hmac.compare_digest(authorization, f'Bearer {token}')) and not request.user.is_staff:
+        return HttpResponseForbidden()
+    response = HttpResponse(instrumentation.render(), content_type=instrumentation.CONTENT_TYPE)
+    patch_cache_control(response, no_store=True)
+    return response
+
 # -------------------------------
 # User Profile View
 # -------------------------------
 @login_required
 def profile(request):
     user = request.user
-    user_bookings = Booking.objects.filter(user=user).order_by('-start_time')
+    user_bookings = booking_history_page(request, Booking.objects.filter(user=user).for_listing())
 
     context = {
         'user': user,
@@ -456,17 +851,14 @@ def profile(request):
 # -------------------------------
 # Utilities
 # -------------------------------
-@login_required
 def expire_bookings():
-    expired_bookings = Booking.objects.filter(status='reserved', expiry_time__lt=timezone.now())
-    for booking in expired_bookings:
-        booking.status = 'completed'
-        booking.save()
-    return True
+    return expire_stale_reservations()
 
 @login_required
 def clear_all_bookings(request):
-    Booking.objects.all().delete()
+    with occupancy.suspended():
+        Booking.objects.all().delete()
     ParkingSlot.objects.update(is_available=True)
+    occupancy.recount()
     messages.success(request, "All bookings have been cleared and all slots are now available.")
     return redirect('parking:dashboard')
\ No newline at end of file